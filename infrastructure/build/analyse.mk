@@ -7,13 +7,25 @@
 # Scan all Fortran source files in the current directory and build up
 # dependency information.
 #
-# This is done as a stand alone make file as it appears the Python bindings
-# to SQLite screw up the latter's multi-thread support. Thus this make file
-# needs to operate in a single thread regime. We don't want to impose that
-# restriction on the rest of the build system.
+# The dependency database may be shared by several processes at once so this
+# make file may be run in parallel like any other.
+#
+# Parallelism is mostly found within the analyser which scans source in a
+# pool of worker processes while writing to the database from only one.
 #
 # The following variables may be specified to modify behaviour:
 #
+# ANALYSIS_CACHE: Directory in which to keep the analysis of source files for
+#                 reuse. It may be shared by applications built from the same
+#                 source. Not used if unset.
+# ANALYSIS_JOBS: Number of processes used to scan source. Zero, the default,
+#                means one per available processor.
+# ANALYSIS_METRICS: File to which the analyser writes timings and counts as
+#                   JSON. Not written if unset.
+# BUILTIN_PREPROCESSOR: If set, source is preprocessed in-process for analysis
+#                       where possible rather than by running $(FPP).
+# PREPROCESS_CACHE: Directory in which to keep preprocessed source for reuse.
+#                   Not used if unset.
 # PRE_PROCESS_INCLUDE_DIRS: Space separated list of directories to search for
 #                           inclusions.
 # PRE_PROCESS_MACROS: Space separated list of macro definitions in the form
@@ -21,42 +33,53 @@
 #
 ##############################################################################
 
-.NOTPARALLEL:
-
 DATABASE ?= dependencies.db
+ANALYSIS_JOBS ?= 0
 
 SOURCE_FILES := $(subst ./,,$(shell find . -name '*.[Ff]90' -print))
-TOUCH_FILES = $(subst .F90,.t,$(subst .f90,.t,$(SOURCE_FILES)))
 
-programs.mk: dependencies.mk
+programs.mk: dependencies.stamp
 	$(call MESSAGE,Collating,$@)
 	$(Q)$(LFRIC_BUILD)/tools/ProgramObjects $(VERBOSE_ARG) \
                                                 -database $(DATABASE) \
 	                                        -objectdir . $@
 
-dependencies.mk: $(TOUCH_FILES)
-	$(call MESSAGE,Building,$@)
-	$(Q)$(LFRIC_BUILD)/tools/DependencyRules $(VERBOSE_ARG) \
-                                                 -database $(DATABASE) \
-	                                         -objectdir . \
-	                                         -moduledir . \
-	                                         $(DEPRULE_FLAGS) $@
-
 IGNORE_ARGUMENTS = $(addprefix -ignore ,$(IGNORE_DEPENDENCIES))
 INCLUDE_ARGUMENTS = $(addprefix -include , $(PRE_PROCESS_INCLUDE_DIRS))
 MACRO_ARGUMENTS = $(addprefix -macro , $(PRE_PROCESS_MACROS))
+PREPROCESS_ARGUMENTS = $(if $(PREPROCESS_CACHE),-preprocesscache $(PREPROCESS_CACHE))
+PREPROCESS_ARGUMENTS += $(if $(BUILTIN_PREPROCESSOR),-builtinpreprocessor)
+PREPROCESS_ARGUMENTS += $(if $(ANALYSIS_CACHE),-analysiscache $(ANALYSIS_CACHE))
+METRICS_ARGUMENTS = $(if $(ANALYSIS_METRICS),-metrics $(ANALYSIS_METRICS))
 
-%.t: %.f90
-	$(call MESSAGE,Analysing,$<)
-	$(Q)$(LFRIC_BUILD)/tools/DependencyAnalyser \
-	    $(IGNORE_ARGUMENTS) $(VERBOSE_ARG) $(DATABASE) $<
-	$(Q)touch $@
+# All changed source files are analysed by a single invocation of the
+# analyser. It skips any file whose ".t" stamp file is up to date and touches
+# the stamp files of those it analyses. The files are passed in a list, there
+# being too many for a command line on a clean build.
+#
+# The rules file is only rewritten if its content changes so that make does
+# not reconsider everything which includes it. A separate stamp records when
+# analysis last happened. Should the rules file go missing the stamp is no
+# longer valid.
+#
+ifeq ($(wildcard dependencies.mk),)
+$(shell rm -f dependencies.stamp)
+endif
 
-%.t: %.F90
-	$(call MESSAGE,Analysing,$<)
-	$(Q)$(LFRIC_BUILD)/tools/DependencyAnalyser \
+dependencies.stamp: $(SOURCE_FILES)
+	$(call MESSAGE,Analysing,"$(words $?) source files")
+	$(file >dependencies.list)
+	$(foreach source,$?,$(file >>dependencies.list,$(source)))
+	$(Q)$(LFRIC_BUILD)/tools/DependencyAnalyser -stamp -jobs $(ANALYSIS_JOBS) \
 	    $(IGNORE_ARGUMENTS) $(INCLUDE_ARGUMENTS) $(MACRO_ARGUMENTS) \
-	    $(VERBOSE_ARG) $(DATABASE) $<
+	    $(PREPROCESS_ARGUMENTS) $(METRICS_ARGUMENTS) $(VERBOSE_ARG) \
+	    -filelist dependencies.list $(DATABASE)
+	$(call MESSAGE,Building,dependencies.mk)
+	$(Q)$(LFRIC_BUILD)/tools/DependencyRules $(VERBOSE_ARG) \
+                                                 -database $(DATABASE) \
+	                                         -objectdir . \
+	                                         -moduledir . \
+	                                         $(DEPRULE_FLAGS) dependencies.mk
 	$(Q)touch $@
 
 include $(LFRIC_BUILD)/lfric.mk
@@ -163,6 +163,31 @@ $(LIB_DIR)/lib%.a: $$($$(shell basename $$* | tr a-z A-Z)_OBJS) | $(LIB_DIR)
 	$(call MESSAGE,Compiled,$<)
 
 
+#############################################################################
+# Ninja
+#
+# Alternatively a Ninja build file may be generated and used to compile and
+# link the programs. Settings are worked out once, as it is written, rather
+# than every time make is run. The file is only rewritten if it changes.
+#
+.PHONY: build.ninja
+build.ninja: FFLAGS_BASE = $(FFLAGS) $(foreach group, $(FFLAG_GROUPS), $(FFLAGS_$(group)))
+build.ninja: LDFLAGS_BASE = $(foreach group, $(LDFLAGS_GROUPS), $(LDFLAGS_$(group)))
+build.ninja:
+	$(call MESSAGE,Generating,$@)
+	$(Q)$(LFRIC_BUILD)/tools/NinjaBuild $(VERBOSE_ARG) \
+	    -database dependencies.db -objectdir . -moduledir $(MOD_DIR) \
+	    -bindir $(BIN_DIR) \
+	    -variable "fc=$(FC)" \
+	    -variable "fflags=$(FFLAGS_BASE) $(FFLAGS_EXTRA)" \
+	    -variable "module_args=$(MODULE_DESTINATION_ARGUMENT) $(MODULE_SOURCE_ARGUMENT)" \
+	    -variable "include_args=$(INCLUDE_ARGS)" \
+	    -variable "macro_args=$(MACRO_ARGS)" \
+	    -variable "linker=$(LINKER)" \
+	    -variable "ldflags=$(LDFLAGS) $(LDFLAGS_BASE) $(LDFLAGS_COMPILER)" \
+	    -variable "libraries=$(patsubst %,-l%,$(EXTERNAL_STATIC_LIBRARIES) $(EXTERNAL_DYNAMIC_LIBRARIES))" \
+	    $@
+
 #############################################################################
 # Directories
 
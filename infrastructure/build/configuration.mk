@@ -32,32 +32,44 @@ endif
 	# application test suite fails without it.
 	$(Q)sleep 20
 
-.INTERMEDIATE: $(CONFIG_DIR)/build_config_loaders
-$(CONFIG_DIR)/build_config_loaders: $(CONFIG_DIR)/rose-meta.json
-	$(call MESSAGE,Generating namelist loading modules.)
-	$(Q)$(LFRIC_BUILD)/tools/GenerateNamelist $(VERBOSE_ARG) \
-                           $(CONFIG_DIR)/rose-meta.json          \
-                           -directory $(CONFIG_DIR)
-	$(Q)touch $(CONFIG_DIR)/build_config_loaders
-
+# All the configuration source is generated by a single run of the generator
+# so the metadata is only read once.
+#
 # This recipe requires config_namelists.txt, although adding it to the dependencies
 # causes a race condition when calling Make in parallel. The generation
 # of config_namelists.txt is done at the same time as rose-meta.json, so the
 # presense of config_namelists.txt is implied as true if rose-meta.json is present
-.PRECIOUS: $(WORKING_DIR)/configuration_mod.f90 $(CONFIG_DIR)/%_config_mod.f90
-$(WORKING_DIR)/configuration_mod.f90: $(CONFIG_DIR)/build_config_loaders
-	$(call MESSAGE,Generating configuration loader module,$(notdir $@))
-	$(Q)mkdir -p $(dir $@)
-	$(Q)$(LFRIC_BUILD)/tools/GenerateLoader $(VERBOSE_ARG) $@ $(shell cat $(CONFIG_DIR)/config_namelists.txt)
+CONFIG_STAMP = $(CONFIG_DIR)/configuration.stamp
+CONFIG_OUTPUTS = $(WORKING_DIR)/configuration_mod.f90 \
+                 $(WORKING_DIR)/feign_config_mod.f90
 
+$(CONFIG_STAMP): $(CONFIG_DIR)/rose-meta.json
+	$(call MESSAGE,Generating configuration modules.)
+	$(Q)mkdir -p $(WORKING_DIR)
+	$(Q)$(LFRIC_BUILD)/tools/GenerateConfiguration $(VERBOSE_ARG)       \
+	               $(if $(TEMPLATE_CACHE),-templatecache $(TEMPLATE_CACHE)) \
+	               $(if $(PACK_CONFIGURATION),-packed)                 \
+	               -directory $(CONFIG_DIR)                            \
+	               -loader $(WORKING_DIR)/configuration_mod.f90        \
+	               -namelists $(CONFIG_DIR)/config_namelists.txt       \
+	               -feigns $(WORKING_DIR)/feign_config_mod.f90         \
+	               -record $@                                          \
+	               $(CONFIG_DIR)/rose-meta.json
 
-.PRECIOUS: $(WORKING_DIR)/feign_config_mod.f90
-$(WORKING_DIR)/feign_config_mod.f90: $(CONFIG_DIR)/rose-meta.json
-	$(call MESSAGE,Generating namelist feigning module.)
-	$(Q)mkdir -p $(dir $@)
-	$(Q)$(LFRIC_BUILD)/tools/GenerateFeigns        \
-                           $(CONFIG_DIR)/rose-meta.json \
-                           -output $@
-
+# Modules whose content is unchanged are not rewritten so the stamp, rather
+# than the modules, records when they were last generated. It lists them all,
+# including a module for each namelist.
+#
+.PRECIOUS: $(CONFIG_OUTPUTS) $(CONFIG_DIR)/%_config_mod.f90
+$(CONFIG_OUTPUTS): $(CONFIG_STAMP) ;
 
 include $(LFRIC_BUILD)/lfric.mk
+
+# A module which has gone missing is only generated again if the stamp is
+# out of date so, in that case, make sure it is.
+#
+CONFIG_MODULES := $(sort $(CONFIG_OUTPUTS) \
+                  $(if $(wildcard $(CONFIG_STAMP)),$(file <$(CONFIG_STAMP))))
+ifneq ($(words $(wildcard $(CONFIG_MODULES))),$(words $(CONFIG_MODULES)))
+  $(shell rm -f $(CONFIG_STAMP))
+endif
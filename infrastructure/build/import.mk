@@ -17,46 +17,51 @@ ifdef USE_VERNIER
   $(info Linking Vernier)
 endif
 
-TEMPLATE_TOOL = $(LFRIC_BUILD)/tools/Templaterator
-TYPE_TABLE_real32 = real
-TYPE_TABLE_real64 = real
-TYPE_TABLE_int32 = integer
+# Type instantiations of the infrastructure templates are listed in the
+# manifest alone. The files they produce are found by asking the templating
+# tool.
+#
+# TEMPLATE_JOBS: Number of processes to instantiate templates with. Zero
+#                means one per available processor. Defaults to ANALYSIS_JOBS
+#                if that is set.
+#
+TEMPLATE_JOBS ?= $(or $(ANALYSIS_JOBS),0)
+TEMPLATE_TOOL = $(LFRIC_BUILD)/tools/Templaterator \
+                $(if $(TEMPLATE_CACHE),-c $(TEMPLATE_CACHE))
+TEMPLATE_MANIFEST = $(LFRIC_BUILD)/templates.manifest
+TEMPLATE_SOURCES := $(shell find $(LFRIC_INFRASTRUCTURE)/source -name '*.t90')
+TEMPLATED_SOURCES := $(shell WORKING_DIR=$(WORKING_DIR) \
+                             LFRIC_INFRASTRUCTURE=$(LFRIC_INFRASTRUCTURE) \
+                             $(LFRIC_BUILD)/tools/Templaterator \
+                             -m $(TEMPLATE_MANIFEST) --list)
+TEMPLATED_DIRECTORIES = $(patsubst %/,%,$(sort $(dir $(TEMPLATED_SOURCES))))
 
 .PHONY: import-infrastructure
-import-infrastructure: $(WORKING_DIR)/field/field_real32_mod.f90 \
-                       $(WORKING_DIR)/field/field_real64_mod.f90 \
-                       $(WORKING_DIR)/field/field_int32_mod.f90 \
-                       $(WORKING_DIR)/operator/operator_real32_mod.f90 \
-                       $(WORKING_DIR)/operator/operator_real64_mod.f90 \
-                       $(WORKING_DIR)/scalar/scalar_real32_mod.f90 \
-                       $(WORKING_DIR)/scalar/scalar_real64_mod.f90 \
-                       $(WORKING_DIR)/scalar/scalar_int32_mod.f90
+import-infrastructure: $(TEMPLATED_SOURCES)
 	$Q$(MAKE) $(QUIET_ARG) -f $(LFRIC_BUILD)/extract.mk \
 	          SOURCE_DIR=$(LFRIC_INFRASTRUCTURE)/source
 	$Q$(MAKE) $(QUIET_ARG) -f $(LFRIC_BUILD)/psyclone/psyclone_psykal.mk \
 	          SOURCE_DIR=$(LFRIC_INFRASTRUCTURE)/source \
 	          OPTIMISATION_PATH=$(OPTIMISATION_PATH)
 
-$(WORKING_DIR)/field/field_%_mod.f90: $(LFRIC_INFRASTRUCTURE)/source/field/field_mod.t90 \
-                                      | $(WORKING_DIR)/field
-	$(call MESSAGE, Templating, $<)
-	$Q$(TEMPLATE_TOOL) $< -o $@ -s type=$(TYPE_TABLE_$*) -s kind=$*
-
-$(WORKING_DIR)/field:
-	$Qmkdir -p $@
-
-$(WORKING_DIR)/operator/operator_%_mod.f90: $(LFRIC_INFRASTRUCTURE)/source/operator/operator_mod.t90 \
-                                            | $(WORKING_DIR)/operator
-	$(call MESSAGE, Templating, $<)
-	$Q$(TEMPLATE_TOOL) $< -o $@ -s kind=$*
+# All type instantiations are made by a single run of the templating tool,
+# listed in the manifest. Only those whose content changes are rewritten so
+# the stamp, rather than the sources, records when it last ran.
+#
+# Should any of them go missing the stamp is discarded so that the tool runs
+# again.
+#
+ifneq ($(words $(wildcard $(TEMPLATED_SOURCES))),$(words $(TEMPLATED_SOURCES)))
+  $(shell rm -f $(WORKING_DIR)/templates.stamp)
+endif
 
-$(WORKING_DIR)/operator:
-	$Qmkdir -p $@
+$(TEMPLATED_SOURCES): $(WORKING_DIR)/templates.stamp ;
 
-$(WORKING_DIR)/scalar/scalar_%_mod.f90: $(LFRIC_INFRASTRUCTURE)/source/scalar/scalar_mod.t90 \
-                                      | $(WORKING_DIR)/scalar
-	$(call MESSAGE, Templating, $<)
-	$Q$(TEMPLATE_TOOL) $< -o $@ -s type=$(TYPE_TABLE_$*) -s kind=$*
+$(WORKING_DIR)/templates.stamp: $(TEMPLATE_MANIFEST) $(TEMPLATE_SOURCES) \
+                                | $(TEMPLATED_DIRECTORIES)
+	$(call MESSAGE, Templating, $(TEMPLATE_MANIFEST))
+	$Q$(TEMPLATE_TOOL) -m $< -j $(TEMPLATE_JOBS)
+	$Qtouch $@
 
-$(WORKING_DIR)/scalar:
+$(TEMPLATED_DIRECTORIES):
 	$Qmkdir -p $@
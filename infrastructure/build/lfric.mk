@@ -23,6 +23,12 @@
 #              placed. This should be somewhere with good "many small
 #              files" performance, i.e. probably not Lustre.
 #              Default: ./working
+# TEMPLATE_CACHE: Directory in which compiled Jinja templates are kept for
+#                 reuse by later generation of source.
+#                 Default: $(WORKING_DIR)/template_cache
+# PACK_CONFIGURATION: Set in order to have the configuration loader broadcast
+#                     the values of all namelists in a single packed buffer
+#                     rather than separately for each.
 # VERBOSE: Set in order to see actual commands issued by the build system.
 # PURGE_SUITES: Set to non-zero value to clean out exisiting rose suites of
 #               same name. (this is also the default action)
@@ -61,6 +67,7 @@ endif
 # Default variables...
 #
 export WORKING_DIR ?= working
+export TEMPLATE_CACHE ?= $(abspath $(WORKING_DIR))/template_cache
 export PWD ?= $(shell pwd)
 
 TEST_SUITE_TARGETS ?= meto-azspice meto-ex1a
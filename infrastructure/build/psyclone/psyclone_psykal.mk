@@ -81,7 +81,15 @@ $(WORKING_DIR)/%.x90 | $$(dir $$@)
 .PRECIOUS: $(WORKING_DIR)/%.x90
 # Perform preprocessing for big X90 files.
 #
-ifeq ("$(FORTRAN_COMPILER)", "nvfortran")
+# If PREPROCESS_CACHE names a directory, output previously generated from
+# identical source, inclusions and arguments is reused from there.
+#
+ifdef PREPROCESS_CACHE
+$(WORKING_DIR)/%.x90: $(SOURCE_DIR)/%.X90 | $$(dir $$@)
+	$(call MESSAGE,Preprocessing, $(subst $(SOURCE_DIR)/,,$<))
+	$Q$(LFRIC_BUILD)/tools/PreprocessFortran -cache $(PREPROCESS_CACHE) \
+	    $< $@ -- $(FPP) $(FPPFLAGS) $(MACRO_ARGS)
+else ifeq ("$(FORTRAN_COMPILER)", "nvfortran")
 $(WORKING_DIR)/%.x90: $(SOURCE_DIR)/%.X90 | $$(dir $$@)
 	$(call MESSAGE,Preprocessing, $(subst $(SOURCE_DIR)/,,$<))
 	$Q$(FPP) $(FPPFLAGS) $(MACRO_ARGS) -o $@ $<
@@ -9,22 +9,26 @@
 # SUBSTITUTIONS Name and list of values.
 # TEMPLATES     Template file relative to source root.
 # WORKING_DIR   Directory to take generated files.
+# TEMPLATE_CACHE Directory in which compiled templates are kept. Not used if
+#               unset.
 #
 ###############################################################################
 TOOL = $(LFRIC_BUILD)/tools/Templaterator
 
 FORTRAN_FILES = $(subst .t90,.f90,$(subst .T90,.F90, $(TEMPLATES)))
 
+CACHE_ARGS = $(if $(TEMPLATE_CACHE),-c $(TEMPLATE_CACHE))
+
 SARGS = $(foreach key, $(SUBSTITUTIONS), $(foreach value, $(wordlist 2, 10, $(subst :, ,$(key))), -s $(firstword $(subst :, ,$(key)))=$(value)))
 
 generate-from-template: $(addprefix $(WORKING_DIR)/, $(FORTRAN_FILES))
 
 $(WORKING_DIR)/%.f90: $(SOURCE_DIR)/%.t90
 	$(call MESSAGE, Templating, $<)
-	$Q$(TOOL) $< -o $@ $(SARGS)
+	$Q$(TOOL) $< -o $@ $(CACHE_ARGS) $(SARGS)
 
 $(WORKING_DIR)/%.F90: $(SOURCE_DIR)/%.T90
 	$(call MESSAGE, Templating, $<)
-	$Q$(TOOL) $< -o $@ $(SARGS)
+	$Q$(TOOL) $< -o $@ $(CACHE_ARGS) $(SARGS)
 
 #include $(LFRIC_BUILD)/lfric.mk
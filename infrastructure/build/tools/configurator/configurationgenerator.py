@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Generates all the configuration source for an application in one go.
+"""
+
+import logging
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from configurator.configurationloader import ConfigurationLoader
+from configurator.namelistdescription import NamelistConfigDescription
+from configurator.namelistfeigner import NamelistFeigner
+
+
+def generate_configuration(
+    meta_filename: Path,
+    directory: Path,
+    loader_file: Optional[Path] = None,
+    loader_namelists: Sequence[str] = (),
+    feign_file: Optional[Path] = None,
+    packed: bool = False,
+    record: Optional[Path] = None,
+) -> List[Path]:
+    """
+    Writes a namelist module for each namelist described, along with the
+    loader and feigning modules if requested.
+
+    The metadata is only read once and all the modules are rendered with the
+    same template engine.
+
+    :param meta_filename: Configuration metadata in JSON form.
+    :param directory: Namelist modules are put here.
+    :param loader_file: Configuration loader module to write, if any.
+    :param loader_namelists: Namelists the loader reads.
+    :param feign_file: Feigning module to write, if any.
+    :param packed: Namelist values are broadcast in a single packed buffer.
+    :param record: File in which to list every module generated, whether
+                   written or not. It is always written.
+    :return: Files written. Those whose content is unchanged are not.
+    """
+    logger = logging.getLogger(__name__)
+    descriptions = NamelistConfigDescription.process_config(meta_filename)
+
+    generated: List[Path] = []
+    written: List[Path] = []
+    directory.mkdir(parents=True, exist_ok=True)
+    for description in descriptions:
+        module_file = directory / (description.get_module_name() + ".f90")
+        generated.append(module_file)
+        if description.write_module(module_file, packed):
+            logger.info("Wrote %s", module_file)
+            written.append(module_file)
+
+    if loader_file is not None:
+        generated.append(loader_file)
+        loader = ConfigurationLoader(loader_file.stem)
+        for name in loader_namelists:
+            loader.add_namelist(name)
+        if loader.write_module(loader_file, packed):
+            logger.info("Wrote %s", loader_file)
+            written.append(loader_file)
+
+    if feign_file is not None:
+        generated.append(feign_file)
+        feigner = NamelistFeigner(feign_file.stem)
+        feigner.add_namelist(descriptions)
+        if feigner.write_module(feign_file):
+            logger.info("Wrote %s", feign_file)
+            written.append(feign_file)
+
+    if record is not None:
+        record.write_text("".join(f"{path}\n" for path in generated))
+
+    return written
@@ -11,7 +11,8 @@ Generates Fortran source for loading all the configuration namelists.
 from pathlib import Path
 from typing import List
 
-import jinja2
+from configurator.engine import get_engine
+from shared.output import write_if_changed
 
 
 ##############################################################################
@@ -21,9 +22,7 @@ class ConfigurationLoader:
     """
 
     def __init__(self, module_name: str):
-        self._engine = jinja2.Environment(
-            loader=jinja2.PackageLoader("configurator", "templates")
-        )
+        self._engine = get_engine()
         self._module_name = module_name
         self._namelists: List[str] = []
 
@@ -35,16 +34,23 @@ class ConfigurationLoader:
         """
         self._namelists.append(name)
 
-    def write_module(self, module_file: Path) -> None:
+    def write_module(self, module_file: Path, packed: bool = False) -> bool:
         """
-        Stamps out the Fortran source.
+        Stamps out the Fortran source. An existing file is left untouched if
+        its content would not change.
 
         :param module_file: Filename to use.
+        :param packed: Have the root process pack the values of every
+                       namelist into a single buffer which is broadcast in
+                       one go, rather than broadcasting each namelist. The
+                       namelist modules must also be generated packed.
+        :return: True if the file was written.
         """
         inserts = {
             "moduleName": self._module_name,
             "namelists": self._namelists,
+            "packed": packed,
         }
 
         template = self._engine.get_template("loader.f90.jinja")
-        module_file.write_text(template.render(inserts))
+        return write_if_changed(module_file, template.render(inserts))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Template engine shared by the generators.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+
+import jinja2
+
+from configurator import jinjamacros
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> jinja2.Environment:
+    """
+    Gets the template environment.
+
+    It is created on first use and then shared so that each template is only
+    loaded and compiled once however many modules are generated from it.
+    """
+    engine = jinja2.Environment(
+        loader=jinja2.PackageLoader("configurator", "templates"),
+        extensions=["jinja2.ext.do"],
+    )
+    engine.filters["decorate"] = jinjamacros.decorate_macro
+    return engine
+
+
+def use_bytecode_cache(directory: Path) -> None:
+    """
+    Keeps compiled templates on disk for reuse by later processes.
+
+    Templates are recompiled should they change. The cache may be shared by
+    many processes at once.
+
+    :param directory: Holds the cache, created if necessary.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    get_engine().bytecode_cache = jinja2.FileSystemBytecodeCache(
+        str(directory)
+    )
@@ -16,9 +16,8 @@ from pathlib import Path
 from typing import Dict, List, Optional, Sequence, Tuple
 from zlib import crc32
 
-import jinja2
-
-from configurator import jinjamacros
+from configurator.engine import get_engine
+from shared.output import write_if_changed
 
 
 ##############################################################################
@@ -382,11 +381,7 @@ class NamelistDescription:
         self._multiple_instances_allowed = multiple_instances_allowed
         self._instance_key_member = instance_key_member
 
-        self._engine = jinja2.Environment(
-            loader=jinja2.PackageLoader("configurator", "templates"),
-            extensions=["jinja2.ext.do"],
-        )
-        self._engine.filters["decorate"] = jinjamacros.decorate_macro
+        self._engine = get_engine()
 
         self._parameters: Dict[str, _Property] = collections.OrderedDict()
         self._module_usage = collections.defaultdict(set)
@@ -529,11 +524,16 @@ class NamelistDescription:
         """
         return list(self._parameters.values())
 
-    def write_module(self, file_object: Path) -> None:
+    def write_module(self, file_object: Path, packed: bool = False) -> bool:
         """
-        Generates Fortran module source and writes it to a file.
+        Generates Fortran module source and writes it to a file. An existing
+        file is left untouched if its content would not change.
 
         :param file_object: Filename to write to.
+        :param packed: Also generate procedures which pack the namelist's
+                       values into, and unpack them from, a buffer shared
+                       with the other namelists.
+        :return: True if the file was written.
         """
         if not self._parameters:
             message = (
@@ -586,12 +586,13 @@ class NamelistDescription:
             "lonekindindex": lone_kind_index,
             "lonekindtally": lone_kind_tally,
             "namelist": namelist,
+            "packed": packed,
             "parameters": self._parameters,
             "use_from": self._module_usage,
         }
 
         template = self._engine.get_template("namelist.f90.jinja")
-        file_object.write_text(template.render(inserts))
+        return write_if_changed(file_object, template.render(inserts))
 
     def _dereference_expression(
         self, expression: str
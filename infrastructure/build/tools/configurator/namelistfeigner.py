@@ -12,10 +12,9 @@ import collections
 from pathlib import Path
 from typing import Dict, List, Sequence
 
-import jinja2
-
-from configurator import jinjamacros
+from configurator.engine import get_engine
 from configurator.namelistdescription import NamelistDescription, _Property
+from shared.output import write_if_changed
 
 
 ##############################################################################
@@ -30,11 +29,7 @@ class NamelistFeigner:
         """
         self._module_name = module_name
 
-        self._engine = jinja2.Environment(
-            loader=jinja2.PackageLoader("configurator", "templates"),
-            extensions=["jinja2.ext.do"],
-        )
-        self._engine.filters["decorate"] = jinjamacros.decorate_macro
+        self._engine = get_engine()
 
         self._namelists: Dict[str, NamelistDescription] = (
             collections.OrderedDict()
@@ -49,11 +44,13 @@ class NamelistFeigner:
         for item in namelists:
             self._namelists[item.get_namelist_name()] = item
 
-    def write_module(self, module_file: Path) -> None:
+    def write_module(self, module_file: Path) -> bool:
         """
-        Writes Fortran source file containing feign functions.
+        Writes Fortran source file containing feign functions. An existing
+        file is left untouched if its content would not change.
 
         :param module_file: Filename to create.
+        :return: True if the file was written.
         """
         enumerations = collections.defaultdict(list)
         kinds = set(["i_def"])
@@ -90,4 +87,4 @@ class NamelistFeigner:
         }
 
         template = self._engine.get_template("feign_config.f90.jinja")
-        module_file.write_text(template.render(inserts))
+        return write_if_changed(module_file, template.render(inserts))
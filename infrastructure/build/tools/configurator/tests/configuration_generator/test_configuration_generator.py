@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+##############################################################################
+# (c) Crown copyright 2022 Met Office. All rights reserved.
+# The file LICENCE, distributed with this code, contains details of the terms
+# under which the code may be used.
+##############################################################################
+"""
+Unit tests for generating all configuration source at once.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import configurator.configurationloader as loader
+import configurator.namelistdescription as namelist
+import configurator.namelistfeigner as feigner
+from configurator.configurationgenerator import generate_configuration
+
+METADATA = {
+    "first": {
+        "members": {
+            "count": {"type": "integer"},
+            "ratio": {"type": "real", "kind": "double"},
+            "label": {"type": "character", "string_length": "filename"},
+        }
+    },
+    "second": {
+        "members": {
+            "colour": {
+                "enumeration": "true",
+                "values": "'second=red', 'second=green'",
+            },
+            "levels": {"type": "integer", "length": "3"},
+        }
+    },
+}
+
+
+class TestGenerator:
+    """
+    Tests the single pass generator.
+    """
+
+    def test_generate(self, tmp_path: Path):  # pylint: disable=no-self-use
+        """
+        Output matches that of the individual generators.
+        """
+        meta_file = tmp_path / "rose-meta.json"
+        meta_file.write_text(json.dumps(METADATA))
+
+        written = generate_configuration(
+            meta_file,
+            tmp_path / "config",
+            tmp_path / "configuration_mod.f90",
+            ["first", "second"],
+            tmp_path / "feign_config_mod.f90",
+        )
+        assert written == [
+            tmp_path / "config" / "first_config_mod.f90",
+            tmp_path / "config" / "second_config_mod.f90",
+            tmp_path / "configuration_mod.f90",
+            tmp_path / "feign_config_mod.f90",
+        ]
+
+        expected = tmp_path / "expected"
+        expected.mkdir()
+        descriptions = namelist.NamelistConfigDescription.process_config(
+            meta_file
+        )
+        for description in descriptions:
+            leafname = description.get_module_name() + ".f90"
+            description.write_module(expected / leafname)
+            assert (tmp_path / "config" / leafname).read_text() == (
+                expected / leafname
+            ).read_text()
+
+        expected_loader = loader.ConfigurationLoader("configuration_mod")
+        expected_loader.add_namelist("first")
+        expected_loader.add_namelist("second")
+        expected_loader.write_module(expected / "configuration_mod.f90")
+        assert (tmp_path / "configuration_mod.f90").read_text() == (
+            expected / "configuration_mod.f90"
+        ).read_text()
+
+        expected_feigner = feigner.NamelistFeigner("feign_config_mod")
+        expected_feigner.add_namelist(descriptions)
+        expected_feigner.write_module(expected / "feign_config_mod.f90")
+        assert (tmp_path / "feign_config_mod.f90").read_text() == (
+            expected / "feign_config_mod.f90"
+        ).read_text()
+
+    def test_optional(self, tmp_path: Path):  # pylint: disable=no-self-use
+        """
+        Loader and feigner are optional.
+        """
+        meta_file = tmp_path / "rose-meta.json"
+        meta_file.write_text(json.dumps(METADATA))
+
+        written = generate_configuration(meta_file, tmp_path)
+        assert [path.name for path in written] == [
+            "first_config_mod.f90",
+            "second_config_mod.f90",
+        ]
+
+    def test_packed(self, tmp_path: Path):  # pylint: disable=no-self-use
+        """
+        Namelist modules and loader are both generated packed.
+        """
+        meta_file = tmp_path / "rose-meta.json"
+        meta_file.write_text(json.dumps(METADATA))
+
+        generate_configuration(
+            meta_file,
+            tmp_path / "config",
+            tmp_path / "configuration_mod.f90",
+            ["first", "second"],
+            packed=True,
+        )
+        for listname in ("first", "second"):
+            module = tmp_path / "config" / f"{listname}_config_mod.f90"
+            assert f"subroutine pack_{listname}_namelist" in (
+                module.read_text()
+            )
+        loader_source = (tmp_path / "configuration_mod.f90").read_text()
+        assert "call buffer%broadcast( 0 )" in loader_source
+        assert "global_mpi%broadcast" not in loader_source
+
+    def test_unchanged(self, tmp_path: Path):  # pylint: disable=no-self-use
+        """
+        Only modules whose content changes are written again.
+        """
+        meta_file = tmp_path / "rose-meta.json"
+        meta_file.write_text(json.dumps(METADATA))
+        arguments = (
+            meta_file,
+            tmp_path / "config",
+            tmp_path / "configuration_mod.f90",
+            ["first", "second"],
+            tmp_path / "feign_config_mod.f90",
+        )
+        generate_configuration(*arguments)
+        for path in tmp_path.rglob("*.f90"):
+            os.utime(path, (0, 0))
+
+        assert not generate_configuration(*arguments)
+
+        changed = json.loads(json.dumps(METADATA))
+        changed["second"]["members"]["levels"]["length"] = "4"
+        meta_file.write_text(json.dumps(changed))
+        assert generate_configuration(*arguments) == [
+            tmp_path / "config" / "second_config_mod.f90"
+        ]
+        first = tmp_path / "config" / "first_config_mod.f90"
+        assert first.stat().st_mtime == 0
+
+    def test_record(self, tmp_path: Path):  # pylint: disable=no-self-use
+        """
+        Every module generated is recorded, even those not written.
+        """
+        meta_file = tmp_path / "rose-meta.json"
+        meta_file.write_text(json.dumps(METADATA))
+        record = tmp_path / "configuration.stamp"
+        arguments = (meta_file, tmp_path / "config",
+                     tmp_path / "configuration_mod.f90", ["first"])
+        generate_configuration(*arguments, record=record)
+        assert not generate_configuration(*arguments, record=record)
+        assert record.read_text().splitlines() == [
+            str(tmp_path / "config" / "first_config_mod.f90"),
+            str(tmp_path / "config" / "second_config_mod.f90"),
+            str(tmp_path / "configuration_mod.f90"),
+        ]
+
+    def test_shared_engine(self):  # pylint: disable=no-self-use
+        """
+        Generators share one template engine.
+        """
+        first = namelist.NamelistDescription("first")
+        second = namelist.NamelistDescription("second")
+        # pylint: disable=protected-access
+        assert first._engine is second._engine
+        assert loader.ConfigurationLoader("x")._engine is first._engine
+        assert feigner.NamelistFeigner("y")._engine is first._engine
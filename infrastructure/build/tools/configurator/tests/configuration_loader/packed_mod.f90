@@ -0,0 +1,290 @@
+!-----------------------------------------------------------------------------
+! (C) Crown copyright 2022 Met Office. All rights reserved.
+! The file LICENCE, distributed with this code, contains details of the terms
+! under which the code may be used.
+!-----------------------------------------------------------------------------
+! Handles the loading of namelists.
+!
+module packed_mod
+
+  use constants_mod, only : i_def, l_def, str_def, str_max_filename
+  use lfric_mpi_mod, only : global_mpi
+  use log_mod,       only : log_scratch_space, log_event, LOG_LEVEL_ERROR
+
+  use namelist_collection_mod, only: namelist_collection_type
+  use namelist_mod,            only: namelist_type
+  use namelist_buffer_mod,     only: byte_mold, namelist_buffer_type
+
+  use foo_config_mod, only : pack_foo_namelist, &
+                             unpack_foo_namelist, &
+                             postprocess_foo_namelist, &
+                             foo_is_loadable, &
+                             foo_is_loaded, &
+                             foo_reset_load_status, &
+                             foo_final, &
+                             get_foo_nml
+
+  implicit none
+
+  private
+  public :: read_configuration, ensure_configuration, final_configuration
+
+contains
+
+  ! Reads configuration namelists from a file.
+  !
+  ! [in] filename File holding the namelists.
+  !
+  ! TODO: Assumes namelist tags come at the start of lines.
+  ! TODO: Support "namelist file" namelists which recursively call this
+  !       procedure to load other namelist files.
+  !
+  subroutine read_configuration( filename, nml_bank )
+
+    use io_utility_mod, only : open_file, close_file
+
+    implicit none
+
+    character(*), intent(in) :: filename
+    type(namelist_collection_type), intent(inout) :: nml_bank
+
+    integer(i_def) :: local_rank
+
+    character(str_def), allocatable :: namelists(:)
+    integer(i_def) :: unit = -1
+
+    type(namelist_buffer_type) :: buffer
+
+    local_rank = global_mpi%get_comm_rank()
+
+    ! The root process reads every namelist in the file and packs their
+    ! values into a buffer. This is broadcast in one go and unpacked by all.
+    !
+    if (local_rank == 0) then
+      unit = open_file( filename )
+      call get_namelist_names( unit, namelists )
+      call pack_configuration_namelists( unit, namelists, filename, buffer )
+      call close_file( unit )
+    end if
+
+    call buffer%broadcast( 0 )
+
+    call unpack_configuration_namelists( buffer, filename, nml_bank )
+
+  end subroutine read_configuration
+
+  ! Finds names of all namelists present in file.
+  !
+  ! [in] unit File holding namelists.
+  ! [out] names of namelist in file (in order).
+  !
+  subroutine get_namelist_names( unit, names )
+
+    use io_utility_mod, only : read_line
+
+    implicit none
+
+    integer(i_def),     intent(in)                 :: unit
+    character(str_def), intent(inout), allocatable :: names(:)
+
+    character(str_def), allocatable :: names_temp(:)
+    ! TODO: Buffer is large enough for a fair sized string and a filename.
+    !       Ideally it should be dynamically sized for the length of the
+    !       incoming data but I'm not sure how best to achieve that at the
+    !       moment. #1752
+    character(str_def + str_max_filename) :: buffer
+    logical(l_def)     :: continue_read
+    ! Number of names
+    integer(i_def)  :: namecount
+
+    namecount = 0
+    allocate(names(namecount))
+    text_line_loop: do
+
+      continue_read = read_line( unit, buffer )
+      if ( .not. continue_read ) exit text_line_loop
+
+      ! TODO: Assumes namelist tags are at the start of lines. #1753
+      !
+      if (buffer(1:1) == '&') then
+        namecount = namecount + 1
+        allocate(names_temp(namecount))
+        names_temp(1:namecount-1) = names
+        names_temp(namecount) = trim(buffer(2:))
+        call move_alloc(names_temp, names)
+      end if
+    end do text_line_loop
+    rewind(unit)
+
+  end subroutine get_namelist_names
+
+  ! Checks that the requested namelists have been loaded.
+  !
+  ! [in]  names List of namelists.
+  ! [out] success_mask Marks corresponding namelists as having failed.
+  !
+  ! [return] Overall success.
+  !
+  function ensure_configuration( names, success_mask )
+
+    implicit none
+
+    character(*),             intent(in)  :: names(:)
+    logical(l_def), optional, intent(out) :: success_mask(:)
+    logical(l_def)                        :: ensure_configuration
+
+    integer(i_def)    :: i
+    logical           :: configuration_found = .True.
+
+    if (present(success_mask) &
+        .and. (size(success_mask, 1) /= size(names, 1))) then
+      call log_event( 'Arguments "names" and "success_mask" to function' &
+                      // '"ensure_configuration" are different shapes',  &
+                      LOG_LEVEL_ERROR )
+    end if
+
+    ensure_configuration = .True.
+
+    name_loop: do i = 1, size(names)
+      select case(trim( names(i) ))
+      case ('foo')
+        configuration_found = foo_is_loaded()
+      case default
+        write( log_scratch_space, '(A)' )               &
+            'Tried to ensure unrecognised namelist "'// &
+            trim(names(i))//'" was loaded.'
+        call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+      end select
+
+      ensure_configuration = ensure_configuration .and. configuration_found
+
+      if (present(success_mask)) success_mask(i) = configuration_found
+
+    end do name_loop
+
+  end function ensure_configuration
+
+  ! Reads the namelists from a file and packs their values into a buffer.
+  !
+  ! The names of the namelists are packed first, followed by the values of
+  ! each in turn.
+  !
+  ! [in]    unit      File holding the namelists.
+  ! [in]    namelists Names of the namelists in the file, in order.
+  ! [in]    filename  Name of the file, for reporting.
+  ! [inout] buffer    Receives the packed values.
+  !
+  subroutine pack_configuration_namelists( unit, namelists, filename, buffer )
+
+    implicit none
+
+    integer(i_def),             intent(in)    :: unit
+    character(str_def),         intent(in)    :: namelists(:)
+    character(*),               intent(in)    :: filename
+    type(namelist_buffer_type), intent(inout) :: buffer
+
+    integer(i_def) :: i
+
+    call buffer%append( transfer( size(namelists, kind=i_def), byte_mold ) )
+    call buffer%append( transfer( namelists, byte_mold ) )
+
+    do i=1, size(namelists)
+
+      select case (trim(namelists(i)))
+      case ('foo')
+        call pack_foo_namelist( unit, buffer )
+      case default
+        write( log_scratch_space, '(A)' )                   &
+            'Unrecognised namelist "'//trim(namelists(i))// &
+            '" found in file '//trim(filename)//'.'
+        call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+      end select
+
+    end do
+
+  end subroutine pack_configuration_namelists
+
+  ! Populates the configuration modules from values packed in a buffer.
+  !
+  ! [inout] buffer   Holds the packed values.
+  ! [in]    filename Name of the file they were read from, for reporting.
+  ! [inout] nml_bank Receives each namelist as it is loaded.
+  !
+  subroutine unpack_configuration_namelists( buffer, filename, nml_bank )
+
+    implicit none
+
+    type(namelist_buffer_type),     intent(inout) :: buffer
+    character(*),                   intent(in)    :: filename
+    type(namelist_collection_type), intent(inout) :: nml_bank
+
+    type(namelist_type) :: nml_obj
+
+    character(str_def), allocatable :: namelists(:)
+    integer(i_def) :: namecount
+    integer(i_def) :: start
+    integer(i_def) :: i, j
+
+    logical :: scan
+
+    namecount = transfer( buffer%take( storage_size(namecount) / 8 ), &
+                          namecount )
+    allocate( namelists(namecount) )
+    namelists = transfer( buffer%take( namecount * str_def ), namelists )
+    start = buffer%get_position()
+
+    ! Reset load status from any previous file reads
+    call foo_reset_load_status()
+
+    ! Unpack the namelists
+    do j=1, 2
+
+      select case(j)
+      case(1)
+        scan = .true.
+      case(2)
+        scan = .false.
+      end select
+
+      call buffer%set_position( start )
+
+      do i=1, size(namelists)
+
+        select case (trim(namelists(i)))
+        case ('foo')
+          if (foo_is_loadable()) then
+            call unpack_foo_namelist( buffer, scan )
+            if (.not. scan) then
+              call postprocess_foo_namelist()
+              nml_obj = get_foo_nml()
+              call nml_bank%add_namelist(nml_obj)
+            end if
+          else
+            write( log_scratch_space, '(A)' )      &
+                'Namelist "'//trim(namelists(i))// &
+                '" can not be read. Too many instances?'
+            call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+          end if
+        case default
+          write( log_scratch_space, '(A)' )                   &
+              'Unrecognised namelist "'//trim(namelists(i))// &
+              '" found in file '//trim(filename)//'.'
+          call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+        end select
+
+      end do ! Namelists
+
+    end do ! Unpacking passes
+
+  end subroutine unpack_configuration_namelists
+
+  subroutine final_configuration()
+
+    implicit none
+
+    call foo_final()
+
+    return
+  end subroutine final_configuration
+
+end module packed_mod
@@ -46,3 +46,17 @@ class TestLoader:
         assert output_file.read_text(
             encoding="ascii"
         ) + "\n" == expected_file.read_text(encoding="ascii")
+
+    def test_packed(self, tmp_path: Path):  # pylint: disable=no-self-use
+        """
+        Generating configuration loader which broadcasts a packed buffer.
+        """
+        uut = loader.ConfigurationLoader("packed_mod")
+        uut.add_namelist("foo")
+        output_file = tmp_path / "packed_mod.f90"
+        uut.write_module(output_file, packed=True)
+
+        expected_file = HERE / "packed_mod.f90"
+        assert output_file.read_text(
+            encoding="ascii"
+        ) + "\n" == expected_file.read_text(encoding="ascii")
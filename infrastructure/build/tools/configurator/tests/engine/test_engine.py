@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+##############################################################################
+# (c) Crown copyright 2022 Met Office. All rights reserved.
+# The file LICENCE, distributed with this code, contains details of the terms
+# under which the code may be used.
+##############################################################################
+"""
+Unit tests for the shared template engine.
+"""
+
+from pathlib import Path
+
+import jinja2
+
+import configurator.configurationloader as loader
+from configurator.engine import get_engine, use_bytecode_cache
+
+
+def _forget_templates(engine: jinja2.Environment) -> None:
+    """
+    Empties the engine's in-memory store of loaded templates, as a fresh
+    process would start.
+    """
+    assert engine.cache is not None
+    engine.cache.clear()
+
+
+class TestEngine:
+    """
+    Tests the shared template engine.
+    """
+
+    def test_bytecode_cache(self, tmp_path: Path, monkeypatch):
+        """
+        Compiled templates are kept for later processes.
+        """
+        engine = get_engine()
+        monkeypatch.setattr(engine, "bytecode_cache", None)
+        _forget_templates(engine)
+
+        use_bytecode_cache(tmp_path / "cache")
+        uut = loader.ConfigurationLoader("content_mod")
+        uut.add_namelist("foo")
+        uut.write_module(tmp_path / "first_mod.f90")
+        assert list((tmp_path / "cache").iterdir())
+
+        # A fresh process starts with no templates loaded.
+        #
+        _forget_templates(engine)
+
+        def no_compile(*args, **kwargs):
+            raise AssertionError("Template compiled again")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(jinja2.Environment, "compile", no_compile)
+            uut.write_module(tmp_path / "second_mod.f90")
+        assert (tmp_path / "second_mod.f90").read_text() == (
+            tmp_path / "first_mod.f90"
+        ).read_text()
+        _forget_templates(engine)
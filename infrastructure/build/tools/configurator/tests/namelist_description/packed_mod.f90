@@ -0,0 +1,561 @@
+!-----------------------------------------------------------------------------
+! (C) Crown copyright 2022 Met Office. All rights reserved.
+! The file LICENCE, distributed with this code, contains details of the terms
+! under which the code may be used.
+!-----------------------------------------------------------------------------
+!> Manages the packed namelist.
+!>
+module packed_config_mod
+
+  use constants_mod, only: i_def, &
+                           l_def, &
+                           r_def, &
+                           str_def
+  use lfric_mpi_mod, only: global_mpi
+  use log_mod,       only: log_event, log_scratch_space &
+                         , LOG_LEVEL_ERROR, LOG_LEVEL_DEBUG, LOG_LEVEL_INFO
+
+  use namelist_mod,      only: namelist_type
+  use namelist_item_mod, only: namelist_item_type
+  use namelist_buffer_mod, only: byte_mold, namelist_buffer_type
+
+  use constants_mod, only: cmdi, emdi, imdi, rmdi, str_def, unset_key
+
+  implicit none
+
+  private
+  public :: colour_from_key, key_from_colour, &
+            read_packed_namelist, postprocess_packed_namelist, &
+            packed_is_loadable, packed_is_loaded, &
+            packed_reset_load_status, &
+            packed_multiples_allowed, packed_final, &
+            get_packed_nml, &
+            pack_packed_namelist, unpack_packed_namelist
+
+  integer(i_def), public, parameter :: colour_green = 1606653173
+  integer(i_def), public, parameter :: colour_red = 1253835251
+
+  integer(i_def), parameter, public :: max_array_size = 500
+
+  character(str_def), public, protected :: absolute(5) = cmdi
+  integer(i_def), public, protected :: colour = emdi
+  logical(l_def), public, protected :: flag = .false.
+  integer(i_def), public, protected, allocatable :: inlist(:)
+  integer(i_def), public, protected :: lsize = imdi
+  character(str_def), public, protected :: name = cmdi
+  real(r_def), public, protected, allocatable :: unknown(:)
+
+  character(*), parameter :: listname = 'packed'
+  character(str_def) :: profile_name = cmdi
+
+  logical, parameter :: multiples_allowed = .true.
+
+  logical :: nml_loaded = .false.
+
+  character(str_def), parameter :: colour_key(2) &
+          = [character(len=str_def) :: 'green', &
+                                       'red']
+
+  integer(i_def), parameter :: colour_value(2) &
+          = [1606653173_i_def, &
+             1253835251_i_def]
+
+contains
+
+  !> Gets the enumeration value from the key string.
+  !>
+  !> An error is reported if the key is not actually a key.
+  !>
+  !> @param[in] key Enumeration key.
+  !>
+  integer(i_def) function colour_from_key( key )
+
+    implicit none
+
+    character(*), intent(in) :: key
+
+    integer(i_def) :: key_index
+
+    if (key == unset_key) then
+      write( log_scratch_space, '(A)') &
+          'Missing key for colour enumeration in packed namelist.'
+      colour_from_key = emdi
+      call log_event( log_scratch_space, LOG_LEVEL_DEBUG )
+      return
+    end if
+
+    key_index = 1
+    do
+      if (trim(colour_key(key_index)) == trim(key)) then
+        colour_from_key = colour_value(key_index)
+        return
+      else
+        key_index = key_index + 1
+        if (key_index > ubound(colour_key, 1)) then
+          write( log_scratch_space, &
+              '("Key ''", A, "'' not recognised for packed colour")' ) &
+              trim(adjustl(key))
+          call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+        end if
+      end if
+    end do
+
+  end function colour_from_key
+
+  !> Gets the enumeration key corresponding to a particular value.
+  !>
+  !> An error is reported if the value is not within range.
+  !>
+  !> @param[in] value Enumeration value.
+  !>
+  character(str_def) function key_from_colour( value )
+
+    implicit none
+
+    integer(i_def), intent(in) :: value
+
+    integer(i_def) :: value_index
+
+    value_index = 1
+    do
+      if (colour_value(value_index) == emdi) then
+        key_from_colour = unset_key
+        return
+      else if (colour_value(value_index) == value) then
+        key_from_colour = colour_key(value_index)
+        return
+      else
+        value_index = value_index + 1
+        if (value_index > ubound(colour_key, 1)) then
+          write( log_scratch_space, &
+                 '("Value ", I0, " is not in packed colour")' ) value
+          call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+        end if
+      end if
+    end do
+
+  end function key_from_colour
+
+  !> Populates this module from a namelist file.
+  !>
+  !> An error is reported if the namelist could not be read.
+  !>
+  !> @param [in] file_unit Unit number of the file to read from.
+  !> @param [in] local_rank Rank of current process.
+  !> @param [in] scan .true. if reading namelist to acquire scalar
+  !>                  values which may possbly be required for
+  !>                  array sizing during postprocessing.
+  !>
+  subroutine read_packed_namelist( file_unit, local_rank, scan )
+
+    use constants_mod, only: i_def
+
+    implicit none
+
+    integer(i_def), intent(in) :: file_unit
+    integer(i_def), intent(in) :: local_rank
+    logical,        intent(in) :: scan
+
+    call read_namelist( file_unit, local_rank, scan, &
+                        colour )
+
+  end subroutine read_packed_namelist
+
+  ! Reads the namelist file.
+  !
+  subroutine read_namelist( file_unit, local_rank, scan, &
+                            dummy_colour )
+
+    implicit none
+
+    integer(i_def), intent(in) :: file_unit
+    integer(i_def), intent(in) :: local_rank
+    logical,        intent(in) :: scan
+    integer(i_def), intent(out) :: dummy_colour
+
+    character(str_def) :: buffer_character_str_def(1)
+    integer(i_def) :: buffer_integer_i_def(2)
+    integer(i_def) :: buffer_logical_l_def(1)
+
+    character(str_def) :: colour
+
+    namelist /packed/ absolute, &
+                      colour, &
+                      flag, &
+                      inlist, &
+                      lsize, &
+                      name, &
+                      unknown
+
+    integer(i_def) :: condition
+
+    if (allocated(inlist)) deallocate(inlist)
+    allocate( inlist(max_array_size), stat=condition )
+    if (condition /= 0) then
+      write( log_scratch_space, '(A)' ) &
+            'Unable to allocate temporary array for "inlist"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+    if (allocated(unknown)) deallocate(unknown)
+    allocate( unknown(max_array_size), stat=condition )
+    if (condition /= 0) then
+      write( log_scratch_space, '(A)' ) &
+            'Unable to allocate temporary array for "unknown"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+
+    absolute = cmdi
+    colour = unset_key
+    flag = .false.
+    inlist = imdi
+    lsize = imdi
+    name = cmdi
+    unknown = rmdi
+
+    if (local_rank == 0) then
+
+      read( file_unit, nml=packed, iostat=condition, iomsg=log_scratch_space )
+      if (condition /= 0) then
+        call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+      end if
+
+      dummy_colour = colour_from_key( colour )
+
+    end if
+
+    buffer_integer_i_def(2) = dummy_colour
+    buffer_logical_l_def(1) = merge( 1, 0, flag )
+    buffer_integer_i_def(1) = lsize
+    buffer_character_str_def(1) = name
+
+    call global_mpi%broadcast( buffer_character_str_def, 1*str_def, 0 )
+    call global_mpi%broadcast( buffer_integer_i_def, 2, 0 )
+    call global_mpi%broadcast( buffer_logical_l_def, 1, 0 )
+
+    dummy_colour = buffer_integer_i_def(2)
+    flag = buffer_logical_l_def(1) /= 0
+    lsize = buffer_integer_i_def(1)
+    name = buffer_character_str_def(1)
+
+    call global_mpi%broadcast( absolute, size(absolute, 1)*str_def, 0 )
+    call global_mpi%broadcast( inlist, size(inlist, 1), 0 )
+    call global_mpi%broadcast( unknown, size(unknown, 1), 0 )
+
+    profile_name = name
+
+    if (scan) then
+      nml_loaded = .false.
+    else
+      nml_loaded = .true.
+    end if
+
+  end subroutine read_namelist
+
+  !> Reads the namelist from a file and appends its values to a buffer.
+  !>
+  !> Only the process reading the file should call this. The values are
+  !> taken back out, in the same order, by unpack_packed_namelist.
+  !>
+  !> @param [in]    file_unit Unit number of the file to read from.
+  !> @param [inout] buffer    Holds the values of all namelists read.
+  !>
+  subroutine pack_packed_namelist( file_unit, buffer )
+
+    implicit none
+
+    integer(i_def),             intent(in)    :: file_unit
+    type(namelist_buffer_type), intent(inout) :: buffer
+
+    character(str_def) :: colour
+
+    namelist /packed/ absolute, &
+                      colour, &
+                      flag, &
+                      inlist, &
+                      lsize, &
+                      name, &
+                      unknown
+
+    integer(i_def) :: condition
+
+    if (allocated(inlist)) deallocate(inlist)
+    allocate( inlist(max_array_size), stat=condition )
+    if (condition /= 0) then
+      write( log_scratch_space, '(A)' ) &
+            'Unable to allocate temporary array for "inlist"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+    if (allocated(unknown)) deallocate(unknown)
+    allocate( unknown(max_array_size), stat=condition )
+    if (condition /= 0) then
+      write( log_scratch_space, '(A)' ) &
+            'Unable to allocate temporary array for "unknown"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+
+    absolute = cmdi
+    colour = unset_key
+    flag = .false.
+    inlist = imdi
+    lsize = imdi
+    name = cmdi
+    unknown = rmdi
+
+    read( file_unit, nml=packed, iostat=condition, iomsg=log_scratch_space )
+    if (condition /= 0) then
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+
+    call buffer%append( transfer( colour_from_key( colour ), byte_mold ) )
+    call buffer%append( transfer( flag, byte_mold ) )
+    call buffer%append( transfer( lsize, byte_mold ) )
+    call buffer%append( transfer( name, byte_mold ) )
+
+    call buffer%append( transfer( absolute, byte_mold ) )
+    call buffer%append( transfer( inlist, byte_mold ) )
+    call buffer%append( transfer( unknown, byte_mold ) )
+
+  end subroutine pack_packed_namelist
+
+  !> Populates this module from values packed in a buffer.
+  !>
+  !> @param [inout] buffer Holds the values of all namelists read,
+  !>                       positioned at those of this one.
+  !> @param [in]    scan   .true. if unpacking to acquire scalar
+  !>                       values which may possbly be required for
+  !>                       array sizing during postprocessing.
+  !>
+  subroutine unpack_packed_namelist( buffer, scan )
+
+    implicit none
+
+    type(namelist_buffer_type), intent(inout) :: buffer
+    logical,                    intent(in)    :: scan
+
+    integer(i_def) :: condition
+
+    if (allocated(inlist)) deallocate(inlist)
+    allocate( inlist(max_array_size), stat=condition )
+    if (condition /= 0) then
+      write( log_scratch_space, '(A)' ) &
+            'Unable to allocate temporary array for "inlist"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+    if (allocated(unknown)) deallocate(unknown)
+    allocate( unknown(max_array_size), stat=condition )
+    if (condition /= 0) then
+      write( log_scratch_space, '(A)' ) &
+            'Unable to allocate temporary array for "unknown"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+
+    colour = transfer( buffer%take( storage_size(colour) / 8 ), &
+                       colour )
+    flag = transfer( buffer%take( storage_size(flag) / 8 ), &
+                     flag )
+    lsize = transfer( buffer%take( storage_size(lsize) / 8 ), &
+                      lsize )
+    name = transfer( buffer%take( storage_size(name) / 8 ), &
+                     name )
+
+    absolute = transfer( buffer%take( size(absolute) &
+                                      * storage_size(absolute) / 8 ), &
+                         absolute )
+    inlist = transfer( buffer%take( size(inlist) &
+                                    * storage_size(inlist) / 8 ), &
+                       inlist )
+    unknown = transfer( buffer%take( size(unknown) &
+                                     * storage_size(unknown) / 8 ), &
+                        unknown )
+
+    profile_name = name
+
+    if (scan) then
+      nml_loaded = .false.
+    else
+      nml_loaded = .true.
+    end if
+
+  end subroutine unpack_packed_namelist
+
+
+  !> @brief Returns a <<namelist_type>> object populated with the
+  !>        current contents of this configuration module.
+  !> @return namelist_obj <<namelist_type>> with current namelist contents.
+  function get_packed_nml() result(namelist_obj)
+
+    implicit none
+
+    type(namelist_type)      :: namelist_obj
+    type(namelist_item_type) :: members(7)
+
+      call members(1)%initialise( &
+                  'absolute', absolute )
+
+      call members(2)%initialise( &
+                  'colour', colour )
+
+      call members(3)%initialise( &
+                  'flag', flag )
+
+      call members(4)%initialise( &
+                  'inlist', inlist )
+
+      call members(5)%initialise( &
+                  'lsize', lsize )
+
+      call members(6)%initialise( &
+                  'name', name )
+
+      call members(7)%initialise( &
+                  'unknown', unknown )
+
+    if (trim(profile_name) /= trim(cmdi) ) then
+      call namelist_obj%initialise( trim(listname), &
+                                    members, &
+                                    profile_name = profile_name )
+    else
+      call namelist_obj%initialise( trim(listname), &
+                                    members )
+    end if
+
+  end function get_packed_nml
+
+
+  !> Performs any processing to be done once all namelists are loaded
+  !>
+  subroutine postprocess_packed_namelist()
+
+    use constants_mod, only: i_def
+
+    implicit none
+
+    integer(i_def) :: condition
+    integer(i_def) :: array_size
+
+
+    integer(i_def), allocatable :: new_inlist(:)
+    real(r_def), allocatable :: new_unknown(:)
+    integer(i_def) :: index_unknown
+
+    ! Computed fields are resolved after everything has been loaded since they
+    ! can refer to fields in other namelists.
+    !
+    ! Arrays are re-sized to fit data.
+    !
+    condition  = 0
+    array_size = 0
+
+
+    array_size = lsize
+    if (array_size == imdi) then
+      write(log_scratch_space, '(A)') &
+          '"packed:inlist" not allocated, '// &
+          'deferred size "lsize" '//   &
+          'has not been specified.'
+      call log_event( log_scratch_space, LOG_LEVEL_DEBUG )
+      array_size = 0
+    end if
+    allocate( new_inlist(array_size), stat=condition )
+    if (condition /= 0) then
+      write(log_scratch_space, '(A)') 'Unable to allocate "inlist"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+    new_inlist(:array_size) = inlist(:array_size)
+    call move_alloc( new_inlist, inlist )
+    if (allocated(new_inlist)) deallocate( new_inlist)
+
+    do index_unknown=ubound(unknown, 1), 1, -1
+      if (unknown(index_unknown) /= rmdi) exit
+    end do
+    array_size = index_unknown
+    allocate( new_unknown(array_size), stat=condition )
+    if (condition /= 0) then
+      write(log_scratch_space, '(A)') 'Unable to allocate "unknown"'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+    new_unknown(:array_size) = unknown(:array_size)
+    call move_alloc( new_unknown, unknown )
+    if (allocated(new_unknown)) deallocate( new_unknown)
+
+
+  end subroutine postprocess_packed_namelist
+
+  !> Can this namelist be loaded?
+  !>
+  !> @return True if it is possible to load the namelist.
+  !>
+  function packed_is_loadable()
+
+    implicit none
+
+    logical :: packed_is_loadable
+
+    if ( multiples_allowed .or. .not. nml_loaded ) then
+      packed_is_loadable = .true.
+    else
+      packed_is_loadable = .false.
+    end if
+
+  end function packed_is_loadable
+
+  !> Has this namelist been loaded?
+  !>
+  !> @return True if the namelist has been loaded.
+  !>
+  function packed_is_loaded()
+
+    implicit none
+
+    logical :: packed_is_loaded
+
+    packed_is_loaded = nml_loaded
+
+  end function packed_is_loaded
+
+  !> Are multiple packed namelists allowed to be read?
+  !>
+  !> @return True If multiple packed namelists are
+  !>              permitted.
+  !>
+  function packed_multiples_allowed()
+
+    implicit none
+
+    logical :: packed_multiples_allowed
+
+    packed_multiples_allowed = multiples_allowed
+
+  end function packed_multiples_allowed
+
+  !> Resets the load status to allow
+  !> packed namelist to be read.
+  !>
+  subroutine packed_reset_load_status()
+
+    implicit none
+
+    nml_loaded = .false.
+
+  end subroutine packed_reset_load_status
+
+  !> Clear out any allocated memory
+  !>
+  subroutine packed_final()
+
+    implicit none
+
+    absolute = cmdi
+    colour = emdi
+    flag = .false.
+    lsize = imdi
+    name = cmdi
+
+    if ( allocated(inlist) ) deallocate(inlist)
+    if ( allocated(unknown) ) deallocate(unknown)
+
+    return
+  end subroutine packed_final
+
+
+end module packed_config_mod
@@ -200,6 +200,28 @@ class TestNamelistMeta:
             encoding="ascii"
         ) + "\n" == expected_file.read_text(encoding="ascii")
 
+    def test_module_write_packed(self, tmp_path: Path):
+        # pylint: disable=no-self-use
+        """
+        Writing procedures to pack and unpack values.
+        """
+        output_file = tmp_path / "packed_module.f90"
+
+        uut = description.NamelistDescription("packed", True, "name")
+        uut.add_string("name")
+        uut.add_value("lsize", "integer", "default")
+        uut.add_value("flag", "logical", "default")
+        uut.add_enumeration("colour", enumerators=["red", "green"])
+        uut.add_string("absolute", bounds="5")
+        uut.add_value("inlist", "integer", bounds="lsize")
+        uut.add_value("unknown", "real", bounds=":")
+        uut.write_module(output_file, packed=True)
+
+        expected_file = HERE / "packed_mod.f90"
+        assert output_file.read_text(
+            encoding="ascii"
+        ) + "\n" == expected_file.read_text(encoding="ascii")
+
 
 class TestNamelistConfigDescription:
     """
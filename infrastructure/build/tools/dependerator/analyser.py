@@ -18,17 +18,32 @@
 Examine Fortran source and build dependency information for use by "make".
 """
 
+import json
 import logging
 import os
 import os.path
 import re
-import subprocess
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 from pathlib import Path
 from time import time
-from typing import Dict, Generator, List, Optional, Tuple
+from typing import Any, Dict, Generator, List, Optional, Tuple, Union
 
+from dependerator.cache import AnalysisCache
 from dependerator.database import FortranDependencies
+from dependerator.fingerprint import (
+    SourceFingerprint,
+    canonical_include_paths,
+    canonical_macros,
+    find_inclusions,
+    hash_file,
+)
+from dependerator.metrics import get_metrics
+from dependerator.preprocess import (
+    BuiltinPreprocessor,
+    Preprocessor,
+    PreprocessorCache,
+)
 
 
 class Analyser(ABC):
@@ -46,28 +61,162 @@ class Analyser(ABC):
         pass
 
 
-class FortranAnalyser(Analyser):
-    ###########################################################################
-    # Constructor
-    #
-    # Arguments:
-    #   ignoreModules - Module names to ignore.
-    #   database      - Backing store to hold details.
-    #   preprocess_macros - Macro name is the key. Value may be None for
-    #                            empty macros.
-    #   preprocess_include_paths - Directories where inclusions will be saught.
-    #
+@dataclass
+class FortranAnalysis:
+    """
+    Dependency information harvested from a single Fortran source file.
+
+    This holds only plain data so it may be passed between processes.
+    """
+
+    source_filename: Path
+    units: List[Tuple[str, str]] = field(default_factory=list)
+    compile_dependencies: List[Tuple[str, str]] = field(default_factory=list)
+    link_dependencies: List[Tuple[str, str]] = field(default_factory=list)
+    fingerprint: Optional[SourceFingerprint] = None
+
+    def add_unit(self, name: str, unit_type: str) -> None:
+        """
+        Notes a program unit found in the file.
+
+        @param name: Program unit name.
+        @param unit_type: One of "program", "module", "submodule" or
+                          "procedure".
+        """
+        self.units.append((name, unit_type))
+
+    def add_compile_dependency(self, unit: str, prerequisite: str) -> None:
+        """
+        Notes that a unit needs another to be compiled first.
+        """
+        self.compile_dependencies.append((unit, prerequisite))
+
+    def add_link_dependency(self, unit: str, prerequisite: str) -> None:
+        """
+        Notes that a unit needs another to be linked with it.
+        """
+        self.link_dependencies.append((unit, prerequisite))
+
+
+# Code up to the first continuation marker, comment or string which is broken
+# by a continuation marker or the end of the line.
+#
+_CODE_PATTERN = re.compile(r"""(?:[^"'&!]+|"[^"&]*"|'[^'&]*')*""")
+
+
+def lines_of_code(source: str) -> Generator[Tuple[str, str, int], None, None]:
+    """
+    Reads lines from the file, concatenate at continuation markers and
+    split comments off.
+
+    Rather than stepping through each line a character at a time, the extent
+    of the code is found with a single pattern match which skips over
+    complete strings. Only where that match stops does the line need closer
+    inspection.
+
+    TODO: This is complex. That complexity comes from the need
+          to preserve comments. This is needed to support "depends on"
+          comments. Ergo, once "depends on" is gone we can ignore
+          comments and this becomes a lot simpler.
+
+    @param source: Fortran source code.
+    @return: Logical line of code, its comments and the number of the
+             physical line it ends on.
+    """
+    line_number = 0
+    code = ""
+    comment = ""
+    continuing = False
+    for line in source.splitlines():  # Loop over every line in the source
+        line_number += 1
+        length = len(line)
+        code_start = 0
+        code_end = length
+        comment_start = length
+        continuation = False
+
+        # Spaces and, on continuation lines, ampersands may precede code.
+        indent_end = length - len(line.lstrip(" &"))
+        if not continuing and "&" in line[:indent_end]:
+            message = (
+                "Found continuation marker at "
+                "start of line when there was none "
+                "ending previous line"
+            )
+            raise Exception(message)
+
+        if indent_end == length:  # Nothing but indent
+            pass
+        elif line[indent_end] == "!":  # Line contains only a comment
+            comment_start = indent_end
+            if indent_end < length - 1:
+                code_end = indent_end
+        else:  # Start of code located
+            # The first character of code is never taken to open a string.
+            code_start = indent_end
+            match = _CODE_PATTERN.match(line, indent_end + 1)
+            assert match is not None  # The pattern may match nothing
+            end = match.end()
+            if end < length:
+                character = line[end]
+                if character == "&":  # Line continues on next line
+                    code_end = end
+                    continuing = True
+                    continuation = True
+                elif character == "!":  # The remainder is a comment
+                    comment_start = end
+                    if end < length - 1:
+                        code_end = end
+                else:  # String which is not closed on this line
+                    ampersand = line.find("&", end + 1)
+                    if ampersand >= 0:  # Line continues on next line
+                        code_end = ampersand
+                        continuing = True
+                        continuation = True
+
+        line_code = line[code_start:code_end]
+        code += " " + line_code
+        comment += " " + line[comment_start:]
+
+        if not continuation and line_code.strip():
+            yield (code, comment, line_number)
+            code = ""
+            comment = ""
+            continuing = False
+
+
+class FortranScanner:
+    """
+    Harvests dependency information from Fortran source without reference to
+    a database.
+
+    Scanners hold no open resources so they may be sent to worker processes.
+    """
+
     def __init__(
         self,
         ignoreModules: List[str],
-        database: FortranDependencies,
         preprocess_macros: Optional[Dict[str, Optional[str]]] = None,
         preprocess_include_paths: Optional[List[Path]] = None,
+        preprocess_cache: Optional[PreprocessorCache] = None,
+        builtin_preprocessor: bool = False,
+        analysis_cache: Optional[AnalysisCache] = None,
     ):
+        """
+        @param ignoreModules: Module names to ignore.
+        @param preprocess_macros: Macro name is the key. Value may be None
+                                  for empty macros.
+        @param preprocess_include_paths: Directories where inclusions will be
+                                         saught.
+        @param preprocess_cache: Reuse preprocessed source from here.
+        @param builtin_preprocessor: Preprocess in-process where possible,
+                                     only running $FPP when necessary.
+        @param analysis_cache: Reuse analyses of identical source from here.
+        """
         self._ignoreModules = [str.lower(mod) for mod in ignoreModules]
-        self._database = database
         self.__preprocess_macros = preprocess_macros or {}
         self.__preprocess_include_paths = preprocess_include_paths or []
+        self.__analysis_cache = analysis_cache
 
         # The intrinsic Fortran modules
         self._ignoreModules.extend(
@@ -86,6 +235,24 @@ class FortranAnalyser(Analyser):
         if fpp is None:
             raise Exception("No Fortran preprocessor provided in $FPP")
         self._fpp = fpp.split()
+        self._preprocessor: Union[Preprocessor, BuiltinPreprocessor]
+        self._preprocessor = Preprocessor(
+            self._fpp,
+            self.__preprocess_include_paths,
+            self.__preprocess_macros,
+            preprocess_cache,
+        )
+        if builtin_preprocessor:
+            self._preprocessor = BuiltinPreprocessor(
+                self.__preprocess_include_paths,
+                self.__preprocess_macros,
+                self._preprocessor,
+            )
+
+        # The leading keyword of a statement, if it has one, determines
+        # which of the following patterns it could possibly match.
+        #
+        self._keywordPattern = re.compile(r"\s*(\w*)")
 
         # Patterns to recognise scoping units
         #
@@ -135,13 +302,76 @@ class FortranAnalyser(Analyser):
         )
 
     ###########################################################################
-    def analyse(self, source_filename: Path):
+    def fingerprint(
+        self, source_filename: Path, inputs: Optional[List[Path]] = None
+    ) -> SourceFingerprint:
+        """
+        Identifies everything which affects the scan of a source file.
+
+        @param source_filename: Fortran source file.
+        @param inputs: Other files read while scanning. If not specified
+                       they are found by following "#include" directives.
+        @return: Fingerprint of the file under the current settings.
+        """
+        if inputs is None:
+            inputs = self.inputs(source_filename)
+        return SourceFingerprint(
+            hash_file(source_filename),
+            canonical_macros(self.__preprocess_macros),
+            canonical_include_paths(self.__preprocess_include_paths),
+            {str(path): hash_file(path) for path in inputs},
+        )
+
+    ###########################################################################
+    def inputs(self, source_filename: Path) -> List[Path]:
+        """
+        Finds the files other than the source which a scan will read.
+
+        @param source_filename: Fortran source file.
+        @return: Files included by the preprocessor.
+        """
+        if source_filename.suffix in [".F90", ".X90"]:
+            return find_inclusions(
+                source_filename, self.__preprocess_include_paths
+            )
+        return []
+
+    ###########################################################################
+    def scan(self, source_filename: Path) -> FortranAnalysis:
         """
         Scans a Fortran source file and harvest dependency information.
 
         @param source_filename: Fortran source file to be scanned.
+        @return: Program units and dependencies found in the file.
         """
+        with get_metrics().timer("scan", source_filename):
+            return self.__scan(source_filename)
+
+    def __scan(self, source_filename: Path) -> FortranAnalysis:
         logger = logging.getLogger(__name__)
+        analysis = FortranAnalysis(source_filename)
+        inputs = self.inputs(source_filename)
+
+        cache_key = None
+        if self.__analysis_cache is not None:
+            fingerprint = self.fingerprint(source_filename, inputs)
+            cache_key = self.__analysis_cache.key(
+                fingerprint, self.__cache_settings(source_filename)
+            )
+            entry = self.__analysis_cache.fetch(cache_key)
+            if entry is not None:
+                logger.info("  Reusing analysis of " + str(source_filename))
+                get_metrics().count("analysis cache hits")
+                cached = json.loads(entry)
+                analysis.units = [tuple(unit) for unit in cached["units"]]
+                analysis.compile_dependencies = [
+                    tuple(pair) for pair in cached["compile_dependencies"]
+                ]
+                analysis.link_dependencies = [
+                    tuple(pair) for pair in cached["link_dependencies"]
+                ]
+                analysis.fingerprint = fingerprint
+                return analysis
 
         # Perform any necessary preprocessing
         #
@@ -149,35 +379,9 @@ class FortranAnalyser(Analyser):
             logging.getLogger(__name__).info(
                 "  Preprocessing " + str(source_filename)
             )
-            preprocess_command = self._fpp
-            for path in self.__preprocess_include_paths:
-                preprocess_command.append("-I" + str(path))
-            for name, macro in self.__preprocess_macros.items():
-                if macro:
-                    preprocess_command.append(f"-D{name}={macro}")
-                else:
-                    preprocess_command.append("-D" + name)
-            preprocess_command.append(str(source_filename))
-            logging.getLogger(__name__).debug(preprocess_command)
-
-            start_time = time()
-            preprocessor = subprocess.Popen(
-                preprocess_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                encoding="utf-8",
-            )
-            processed_source, errors = preprocessor.communicate()
-
-            logger.debug(
-                "Time to preprocess Fortran source: "
-                + str(time() - start_time)
+            processed_source = self._preprocessor.preprocess(
+                source_filename, inputs
             )
-            if preprocessor.returncode:
-                logger.error(errors)
-                raise subprocess.CalledProcessError(
-                    preprocessor.returncode, " ".join(preprocess_command)
-                )
         elif source_filename.suffix == ".f90":
             start_time = time()
             with source_filename.open("rt") as sourceFile:
@@ -212,123 +416,15 @@ class FortranAnalyser(Analyser):
                 return
 
             dependencies.append(prerequisite_unit)
-            self._database.add_compile_dependency(
-                program_unit, prerequisite_unit
-            )
+            analysis.add_compile_dependency(program_unit, prerequisite_unit)
             if reverse_link:
-                self._database.add_link_dependency(
-                    prerequisite_unit, program_unit
-                )
+                analysis.add_link_dependency(prerequisite_unit, program_unit)
             else:  # Normal link
-                self._database.add_link_dependency(
-                    program_unit, prerequisite_unit
-                )
-
-        def lines_of_code(
-            source: str,
-        ) -> Generator[Tuple[str, str, int], None, None]:
-            """
-            Reads lines from the file, concatenate at continuation markers and
-            split comments off.
-
-            TODO: This is complex. That complexity comes from the need
-                  to preserve comments. This is needed to support "depends on"
-                  comments. Ergo, once "depends on" is gone we can ignore
-                  comments and this becomes a lot simpler.
-
-            @param source: Fortran source code.
-            @return:
-            """
-            line_number = 0
-            code = ""
-            comment = ""
-            continuing = False
-            for line in source.splitlines():  # Loop over every line in the
-                # source
-                line_number += 1
-                state = "indent"  # Each line starts in the "indent" state
-                index = -1
-                code_start = 0
-                code_end = len(line)
-                comment_start = len(line)
-                continuation = False
-                for character in line:  # Scan every character in a line
-                    index += 1
-                    if state == "indent":
-                        ##############################################
-                        if character == "&":  # Start of continuation line
-                            if not continuing:
-                                message = (
-                                    "Found continuation marker at "
-                                    "start of line when there was none "
-                                    "ending previous line"
-                                )
-                                raise Exception(message)
-                        elif character == "!":  # Line contains only a comment
-                            comment_start = index
-                            state = "comment"
-                        elif character != " ":  # Start of code located
-                            code_start = index
-                            state = "code"
-                    elif state == "code":
-                        ##############################################
-                        if character == '"':  # String opened with double quote
-                            state = "double"
-                        elif character == "'":  # String opened with single
-                            # quote
-                            state = "single"
-                        elif character == "&":  # Line continues on next line
-                            code_end = index
-                            continuing = True
-                            continuation = True
-                            state = "continue"
-                        elif character == "!":  # The remainder of the line
-                            # is a comment
-                            comment_start = index
-                            state = "comment"
-                    elif state == "double":
-                        ############################################
-                        if character == '"':  # Quoted string has ended
-                            state = "code"
-                        elif character == "&":  # Line continues on next line
-                            code_end = index
-                            continuing = True
-                            continuation = True
-                            state = "continue"
-                    elif state == "single":
-                        ############################################
-                        if character == "'":  # Quoted string has ended
-                            state = "code"
-                        elif character == "&":  # Line continues on next line
-                            code_end = index
-                            continuing = True
-                            continuation = True
-                            state = "continue"
-                    elif state == "continue":
-                        ##########################################
-                        if character == "!":  # There is a comment after the
-                            # continuation
-                            state = "comment"
-                    elif state == "comment":
-                        ###########################################
-                        if index - 1 < code_end:  # If we have not already
-                            # ended the code
-                            code_end = index - 1  # Mark it as ended.
-                        break
-
-                code += " " + line[code_start:code_end]
-                comment += " " + line[comment_start:]
-
-                if line[code_start:code_end].strip() and not continuation:
-                    yield (code, comment, line_number)
-                    code = ""
-                    comment = ""
-                    continuing = False
+                analysis.add_link_dependency(program_unit, prerequisite_unit)
 
         # Scan file for dependencies.
         #
         logger.info("  Scanning " + str(source_filename))
-        self._database.remove_file(source_filename)
 
         program_unit = None
         modules = []
@@ -336,24 +432,44 @@ class FortranAnalyser(Analyser):
         scope_stack = []
         pfunit_driver = False
         for code, comment, line_number in lines_of_code(processed_source):
-            match = self._programPattern.match(code)
+            # Most lines are executable statements which can match none of
+            # the patterns. Rather than try each pattern in turn only those
+            # which could match given the leading keyword are tried.
+            #
+            keyword_match = self._keywordPattern.match(code)
+            assert keyword_match is not None  # The pattern may match nothing
+            keyword = keyword_match.group(1).lower()
+
+            match = (
+                self._programPattern.match(code)
+                if keyword == "program"
+                else None
+            )
             if match:
                 program_unit = match.group(1).lower()
                 logger.info("    Contains program: " + program_unit)
-                self._database.add_program(program_unit, source_filename)
+                analysis.add_unit(program_unit, "program")
                 scope_stack.append(("program", program_unit))
                 continue
 
-            match = self._modulePattern.match(code)
+            match = (
+                self._modulePattern.match(code)
+                if keyword == "module"
+                else None
+            )
             if match:
                 program_unit = match.group(1).lower()
                 logger.info("    Contains module " + program_unit)
                 modules.append(program_unit)
-                self._database.add_module(program_unit, source_filename)
+                analysis.add_unit(program_unit, "module")
                 scope_stack.append(("module", program_unit))
                 continue
 
-            match = self._submodulePattern.match(code)
+            match = (
+                self._submodulePattern.match(code)
+                if keyword == "submodule"
+                else None
+            )
             if match:
                 ancestor_unit = match.group(1)
                 if ancestor_unit:
@@ -368,32 +484,44 @@ class FortranAnalyser(Analyser):
                     message = message + "({})".format(ancestor_unit)
                 logger.info(message)
 
-                self._database.add_submodule(program_unit, source_filename)
+                analysis.add_unit(program_unit, "submodule")
                 add_dependency(program_unit, parent_unit, True)
                 scope_stack.append(("submodule", program_unit))
                 continue
 
-            match = self._subroutinePattern.match(code)
+            match = (
+                self._subroutinePattern.match(code)
+                if keyword in ("module", "subroutine")
+                else None
+            )
             if match and len(scope_stack) == 0:
                 # Only if this subroutine is a program unit.
                 program_unit = match.group(2).lower()
                 logger.info("    Contains subroutine " + program_unit)
                 modules.append(program_unit)
-                self._database.add_procedure(program_unit, source_filename)
+                analysis.add_unit(program_unit, "procedure")
                 scope_stack.append(("subroutine", program_unit))
                 continue
 
-            match = self._functionPattern.match(code)
+            match = (
+                self._functionPattern.match(code)
+                if "function" in code.lower()
+                else None
+            )
             if match and len(scope_stack) == 0:
                 # Only if this function is a program unit.
                 program_unit = match.group(2).lower()
                 logger.info("    Contains function " + program_unit)
                 modules.append(program_unit)
-                self._database.add_procedure(program_unit, source_filename)
+                analysis.add_unit(program_unit, "procedure")
                 scope_stack.append(("function", program_unit))
                 continue
 
-            match = self._endPattern.match(code)
+            match = (
+                self._endPattern.match(code)
+                if keyword.startswith("end")
+                else None
+            )
             if match:
                 end_scope = match.group(1)
                 if end_scope is not None:
@@ -418,7 +546,7 @@ class FortranAnalyser(Analyser):
                     )
                     raise Exception(message.format(end=end_scope))
 
-            match = self._usePattern.match(code)
+            match = self._usePattern.match(code) if keyword == "use" else None
             if match is not None:
                 if program_unit is None:
                     raise Exception("Usage found before program unit.")
@@ -427,7 +555,11 @@ class FortranAnalyser(Analyser):
                 add_dependency(program_unit, module_name)
                 continue
 
-            match = self.__openmp_use_pattern.match(comment)
+            match = (
+                self.__openmp_use_pattern.match(comment)
+                if "$" in comment
+                else None
+            )
             if match is not None:
                 """
                 There is no knowledge of whether OpenMP is actually turned on
@@ -441,7 +573,11 @@ class FortranAnalyser(Analyser):
                 add_dependency(program_unit, module_name)
                 continue
 
-            match = self._externalPattern.match(code)
+            match = (
+                self._externalPattern.match(code)
+                if keyword == "external"
+                else None
+            )
             if match is not None:
                 if program_unit is None:
                     raise Exception("External found before program unit.")
@@ -455,7 +591,11 @@ class FortranAnalyser(Analyser):
                         add_dependency(program_unit, module_name)
                 continue
 
-            match = self._external_attribute_pattern.match(code)
+            match = (
+                self._external_attribute_pattern.match(code)
+                if "external" in code
+                else None
+            )
             if match:
                 module_names = [
                     module_name.strip()
@@ -467,8 +607,12 @@ class FortranAnalyser(Analyser):
                         add_dependency(program_unit, module_name)
                 continue
 
-            match = self._pFUnitPattern.match(code)
-            if not pfunit_driver and match is not None:
+            match = (
+                self._pFUnitPattern.match(code)
+                if not pfunit_driver and code.lstrip().startswith("#")
+                else None
+            )
+            if match is not None:
                 if program_unit is None:
                     raise Exception("pFUnit driver found before program unit.")
                 logger.info("    Is driver")
@@ -476,6 +620,8 @@ class FortranAnalyser(Analyser):
 
                 start_time = time()
                 include_filename = source_filename.parent / "testSuites.inc"
+                if include_filename not in inputs:
+                    inputs.append(include_filename)
                 with include_filename.open("rt") as includeFile:
                     for line in includeFile:
                         match = self._suitePattern.match(line)
@@ -487,10 +633,10 @@ class FortranAnalyser(Analyser):
                             logger.info(
                                 "      Depends on module " + test_module
                             )
-                            self._database.add_compile_dependency(
+                            analysis.add_compile_dependency(
                                 program_unit, test_module
                             )
-                            self._database.add_link_dependency(
+                            analysis.add_link_dependency(
                                 program_unit, test_module
                             )
                 message = "Time to read pFUnit driver include file: {0}"
@@ -499,6 +645,8 @@ class FortranAnalyser(Analyser):
                 )
                 continue
 
+            if "!" not in comment:
+                continue
             for match in self._dependsPattern.finditer(comment):
                 if program_unit is None:
                     raise Exception("Dependency found before program unit.")
@@ -507,3 +655,140 @@ class FortranAnalyser(Analyser):
                     "    %s depends on call to %s " % (program_unit, name)
                 )
                 add_dependency(program_unit, name)
+
+        analysis.fingerprint = self.fingerprint(source_filename, inputs)
+
+        # Should the scan have read a file not found beforehand then the key
+        # does not describe everything the result depends on.
+        #
+        if (
+            self.__analysis_cache is not None
+            and cache_key is not None
+            and cache_key
+            == self.__analysis_cache.key(
+                analysis.fingerprint, self.__cache_settings(source_filename)
+            )
+        ):
+            self.__analysis_cache.store(
+                cache_key,
+                json.dumps(
+                    {
+                        "units": analysis.units,
+                        "compile_dependencies": analysis.compile_dependencies,
+                        "link_dependencies": analysis.link_dependencies,
+                    }
+                ),
+            )
+        return analysis
+
+    ###########################################################################
+    def __cache_settings(self, source_filename: Path) -> Dict[str, Any]:
+        """
+        Describes the settings, other than those in a fingerprint, which
+        affect the scan of a source file.
+        """
+        preprocessed = source_filename.suffix in [".F90", ".X90"]
+        return {
+            "suffix": source_filename.suffix,
+            "ignore": sorted(self._ignoreModules),
+            "preprocessor": self._fpp if preprocessed else None,
+            "builtin": isinstance(self._preprocessor, BuiltinPreprocessor),
+        }
+
+
+class FortranAnalyser(Analyser):
+    ###########################################################################
+    # Constructor
+    #
+    # Arguments:
+    #   ignoreModules - Module names to ignore.
+    #   database      - Backing store to hold details.
+    #   preprocess_macros - Macro name is the key. Value may be None for
+    #                            empty macros.
+    #   preprocess_include_paths - Directories where inclusions will be saught.
+    #   preprocess_cache - Reuse preprocessed source from here.
+    #   builtin_preprocessor - Preprocess in-process where possible.
+    #   analysis_cache - Reuse analyses of identical source from here.
+    #
+    def __init__(
+        self,
+        ignoreModules: List[str],
+        database: FortranDependencies,
+        preprocess_macros: Optional[Dict[str, Optional[str]]] = None,
+        preprocess_include_paths: Optional[List[Path]] = None,
+        preprocess_cache: Optional[PreprocessorCache] = None,
+        builtin_preprocessor: bool = False,
+        analysis_cache: Optional[AnalysisCache] = None,
+    ):
+        self._database = database
+        self._scanner = FortranScanner(
+            ignoreModules,
+            preprocess_macros,
+            preprocess_include_paths,
+            preprocess_cache,
+            builtin_preprocessor,
+            analysis_cache,
+        )
+
+    @property
+    def scanner(self) -> FortranScanner:
+        """
+        The scanner used to harvest dependency information.
+        """
+        return self._scanner
+
+    ###########################################################################
+    def analyse(self, source_filename: Path):
+        """
+        Scans a Fortran source file and stores its dependency information.
+
+        @param source_filename: Fortran source file to be scanned.
+        """
+        self.record(self._scanner.scan(source_filename))
+
+    ###########################################################################
+    def record(self, analysis: FortranAnalysis) -> None:
+        """
+        Replaces everything known about a source file in the database.
+
+        @param analysis: Results of scanning the file.
+        """
+        source_filename = analysis.source_filename
+        self._database.remove_file(source_filename)
+
+        adders = {
+            "program": self._database.add_program,
+            "module": self._database.add_module,
+            "submodule": self._database.add_submodule,
+            "procedure": self._database.add_procedure,
+        }
+        for name, unit_type in analysis.units:
+            adders[unit_type](name, source_filename)
+
+        for unit, prerequisite in analysis.compile_dependencies:
+            self._database.add_compile_dependency(unit, prerequisite)
+        for unit, prerequisite in analysis.link_dependencies:
+            self._database.add_link_dependency(unit, prerequisite)
+        self._database.flush()
+
+        if analysis.fingerprint is not None:
+            self._database.set_file_fingerprint(
+                source_filename, analysis.fingerprint
+            )
+
+    ###########################################################################
+    def is_current(self, source_filename: Path) -> bool:
+        """
+        Determines whether the stored analysis of a file is still valid.
+
+        That is the case if the file, the files it includes and the
+        preprocessor settings all match those used when it was last scanned.
+
+        @param source_filename: Fortran source file.
+        @return: True if there is no need to scan the file again.
+        """
+        stored = self._database.get_file_fingerprint(source_filename)
+        if stored is None:
+            return False
+        inputs = [Path(filename) for filename in stored.inputs]
+        return self._scanner.fingerprint(source_filename, inputs) == stored
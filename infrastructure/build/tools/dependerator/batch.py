@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Analyse many source files in a single process.
+
+Starting an interpreter, connecting to the database and compiling the
+analyser's patterns once per source file dominates the cost of analysing a
+large tree. Instead the whole tree is handed to one analyser and the results
+committed to the database in a single transaction.
+
+Files whose content, inclusions and preprocessor settings are unchanged since
+they were last analysed are skipped unless analysis is forced.
+
+Scanning may be spread across a pool of worker processes. Workers only ever
+return plain analysis records, it is the parent process alone which writes
+them to the database.
+"""
+
+import logging
+import os
+from multiprocessing import Pool
+from pathlib import Path
+from time import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dependerator.analyser import (
+    FortranAnalyser,
+    FortranAnalysis,
+    FortranScanner,
+)
+from dependerator.database import SQLiteDatabase
+from dependerator.metrics import get_metrics
+
+# Source files which are recognised when searching a directory.
+#
+SOURCE_SUFFIXES = (".f90", ".F90")
+
+
+def find_sources(paths: Iterable[Path]) -> List[Path]:
+    """
+    Expands a list of files and directories into a list of source files.
+
+    Directories are searched recursively for Fortran source. Files are
+    passed through untouched, whatever their suffix.
+
+    @param paths: Files and directories to consider.
+    @return: Source files in a stable order without duplicates.
+    """
+    sources: List[Path] = []
+    for path in paths:
+        if path.is_dir():
+            found = [
+                candidate
+                for candidate in path.rglob("*")
+                if candidate.suffix in SOURCE_SUFFIXES
+                and candidate.is_file()
+            ]
+            sources.extend(sorted(found))
+        else:
+            sources.append(path)
+    return list(dict.fromkeys(sources))
+
+
+def stamp_filename(source_filename: Path) -> Path:
+    """
+    Gets the stamp file which marks a source file as analysed.
+
+    @param source_filename: Analysed source file.
+    @return: Corresponding stamp file.
+    """
+    return source_filename.with_suffix(".t")
+
+
+def is_stale(source_filename: Path) -> bool:
+    """
+    Determines whether a source file has changed since it was last analysed.
+
+    @param source_filename: Candidate source file.
+    @return: True if there is no stamp file or it is older than the source.
+    """
+    stamp = stamp_filename(source_filename)
+    if not stamp.exists():
+        return True
+    return stamp.stat().st_mtime < source_filename.stat().st_mtime
+
+
+def available_processors() -> int:
+    """
+    Gets the number of processors this process may run on.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on all platforms
+        return os.cpu_count() or 1
+
+
+# Each worker process holds its own scanner, passed once on start-up.
+#
+_worker_scanner: Optional[FortranScanner] = None
+
+
+def _initialise_worker(scanner: FortranScanner) -> None:
+    global _worker_scanner
+    _worker_scanner = scanner
+
+
+def _scan_in_worker(
+    source_filename: Path,
+) -> Tuple[FortranAnalysis, Dict[str, Any]]:
+    """
+    Scans a file, returning the metrics gathered while doing so for merging
+    into those of the parent process.
+    """
+    assert _worker_scanner is not None
+    metrics = get_metrics()
+    metrics.clear()
+    analysis = _worker_scanner.scan(source_filename)
+    return analysis, metrics.snapshot()
+
+
+class BatchAnalyser:
+    """
+    Passes many source files through an analyser in a single transaction.
+    """
+
+    def __init__(
+        self,
+        analyser: FortranAnalyser,
+        database: SQLiteDatabase,
+        stamp: bool = False,
+        processes: int = 1,
+        force: bool = False,
+    ):
+        """
+        @param analyser: Used to examine each source file.
+        @param database: Backend database the analyser is writing to.
+        @param stamp: Skip source files with an up-to-date stamp file and
+                      touch the stamp file of each file considered.
+        @param processes: Number of processes to scan with. Zero means one
+                          per available processor.
+        @param force: Analyse files even if their fingerprint is unchanged.
+        """
+        self.__analyser = analyser
+        self.__database = database
+        self.__stamp = stamp
+        self.__force = force
+        if processes < 0:
+            raise ValueError("Number of processes may not be negative")
+        self.__processes = processes or available_processors()
+
+    def analyse(self, sources: Iterable[Path]) -> List[Path]:
+        """
+        Analyses source files and commits the results.
+
+        Stamp files are only touched once the results are safely committed.
+        If any file fails to analyse nothing is committed.
+
+        @param sources: Files to analyse.
+        @return: Files which were actually analysed.
+        """
+        logger = logging.getLogger(__name__)
+
+        considered = list(sources)
+        if self.__stamp:
+            considered = [
+                source for source in considered if is_stale(source)
+            ]
+
+        start_time = time()
+        if self.__force:
+            candidates = considered
+        else:
+            candidates = [
+                source
+                for source in considered
+                if not self.__analyser.is_current(source)
+            ]
+        metrics = get_metrics()
+        metrics.record("fingerprint", time() - start_time)
+        metrics.count("files unchanged", len(considered) - len(candidates))
+        metrics.count("files analysed", len(candidates))
+        logger.debug(f"Time to check fingerprints: {time() - start_time}")
+        logger.info(
+            f"Analysing {len(candidates)} source files, "
+            f"{len(considered) - len(candidates)} unchanged"
+        )
+
+        # Everything is scanned before the database is locked for writing so
+        # as not to hold up other processes sharing it.
+        #
+        start_time = time()
+        analyses = list(self.__scan(candidates))
+        logger.debug(f"Time to scan batch: {time() - start_time}")
+
+        start_time = time()
+        with self.__database.transaction():
+            for analysis in analyses:
+                self.__analyser.record(analysis)
+        metrics.record("insert", time() - start_time)
+        logger.debug(f"Time to record batch: {time() - start_time}")
+
+        if self.__stamp:
+            for source in considered:
+                stamp_filename(source).touch()
+
+        return candidates
+
+    def __scan(self, sources: List[Path]) -> Iterator[FortranAnalysis]:
+        """
+        Scans source files, in parallel if possible.
+
+        Results are returned in the order the files were given so the
+        database ends up the same however many processes are used.
+        """
+        processes = min(self.__processes, len(sources))
+        if processes <= 1:
+            for source in sources:
+                yield self.__analyser.scanner.scan(source)
+            return
+
+        logging.getLogger(__name__).info(
+            f"Scanning with {processes} processes"
+        )
+        with Pool(
+            processes,
+            initializer=_initialise_worker,
+            initargs=(self.__analyser.scanner,),
+        ) as pool:
+            metrics = get_metrics()
+            for analysis, worker_metrics in pool.imap(
+                _scan_in_worker, sources
+            ):
+                metrics.merge(worker_metrics)
+                yield analysis
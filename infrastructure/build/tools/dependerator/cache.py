@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Keep the results of expensive work on disk, keyed on a hash of its inputs.
+
+A cache is a directory of entries, one per key. Entries are written
+atomically so many processes, possibly working on behalf of different
+applications, may share a cache. It is bounded in size, the least recently
+used entries being evicted first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any, Dict, Optional
+
+from dependerator.fingerprint import SourceFingerprint
+
+# Default upper bound on the size of a cache in bytes.
+#
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+class DirectoryCache:
+    """
+    Directory of text entries.
+    """
+
+    # Distinguishes the entries of different kinds of cache.
+    #
+    entry_suffix = ".cache"
+
+    def __init__(self, directory: Path, size_limit: int = DEFAULT_CACHE_SIZE):
+        """
+        @param directory: Holds the cache, created if necessary.
+        @param size_limit: Bytes the cache may occupy after eviction.
+        """
+        self.__directory = directory
+        self.__size_limit = size_limit
+
+    @property
+    def directory(self) -> Path:
+        return self.__directory
+
+    @staticmethod
+    def hash_description(description: Dict[str, Any]) -> str:
+        """
+        Computes a key from a description of everything affecting an entry.
+
+        @param description: Must be serialisable as JSON.
+        @return: Hexadecimal digest.
+        """
+        text = json.dumps(description, sort_keys=True)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __entry(self, key: str) -> Path:
+        return self.__directory / (key + self.entry_suffix)
+
+    def fetch(self, key: str) -> Optional[str]:
+        """
+        Gets a cached entry, marking it as recently used.
+
+        @param key: Identifies the entry.
+        @return: Content of the entry or None if not cached.
+        """
+        entry = self.__entry(key)
+        try:
+            text = entry.read_text(encoding="utf-8")
+            os.utime(entry)
+        except FileNotFoundError:  # Not cached or evicted by another process
+            return None
+        return text
+
+    def store(self, key: str, text: str) -> None:
+        """
+        Adds an entry to the cache.
+
+        @param key: Identifies the entry.
+        @param text: Content of the entry.
+        """
+        self.__directory.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            "wt",
+            encoding="utf-8",
+            dir=self.__directory,
+            suffix=".tmp",
+            delete=False,
+        ) as temporary:
+            temporary.write(text)
+        try:
+            # Temporary files are private, entries must be readable by
+            # everyone sharing the cache.
+            #
+            mask = os.umask(0)
+            os.umask(mask)
+            os.chmod(temporary.name, 0o644 & ~mask)
+            os.replace(temporary.name, self.__entry(key))
+        except BaseException:
+            os.unlink(temporary.name)
+            raise
+
+    def evict(self) -> int:
+        """
+        Removes least recently used entries until the cache fits its limit.
+
+        @return: Number of entries removed.
+        """
+        if not self.__directory.is_dir():
+            return 0
+
+        entries = []
+        total = 0
+        with os.scandir(self.__directory) as scanner:
+            for entry in scanner:
+                if not entry.name.endswith(self.entry_suffix):
+                    continue
+                try:
+                    status = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, entry.path))
+                total += status.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.__size_limit:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        logging.getLogger(__name__).debug(
+            f"Evicted {removed} {type(self).__name__} entries"
+        )
+        return removed
+
+
+class AnalysisCache(DirectoryCache):
+    """
+    Directory of source file analyses.
+
+    Applications built from the same source, such as the infrastructure,
+    may share a cache so each file is only analysed once between them.
+    Entries are keyed on the content of the source and its inclusions rather
+    than where they are found, as each application works on its own copy.
+    Inclusions are identified by file name alone for the same reason.
+    """
+
+    entry_suffix = ".analysis"
+
+    # Changing what an entry holds must change this so that old entries
+    # are not misread.
+    #
+    FORMAT = 1
+
+    @classmethod
+    def key(
+        cls, fingerprint: SourceFingerprint, settings: Dict[str, Any]
+    ) -> str:
+        """
+        Computes the key under which an analysis is stored.
+
+        @param fingerprint: Of the source file being analysed.
+        @param settings: Anything else about the analyser which affects
+                         the result.
+        @return: Hexadecimal digest.
+        """
+        return cls.hash_description(
+            {
+                "format": cls.FORMAT,
+                "source": fingerprint.content_hash,
+                "macros": fingerprint.macros,
+                "inputs": sorted(
+                    (Path(name).name, digest)
+                    for name, digest in fingerprint.inputs.items()
+                ),
+                "settings": settings,
+            }
+        )
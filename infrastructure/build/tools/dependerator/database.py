@@ -6,13 +6,31 @@
 ##############################################################################
 # Manages a database of dependency information.
 
+import json
 import logging
+import os
+import random
 import sqlite3
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from contextlib import contextmanager
 from pathlib import Path
-from time import time
-from typing import Dict, Generator, List, Optional, Tuple
+from time import sleep, time
+from typing import (
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from dependerator.fingerprint import SourceFingerprint
+from dependerator.metrics import get_metrics
 
 
 ##############################################################################
@@ -46,6 +64,18 @@ class _Database(ABC):
     def ensure_table(self, name, columns):
         pass
 
+    ##########################################################################
+    # Makes sure a described index exists in the database.
+    #
+    # Arguments:
+    #   name    - String by which the index will be known.
+    #   table   - Name of the table being indexed.
+    #   columns - List of column names making up the key.
+    #
+    @abstractmethod
+    def ensure_index(self, name, table, columns):
+        pass
+
     ##########################################################################
     # Passes an SQL query to the backend.
     #
@@ -54,42 +84,215 @@ class _Database(ABC):
     #             query.
     #
     # Arguments:
+    #   query      - Potentially multi-line SQL query.
+    #   parameters - Values bound to placeholders in the query.
+    #
+    @abstractmethod
+    def query(self, query, parameters=()):
+        pass
+
+    ##########################################################################
+    # Passes an SQL query to the backend once for each set of parameters.
+    #
+    # Arguments:
     #   query - Potentially multi-line SQL query.
+    #   rows  - Iterable of parameter sequences.
     #
     @abstractmethod
-    def query(self, query):
+    def query_many(self, query, rows):
         pass
 
 
 ##############################################################################
 # Database backend.
 #
+# The database is shared between processes. It is put in write-ahead log mode
+# so that readers never wait for a writer, and writers take their lock at the
+# start of a transaction so they never have to give up part way through.
+#
+# When the database is busy SQLite waits briefly itself. Beyond that
+# operations are retried with a randomised, growing, delay until the timeout
+# given to the constructor has passed.
+#
+_SQLITE_WAIT = 1.0
+_BACKOFF_START = 0.01
+_BACKOFF_LIMIT = 1.0
+
+_Result = TypeVar("_Result")
+
+# A long running process may keep connections open between uses, along with
+# SQLite's cache of database pages. They are keyed on filename and remember
+# which file they were opened on in case it has since been replaced.
+#
+_RETAINED_CACHE_KIB = 65536
+_retained: Optional[Dict[str, Tuple[sqlite3.Connection, int, int]]] = None
+
+
+def retain_connections() -> None:
+    """
+    Keeps database connections open once finished with, to be reused.
+    """
+    global _retained
+    if _retained is None:
+        _retained = {}
+
+
+def _is_busy(ex: sqlite3.OperationalError) -> bool:
+    code = getattr(ex, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(ex) or "busy" in str(ex)
+
+
 class SQLiteDatabase(_Database):
     ##########################################################################
     # Default constructor.
     #
     # Arguments:
     #   filename - The filename of the database.
+    #   timeout  - Seconds to keep trying while the database is busy.
     #
-    def __init__(self, filename: Path):
+    def __init__(self, filename: Path, timeout: float = 120.0):
         super().__init__()
 
         start_time = time()
-        self._database = sqlite3.connect(str(filename), timeout=5.0)
+        self._timeout = timeout
+        self._transaction_depth = 0
+        self._retained = False
+        if _retained is not None:
+            connection = self.__reuse(filename)
+            if connection is not None:
+                self._database = connection
+                self._retained = True
+                return
+        # Transactions are managed explicitly so the bindings are told not
+        # to start any of their own.
+        #
+        self._database = sqlite3.connect(
+            str(filename), timeout=_SQLITE_WAIT, isolation_level=None
+        )
         self._database.row_factory = sqlite3.Row
+        mode = self._retry(
+            lambda: self._database.execute(
+                "PRAGMA journal_mode=WAL"
+            ).fetchone()[0]
+        )
+        if mode.lower() == "wal":
+            self._database.execute("PRAGMA synchronous=NORMAL")
+        else:
+            logging.getLogger(__name__).info(
+                f"Unable to use write-ahead log with {filename}, "
+                f"using {mode} journal"
+            )
+        if _retained is not None:
+            self._database.execute(f"PRAGMA cache_size=-{_RETAINED_CACHE_KIB}")
+            status = Path(filename).stat()
+            _retained[os.path.abspath(filename)] = (
+                self._database, status.st_dev, status.st_ino
+            )
+            self._retained = True
         message = "Time to initialise database: {0}"
         logging.getLogger(__name__).debug(message.format(time() - start_time))
 
+    ###########################################################################
+    # Finds a retained connection to a database, if it is still the same
+    # file.
+    #
+    @staticmethod
+    def __reuse(filename: Path) -> Optional[sqlite3.Connection]:
+        assert _retained is not None
+        entry = _retained.pop(os.path.abspath(filename), None)
+        if entry is None:
+            return None
+        connection, device, inode = entry
+        try:
+            status = Path(filename).stat()
+        except FileNotFoundError:
+            status = None
+        if status is None or (status.st_dev, status.st_ino) != (device, inode):
+            connection.close()
+            return None
+        _retained[os.path.abspath(filename)] = entry
+        return connection
+
     ###########################################################################
     # Destructor.
     #
     def __del__(self):
+        if not hasattr(self, "_database"):  # Failed to open.
+            return
         start_time = time()
-        self._database.commit()
-        self._database.close()
+        if self._database.in_transaction:
+            self._database.commit()
+        if not self._retained:
+            self._database.close()
         message = "Time to finalise database: {0}"
         logging.getLogger(__name__).debug(message.format(time() - start_time))
 
+    ###########################################################################
+    # Performs an operation, trying again while the database is busy.
+    #
+    # Only operations which may safely be repeated should be passed. That is
+    # a statement outside a transaction, the start of a transaction or its
+    # commit.
+    #
+    # Arguments:
+    #   operation - Callable performing the operation.
+    # Return:
+    #   Whatever the operation returns.
+    #
+    def _retry(self, operation: Callable[[], _Result]) -> _Result:
+        deadline = time() + self._timeout
+        delay = _BACKOFF_START
+        while True:
+            try:
+                return operation()
+            except sqlite3.OperationalError as ex:
+                if not _is_busy(ex) or time() + delay > deadline:
+                    raise
+            logging.getLogger(__name__).debug(
+                f"Database busy, retrying in {delay:.3f}s"
+            )
+            sleep(delay * (1.0 + random.random()))
+            delay = min(delay * 2.0, _BACKOFF_LIMIT)
+
+    ###########################################################################
+    # Groups a number of queries into a single transaction.
+    #
+    # The transaction is committed when the context is left normally and
+    # rolled back if it is left by an exception. Nested transactions are
+    # folded into the outermost.
+    #
+    # The write lock is taken when the transaction begins. This means other
+    # writers wait rather than fail part way through, so transactions should
+    # be kept short. Readers are not held up.
+    #
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        start_time = time()
+        self._retry(lambda: self._database.execute("BEGIN IMMEDIATE"))
+        self._transaction_depth = 1
+        try:
+            yield
+        except BaseException:
+            self._database.rollback()
+            raise
+        else:
+            self._retry(self._database.commit)
+        finally:
+            self._transaction_depth = 0
+        get_metrics().record("commit", time() - start_time)
+        message = "Time to commit transaction: {0}"
+        logging.getLogger(__name__).debug(message.format(time() - start_time))
+
     ###########################################################################
     # Creates a table if it does not already exist.
     #
@@ -105,45 +308,120 @@ class SQLiteDatabase(_Database):
             column_definitions.append(" ".join(columnDetails))
         query = "CREATE TABLE IF NOT EXISTS {} ( {} )"
         start_time = time()
-        with self._database:
-            column_list = ", ".join(column_definitions)
-            self._database.execute(query.format(name, column_list))
+        column_list = ", ".join(column_definitions)
+        self.query(query.format(name, column_list))
         message = "Time to ensure database table: {0} [{1}]"
         logging.getLogger(__name__).debug(
             message.format(time() - start_time, name)
         )
 
+    ###########################################################################
+    # Returns free space to the file system.
+    #
+    # This cannot be done part way through a transaction so is skipped if
+    # one is open.
+    #
+    def compact(self):
+        if self._transaction_depth or self._database.in_transaction:
+            return
+        start_time = time()
+        self._database.execute("VACUUM")
+        message = "Time to compact database: {0}"
+        logging.getLogger(__name__).debug(message.format(time() - start_time))
+
+    ###########################################################################
+    # Creates an index if it does not already exist.
+    #
+    # Arguments:
+    #   name    - String by which index will be identified.
+    #   table   - Name of the table being indexed.
+    #   columns - List of column names making up the key.
+    #
+    def ensure_index(self, name, table, columns):
+        self.query(
+            f"CREATE INDEX IF NOT EXISTS {name} "
+            f"ON {table} ( {', '.join(columns)} )"
+        )
+
     ###########################################################################
     # Execute an SQL query against the database.
     #
+    # Values should be passed as parameters rather than formatted into the
+    # query. That way they need no quoting and the prepared statement may be
+    # reused from the connection's cache.
+    #
+    # A list of instructions is executed one at a time, in a transaction,
+    # rather than as a script. This is because "executescript" commits any
+    # pending transaction which would break batched analysis.
+    #
+    # A single instruction outside a transaction is committed immediately.
+    #
     # Arguments:
-    #   query - Either a string containing a single SQL instruction or a list
-    #           of strings, each containing a single SQL instruction.
+    #   query      - Either a string containing a single SQL instruction or a
+    #                list of strings, each containing a single SQL
+    #                instruction.
+    #   parameters - Values for placeholders. Each instruction in a list
+    #                receives the same values.
     #
-    def query(self, query):
+    def query(self, query, parameters=()):
         if isinstance(query, list):
-            query = "; ".join(query) + ";"
-        query = " ".join(query.split())  # This wheeze collapses whitespace
+            with self.transaction():
+                return self.__execute(query, parameters)
+        elif self._transaction_depth:
+            return self.__execute([query], parameters)
+        else:
+            return self._retry(lambda: self.__execute([query], parameters))
+
+    def __execute(self, statements, parameters):
         start_time = time()
         try:
             cursor = self._database.cursor()
-            if query.count(";") > 1:
-                cursor.executescript(query)
-            else:
-                cursor.execute(query)
+            for statement in statements:
+                cursor.execute(statement, parameters)
             return cursor.fetchall()
         except sqlite3.IntegrityError as ex:
             raise DatabaseException("Database error: ", ex)
         finally:
+            self.__log_query(start_time, statements)
+
+    ###########################################################################
+    # Execute an SQL query once for each of a sequence of parameter sets.
+    #
+    # Arguments:
+    #   query - String containing a single SQL instruction.
+    #   rows  - Iterable of parameter sequences.
+    #
+    def query_many(self, query, rows):
+        start_time = time()
+        try:
+            with self.transaction():
+                self._database.executemany(query, rows)
+        except sqlite3.IntegrityError as ex:
+            raise DatabaseException("Database error: ", ex)
+        finally:
+            self.__log_query(start_time, [query])
+
+    def __log_query(self, start_time, statements):
+        get_metrics().record("query", time() - start_time)
+        logger = logging.getLogger(__name__)
+        if logger.isEnabledFor(logging.DEBUG):
+            # This wheeze collapses whitespace
+            query = "; ".join(" ".join(each.split()) for each in statements)
             message = "Time to query database: {0} [{1}]"
-            logging.getLogger(__name__).debug(
-                message.format(time() - start_time, query)
-            )
+            logger.debug(message.format(time() - start_time, query))
 
 
 ###############################################################################
 # Basic file dependencies.
 #
+# Each relationship may be tagged with the program unit it was derived from.
+# That allows the relationships of just those units which have changed to be
+# replaced.
+#
+# A "context" string may also be stored. This describes whatever settings the
+# relationships were derived with. If they change the relationships must all
+# be derived again.
+#
 class FileDependencies(object):
     ###########################################################################
     # Default constructor.
@@ -153,13 +431,39 @@ class FileDependencies(object):
     #
     def __init__(self, database):
         self._database = database
+        self.__pending: List[Tuple[str, str, Optional[str]]] = []
+
+        # The table is derived data so an old layout is simply discarded.
+        #
+        if self.__is_old_layout():
+            with self._database.transaction():
+                if self.__is_old_layout():
+                    self._database.query("DROP TABLE file_dependency")
+
         self._database.ensure_table(
             "file_dependency",
             (
                 ("file", "TEXT", "NOT NULL"),
                 ("prerequisite", "TEXT", "NOT NULL"),
+                ("unit", "TEXT"),
             ),
         )
+        self._database.ensure_index(
+            "file_dependency_unit", "file_dependency", ["unit"]
+        )
+        self._database.ensure_table(
+            "file_dependency_context",
+            (("id", "INTEGER", "PRIMARY KEY"), ("context", "TEXT")),
+        )
+
+    def __is_old_layout(self) -> bool:
+        columns = [
+            row["name"]
+            for row in self._database.query(
+                "PRAGMA table_info(file_dependency)"
+            )
+        ]
+        return bool(columns) and "unit" not in columns
 
     ###########################################################################
     # Remove a file and all its dependencies from the database.
@@ -168,37 +472,120 @@ class FileDependencies(object):
     #   filename - The filename as it appears in the database.
     #
     def remove_file(self, filename):
-        query = 'DELETE FROM file_dependency WHERE file="{}"'.format(filename)
-        self._database.query(query)
+        self.flush()
+        query = "DELETE FROM file_dependency WHERE file=?"
+        self._database.query(query, (str(filename),))
+
+    ###########################################################################
+    # Remove all the dependencies derived from certain program units.
+    #
+    # Arguments:
+    #   units - Program unit names.
+    #
+    def remove_units(self, units):
+        self.flush()
+        self._database.query_many(
+            "DELETE FROM file_dependency WHERE unit=?",
+            [(unit,) for unit in units],
+        )
 
     ###########################################################################
     # Remove all files and dependencies from the database.
     #
     def remove_all_file_dependencies(self):
-        query = "DELETE FROM file_dependency"
+        self.__pending.clear()
+        query = [
+            "DELETE FROM file_dependency",
+            "DELETE FROM file_dependency_context",
+        ]
         self._database.query(query)
 
     ###########################################################################
     # Add a dependency relationship to the database.
     #
+    # The relationship is held back until the next flush so that many may be
+    # written in one go.
+    #
     # Arguments:
     #   filename     - A filename string.
     #   prerequisite - The filename string of a file which the first depends
     #                  on.
+    #   unit         - Name of the program unit the relationship derives from.
+    #
+    def add_file_dependency(self, filename, prerequisite, unit=None):
+        self.__pending.append((str(filename), str(prerequisite), unit))
+
+    ###########################################################################
+    # Write any relationships held back by add_file_dependency.
+    #
+    def flush(self):
+        if not self.__pending:
+            return
+        with self._database.transaction():
+            self._database.query_many(
+                "INSERT INTO file_dependency VALUES ( ?, ?, ? )",
+                self.__pending,
+            )
+        self.__pending.clear()
+
+    ###########################################################################
+    # Get the settings the relationships were derived with.
+    #
+    # Return:
+    #   Context string or None if there is none.
+    #
+    def get_context(self):
+        rows = self._database.query(
+            "SELECT context FROM file_dependency_context"
+        )
+        return rows[0]["context"] if rows else None
+
+    ###########################################################################
+    # Record the settings the relationships were derived with.
+    #
+    # Arguments:
+    #   context - String describing the settings.
+    #
+    def set_context(self, context):
+        self._database.query(
+            "INSERT OR REPLACE INTO file_dependency_context VALUES ( 1, ? )",
+            (context,),
+        )
+
+    ###########################################################################
+    # Get the files each program unit has contributed relationships for.
+    #
+    # Return:
+    #   Dictionary of unit name to set of filenames.
     #
-    def add_file_dependency(self, filename, prerequisite):
-        query = "INSERT INTO file_dependency VALUES ('{}','{}')"
-        self._database.query(query.format(filename, prerequisite))
+    def get_unit_targets(self) -> Dict[str, Set[Path]]:
+        self.flush()
+        rows = self._database.query(
+            "SELECT DISTINCT unit, file FROM file_dependency "
+            "WHERE unit IS NOT NULL"
+        )
+        targets: Dict[str, Set[Path]] = defaultdict(set)
+        for row in rows:
+            targets[row["unit"]].add(Path(row["file"]))
+        return targets
 
     ###########################################################################
     # Get all the file dependency relationships.
     #
+    # Relationships are ordered by file and then by the unit they derive
+    # from. For each unit they are in the order they were added. This means
+    # the order does not depend on which units were derived most recently.
+    #
     # Arguments:
     # Return:
     #   A generator yielding (filename, filename) tuples.
     #
     def get_dependencies(self):
-        query = "SELECT * FROM file_dependency ORDER BY file"
+        self.flush()
+        query = (
+            "SELECT file, prerequisite FROM file_dependency "
+            "ORDER BY file, unit, rowid"
+        )
         result = self._database.query(query)
 
         last_file = None
@@ -219,6 +606,36 @@ class FileDependencies(object):
 ###############################################################################
 # Fortran dependencies.
 #
+# Unit names and file names are interned in tables of their own and referred
+# to by integer key. This keeps the database small and lets lookups seek on
+# an index rather than scan.
+#
+# The schema version is kept in SQLite's "user_version" field. Version 0 is
+# the original schema which used names throughout. Version 2 added tracking
+# of changed units.
+#
+# A unit is marked as changed when it is added, removed or gains
+# dependencies. Marks are cleared once whatever is derived from the database
+# has been brought up to date.
+#
+SCHEMA_VERSION = 2
+
+_UNIT_ID = "(SELECT id FROM fortran_unit_name WHERE name=?)"
+_FILE_ID = "(SELECT id FROM fortran_file WHERE name=?)"
+_INTERN_UNIT = "INSERT OR IGNORE INTO fortran_unit_name ( name ) VALUES ( ? )"
+_INTERN_FILE = "INSERT OR IGNORE INTO fortran_file ( name ) VALUES ( ? )"
+
+# Most values bound to one query. Older SQLite allows no more than 999.
+#
+_PARAMETER_BATCH = 500
+_PROGRAM_UNITS = """
+    SELECT name.name AS unit, file.name AS file, unit.type AS type
+    FROM fortran_program_unit AS unit
+    JOIN fortran_unit_name AS name ON name.id = unit.unit
+    JOIN fortran_file AS file ON file.id = unit.file
+    """
+
+
 class FortranDependencies(object):
     ###########################################################################
     # Default constructor.
@@ -228,7 +645,43 @@ class FortranDependencies(object):
     #
     def __init__(self, database):
         self._database = database
+        self.__pending: List[Tuple[str, str, str]] = []
 
+        # Most of the time the schema is up to date and nothing needs to be
+        # written. Only if it is not is the write lock taken, after which
+        # the version is checked again in case another process got there
+        # first.
+        #
+        if self.__schema_version() == SCHEMA_VERSION:
+            return
+        legacy: List[str] = []
+        with self._database.transaction():
+            version = self.__schema_version()
+            if version < SCHEMA_VERSION:
+                self.__ensure_types()
+                if version == 0:
+                    legacy = self.__legacy_tables()
+                for table in legacy:
+                    self._database.query(
+                        f"ALTER TABLE {table} RENAME TO _legacy_{table}"
+                    )
+                self.__ensure_schema()
+                if legacy:
+                    self.__migrate_legacy(legacy)
+                self._database.query(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if legacy:
+            self._database.compact()
+
+    def __schema_version(self) -> int:
+        version = self._database.query("PRAGMA user_version")[0][0]
+        if version > SCHEMA_VERSION:
+            raise DatabaseException(
+                f"Database schema version {version} is newer than "
+                f"this tool understands ({SCHEMA_VERSION})"
+            )
+        return version
+
+    def __ensure_types(self) -> None:
         self._database.ensure_table(
             "fortran_unit_type", [("type", "TEXT", "PRIMARY KEY")]
         )
@@ -252,22 +705,196 @@ class FortranDependencies(object):
             ]
         )
 
+    def __ensure_schema(self) -> None:
+        self._database.ensure_table(
+            "fortran_unit_name",
+            (
+                ("id", "INTEGER", "PRIMARY KEY"),
+                ("name", "TEXT", "NOT NULL UNIQUE"),
+            ),
+        )
+        self._database.ensure_table(
+            "fortran_file",
+            (
+                ("id", "INTEGER", "PRIMARY KEY"),
+                ("name", "TEXT", "NOT NULL UNIQUE"),
+            ),
+        )
         self._database.ensure_table(
             "fortran_program_unit",
             (
-                ("unit", "TEXT", "PRIMARY KEY"),
-                ("file", "TEXT", "NOT NULL"),
+                ("unit", "INTEGER", "PRIMARY KEY",
+                 "REFERENCES fortran_unit_name(id)"),
+                ("file", "INTEGER", "NOT NULL", "REFERENCES fortran_file(id)"),
                 ("type", "REFERENCES fortran_unit_type(type)"),
             ),
         )
+        self._database.ensure_index(
+            "fortran_program_unit_file", "fortran_program_unit", ["file"]
+        )
         self._database.ensure_table(
             "fortran_unit_dependency",
             (
-                ("unit", "TEXT", "NOT NULL"),
-                ("prerequisite", "TEXT", "NOT NULL"),
+                ("unit", "INTEGER", "NOT NULL",
+                 "REFERENCES fortran_unit_name(id)"),
+                ("prerequisite", "INTEGER", "NOT NULL",
+                 "REFERENCES fortran_unit_name(id)"),
                 ("type", "REFERENCES fortran_dependency_type(type)"),
             ),
         )
+        self._database.ensure_index(
+            "fortran_unit_dependency_unit",
+            "fortran_unit_dependency",
+            ["unit", "type"],
+        )
+        self._database.ensure_index(
+            "fortran_unit_dependency_prerequisite",
+            "fortran_unit_dependency",
+            ["prerequisite"],
+        )
+        self._database.ensure_table(
+            "fortran_changed_unit",
+            (
+                ("unit", "INTEGER", "PRIMARY KEY",
+                 "REFERENCES fortran_unit_name(id)"),
+            ),
+        )
+        self._database.ensure_table(
+            "fortran_source_file",
+            (
+                ("file", "INTEGER", "PRIMARY KEY",
+                 "REFERENCES fortran_file(id)"),
+                ("hash", "TEXT", "NOT NULL"),
+                ("macros", "TEXT", "NOT NULL"),
+                ("include_paths", "TEXT", "NOT NULL"),
+                ("inputs", "TEXT", "NOT NULL"),
+            ),
+        )
+
+    def __legacy_tables(self) -> List[str]:
+        """
+        Finds tables left by the original, name keyed, schema.
+
+        @return: Names of those tables which exist.
+        """
+        rows = self._database.query(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name IN "
+            "('fortran_program_unit', 'fortran_unit_dependency', "
+            "'fortran_source_file')"
+        )
+        return [row["name"] for row in rows]
+
+    def __migrate_legacy(self, tables: List[str]) -> None:
+        """
+        Moves content from the original schema into the current one.
+
+        The old tables have been renamed out of the way before the new ones
+        were created. Empty stand-ins are provided for any which the old
+        database lacked so the copy need not special case them.
+
+        @param tables: Legacy tables present in the database.
+        """
+        logging.getLogger(__name__).info(
+            "Migrating dependency database to schema version "
+            f"{SCHEMA_VERSION}"
+        )
+        stand_ins = {
+            "fortran_program_unit": "unit TEXT, file TEXT, type TEXT",
+            "fortran_unit_dependency": "unit TEXT, prerequisite TEXT, "
+            "type TEXT",
+            "fortran_source_file": "file TEXT, hash TEXT, macros TEXT, "
+            "include_paths TEXT, inputs TEXT",
+        }
+        for table, columns in stand_ins.items():
+            if table not in tables:
+                self._database.query(
+                    f"CREATE TABLE _legacy_{table} ( {columns} )"
+                )
+
+        self._database.query(
+            [
+                """
+                INSERT OR IGNORE INTO fortran_unit_name ( name )
+                SELECT unit FROM _legacy_fortran_program_unit
+                UNION SELECT unit FROM _legacy_fortran_unit_dependency
+                UNION SELECT prerequisite FROM _legacy_fortran_unit_dependency
+                """,
+                """
+                INSERT OR IGNORE INTO fortran_file ( name )
+                SELECT file FROM _legacy_fortran_program_unit
+                UNION SELECT file FROM _legacy_fortran_source_file
+                """,
+                """
+                INSERT INTO fortran_program_unit
+                SELECT name.id, file.id, legacy.type
+                FROM _legacy_fortran_program_unit AS legacy
+                JOIN fortran_unit_name AS name ON name.name = legacy.unit
+                JOIN fortran_file AS file ON file.name = legacy.file
+                """,
+                """
+                INSERT INTO fortran_unit_dependency
+                SELECT unit.id, prerequisite.id, legacy.type
+                FROM _legacy_fortran_unit_dependency AS legacy
+                JOIN fortran_unit_name AS unit ON unit.name = legacy.unit
+                JOIN fortran_unit_name AS prerequisite
+                    ON prerequisite.name = legacy.prerequisite
+                ORDER BY legacy.rowid
+                """,
+                """
+                INSERT INTO fortran_source_file
+                SELECT file.id, legacy.hash, legacy.macros,
+                       legacy.include_paths, legacy.inputs
+                FROM _legacy_fortran_source_file AS legacy
+                JOIN fortran_file AS file ON file.name = legacy.file
+                """,
+            ]
+            + [f"DROP TABLE _legacy_{table}" for table in stand_ins]
+        )
+
+    def get_file_fingerprint(
+        self, filename: Path
+    ) -> Optional[SourceFingerprint]:
+        """
+        Gets the fingerprint of a source file when it was last analysed.
+
+        @param filename: As it appears in the database.
+        @return: Fingerprint or None if the file has not been analysed.
+        """
+        rows = self._database.query(
+            "SELECT hash, macros, include_paths, inputs "
+            f"FROM fortran_source_file WHERE file={_FILE_ID}",
+            (str(filename),),
+        )
+        if not rows:
+            return None
+        return SourceFingerprint(
+            rows[0]["hash"],
+            rows[0]["macros"],
+            rows[0]["include_paths"],
+            json.loads(rows[0]["inputs"]),
+        )
+
+    def set_file_fingerprint(
+        self, filename: Path, fingerprint: SourceFingerprint
+    ) -> None:
+        """
+        Stores the fingerprint of a source file which has been analysed.
+
+        @param filename: As it appears in the database.
+        @param fingerprint: Identifies the inputs to the analysis.
+        """
+        self._database.query(_INTERN_FILE, (str(filename),))
+        self._database.query(
+            "INSERT OR REPLACE INTO fortran_source_file "
+            f"VALUES ( {_FILE_ID}, ?, ?, ?, ? )",
+            (
+                str(filename),
+                fingerprint.content_hash,
+                fingerprint.macros,
+                fingerprint.include_paths,
+                json.dumps(fingerprint.inputs, sort_keys=True),
+            ),
+        )
 
     def remove_file(self, filename: Path) -> None:
         """
@@ -275,20 +902,36 @@ class FortranDependencies(object):
 
         @param filename: As it appears in the database.
         """
+        self.flush()
         query = [
-            f'''
-            CREATE TEMPORARY TABLE _units AS SELECT unit
-            FROM fortran_program_unit
-            WHERE file="{filename}"
-            ''',
-            """
+            f"""
+            INSERT OR IGNORE INTO fortran_changed_unit
+            SELECT unit FROM fortran_program_unit WHERE file={_FILE_ID}
+            """,
+            f"""
             DELETE FROM fortran_unit_dependency
-            WHERE unit IN _units
+            WHERE unit IN (
+                SELECT unit FROM fortran_program_unit WHERE file={_FILE_ID}
+            )
             """,
-            "DROP TABLE _units",
-            f'DELETE FROM fortran_program_unit WHERE file="{filename}"',
+            f"DELETE FROM fortran_program_unit WHERE file={_FILE_ID}",
+            f"DELETE FROM fortran_source_file WHERE file={_FILE_ID}",
         ]
-        self._database.query(query)
+        self._database.query(query, (str(filename),))
+
+    def __add_unit(self, name: str, filename: Path, unit_type: str) -> None:
+        self._database.query(_INTERN_UNIT, (name,))
+        self._database.query(_INTERN_FILE, (str(filename),))
+        self._database.query(
+            "INSERT INTO fortran_program_unit "
+            f"VALUES ( {_UNIT_ID}, {_FILE_ID}, ? )",
+            (name, str(filename), unit_type),
+        )
+        self._database.query(
+            "INSERT OR IGNORE INTO fortran_changed_unit "
+            f"VALUES ( {_UNIT_ID} )",
+            (name,),
+        )
 
     def add_program(self, name: str, filename: Path) -> None:
         """
@@ -298,12 +941,7 @@ class FortranDependencies(object):
         @param filename: Source file in which program was found.
         @return:
         """
-        # Changes are transacted to ensure other processes can't find the
-        # database with half a program.
-        query = (
-            "INSERT INTO fortran_program_unit VALUES ( '{}', '{}', 'program' )"
-        )
-        self._database.query(query.format(name, filename))
+        self.__add_unit(name, filename, "program")
 
     def add_module(self, name: str, filename: Path) -> None:
         """
@@ -313,10 +951,7 @@ class FortranDependencies(object):
         :param filename: source file in which the modules is found.
         """
         try:
-            _ = self._database.query(
-                "INSERT INTO fortran_program_unit "
-                f"VALUES ( '{name}', '{str(filename)}', 'module' )"
-            )
+            self.__add_unit(name, filename, "module")
         except DatabaseException as ex:
             raise DatabaseException(
                 f"Unable to add module '{name}' from '{filename}': {ex}",
@@ -332,10 +967,7 @@ class FortranDependencies(object):
         :param filename: Source file in which sub-module is found.
         """
         try:
-            _ = self._database.query(
-                "INSERT INTO fortran_program_unit "
-                f"VALUES ( '{name}', '{str(filename)}', 'submodule' )"
-            )
+            self.__add_unit(name, filename, "submodule")
         except DatabaseException as ex:
             raise DatabaseException(
                 f"Unable to add sub-module '{name}' from '{filename}': {ex}",
@@ -351,11 +983,7 @@ class FortranDependencies(object):
         @param filename: Source file in which the procedure was found.
         """
         try:
-            query = (
-                "INSERT INTO fortran_program_unit VALUES ( '{name}', "
-                "'{filename}', 'procedure' )"
-            )
-            self._database.query(query.format(name=name, filename=filename))
+            self.__add_unit(name, filename, "procedure")
         except DatabaseException as ex:
             new_exception = DatabaseException(
                 f"Unable to add procedure '{name}' from '{filename}': {ex}"
@@ -370,10 +998,73 @@ class FortranDependencies(object):
 
         @return: Program unit name and containing file.
         """
-        query = "SELECT * FROM fortran_program_unit"
-        rows = self._database.query(query)
+        self.flush()
+        rows = self._database.query(_PROGRAM_UNITS)
         return [(row["unit"], Path(row["file"])) for row in rows]
 
+    def flush(self) -> None:
+        """
+        Writes dependencies held back by add_compile_dependency and
+        add_link_dependency.
+
+        They are written together, interning all the names involved first,
+        so a file's worth of dependencies costs a couple of statements rather
+        than a few per dependency. Queries flush before they run so they
+        never miss anything.
+        """
+        if not self.__pending:
+            return
+        names = {
+            name
+            for unit, prerequisite, _ in self.__pending
+            for name in (unit, prerequisite)
+        }
+        with self._database.transaction():
+            self._database.query_many(
+                _INTERN_UNIT, [(name,) for name in sorted(names)]
+            )
+            self._database.query_many(
+                "INSERT INTO fortran_unit_dependency "
+                f"VALUES ( {_UNIT_ID}, {_UNIT_ID}, ? )",
+                self.__pending,
+            )
+            self._database.query_many(
+                "INSERT OR IGNORE INTO fortran_changed_unit "
+                f"VALUES ( {_UNIT_ID} )",
+                [(unit,) for unit in {unit for unit, _, _ in self.__pending}],
+            )
+        self.__pending.clear()
+
+    def get_changed_units(self) -> Set[str]:
+        """
+        Gets the units marked as changed.
+
+        @return: Unit names.
+        """
+        self.flush()
+        rows = self._database.query(
+            "SELECT name.name AS unit FROM fortran_changed_unit AS changed "
+            "JOIN fortran_unit_name AS name ON name.id = changed.unit"
+        )
+        return {row["unit"] for row in rows}
+
+    def clear_changed_units(self) -> None:
+        """
+        Removes all marks of change.
+        """
+        self.flush()
+        self._database.query("DELETE FROM fortran_changed_unit")
+
+    def get_unit_details(self) -> Dict[str, Tuple[Path, str]]:
+        """
+        Gets details of every program unit in the database.
+
+        @return: Unit name mapped to containing file and unit type.
+        """
+        self.flush()
+        rows = self._database.query(_PROGRAM_UNITS)
+        return {row["unit"]: (Path(row["file"]), row["type"]) for row in rows}
+
     def add_compile_dependency(self, unit: str, prerequisite: str) -> None:
         """
         Adds a compile dependency to the database.
@@ -381,22 +1072,22 @@ class FortranDependencies(object):
         @param unit: Depender unit name.
         @param prerequisite: Dependee unit name.
         """
-        query = (
-            "INSERT INTO fortran_unit_dependency VALUES ( '{}', '{}', "
-            "'compile' )"
-        )
-        self._database.query(query.format(unit, prerequisite))
+        self.__pending.append((unit, prerequisite, "compile"))
 
     def get_compile_prerequisites(self, unit: str) -> List[str]:
         """
         Gets a list of prerequisites for a program unit.
         """
+        self.flush()
         query = (
-            "SELECT prerequisite "
-            "FROM fortran_unit_dependency "
-            f"WHERE unit='{unit}' AND type='compile'"
+            "SELECT prerequisite.name AS prerequisite "
+            "FROM fortran_unit_dependency AS dependency "
+            "JOIN fortran_unit_name AS prerequisite "
+            "ON prerequisite.id = dependency.prerequisite "
+            f"WHERE dependency.unit={_UNIT_ID} "
+            "AND dependency.type='compile'"
         )
-        rows = self._database.query(query)
+        rows = self._database.query(query, (unit,))
         return [row["prerequisite"] for row in rows]
 
     def add_link_dependency(self, unit: str, prerequisite: str) -> None:
@@ -406,10 +1097,104 @@ class FortranDependencies(object):
         @param unit: Depender unit name.
         @param prerequisite: Dependee unit name.
         """
+        self.__pending.append((unit, prerequisite, "link"))
+
+    def get_all_compile_dependencies(self) -> List[Tuple[str, str]]:
+        """
+        Gets every compile dependency in the database.
+
+        @return: Depender unit name and dependee unit name, in the order they
+                 were added.
+        """
+        self.flush()
+        query = (
+            "SELECT unit.name AS unit, prerequisite.name AS prerequisite "
+            "FROM fortran_unit_dependency AS dependency "
+            "JOIN fortran_unit_name AS unit ON unit.id = dependency.unit "
+            "JOIN fortran_unit_name AS prerequisite "
+            "ON prerequisite.id = dependency.prerequisite "
+            "WHERE dependency.type='compile' "
+            "ORDER BY dependency.rowid"
+        )
+        rows = self._database.query(query)
+        return [(row["unit"], row["prerequisite"]) for row in rows]
+
+    def get_all_link_dependencies(self) -> List[Tuple[str, str]]:
+        """
+        Gets every link dependency in the database.
+
+        @return: Depender unit name and dependee unit name.
+        """
+        self.flush()
         query = (
-            "INSERT INTO fortran_unit_dependency VALUES ( '{}', '{}', 'link' )"
+            "SELECT DISTINCT unit.name AS unit, "
+            "prerequisite.name AS prerequisite "
+            "FROM fortran_unit_dependency AS dependency "
+            "JOIN fortran_unit_name AS unit ON unit.id = dependency.unit "
+            "JOIN fortran_unit_name AS prerequisite "
+            "ON prerequisite.id = dependency.prerequisite "
+            "WHERE dependency.type='link'"
+        )
+        rows = self._database.query(query)
+        return [(row["unit"], row["prerequisite"]) for row in rows]
+
+    def get_dependants(
+        self, units: Iterable[str], dependency_type: str
+    ) -> Set[str]:
+        """
+        Gets every unit which depends, directly or not, on any of some units.
+
+        Dependencies are followed backwards using the index on prerequisites
+        so the cost is in proportion to the answer, not the database.
+
+        @param units: Unit names to start from.
+        @param dependency_type: "compile" or "link".
+        @return: Unit names, including those started from.
+        """
+        self.flush()
+        units = sorted(set(units))
+        if not units:
+            return set()
+        # Names are bound in batches which stay within the limit on bound
+        # parameters of older SQLite. Dependants of all the names are those
+        # of each batch together.
+        #
+        dependants: Set[str] = set()
+        for start in range(0, len(units), _PARAMETER_BATCH):
+            batch = units[start:start + _PARAMETER_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            rows = self._database.query(
+                f"""
+                WITH RECURSIVE dependant(unit) AS (
+                    SELECT id FROM fortran_unit_name
+                    WHERE name IN ({placeholders})
+                    UNION
+                    SELECT dependency.unit
+                    FROM fortran_unit_dependency AS dependency
+                    JOIN dependant ON dependency.prerequisite = dependant.unit
+                    WHERE dependency.type = ?
+                )
+                SELECT name.name AS unit FROM dependant
+                JOIN fortran_unit_name AS name ON name.id = dependant.unit
+                """,
+                (*batch, dependency_type),
+            )
+            dependants.update(row["unit"] for row in rows)
+        return dependants
+
+    def get_file_units(self, filename: Path) -> List[str]:
+        """
+        Gets the program units held in a file.
+
+        @param filename: Source file as it appears in the database.
+        @return: Unit names, sorted.
+        """
+        self.flush()
+        rows = self._database.query(
+            _PROGRAM_UNITS + f" WHERE unit.file = {_FILE_ID} ORDER BY 1",
+            (str(filename),),
         )
-        self._database.query(query.format(unit, prerequisite))
+        return [row["unit"] for row in rows]
 
     def get_programs(self) -> List[str]:
         """
@@ -417,10 +1202,8 @@ class FortranDependencies(object):
 
         @return: program names
         """
-        query = (
-            "SELECT unit FROM fortran_program_unit "
-            + " WHERE type='program' ORDER BY unit DESC"
-        )
+        self.flush()
+        query = _PROGRAM_UNITS + " WHERE unit.type='program' ORDER BY 1 DESC"
         rows = self._database.query(query)
         return [row["unit"] for row in rows]
 
@@ -430,9 +1213,10 @@ class FortranDependencies(object):
 
         @return: Module name and containing file.
         """
+        self.flush()
         query = (
-            "SELECT unit, file FROM fortran_program_unit "
-            + " WHERE type='module' OR type='submodule'"
+            _PROGRAM_UNITS
+            + " WHERE unit.type='module' OR unit.type='submodule'"
         )
         rows = self._database.query(query)
         return [(row["unit"], Path(row["file"])) for row in rows]
@@ -443,51 +1227,64 @@ class FortranDependencies(object):
         """
         Gets program unit dependencies for a program unit.
 
-        This could be done (and was for a while) as a single SELECT statement.
-        The problem with that is it becomes hard to know when nothing is
-        returned because there is nothing to return and when it happens because
-        a dependency is missing from the database.
+        The closure is found by a single recursive query. Unit details are
+        joined loosely so that a prerequisite missing from the database shows
+        up as an absent filename rather than a silently absent row.
+
+        Edges leading back to the program unit itself are omitted as its
+        object is not a prerequisite of itself.
 
         @param program_unit: Desired link target name.
         @return: program unit name, containing file,
                  prerequisite unit name, containing file
         """
-        # We cache program unit details for performance.
-        #
-        unit_cache = UnitCache(self._database)
-
-        processed: List[str] = []
-        candidates = [program_unit]
-        while candidates:
-            unit = candidates.pop(0)
-
-            processed.append(unit)
-            rows = self._database.query(
-                f'''
-                SELECT unit, prerequisite FROM fortran_unit_dependency
-                WHERE unit="{unit}" and type="link"
-                ORDER BY unit
-                '''
+        self.flush()
+        rows = self._database.query(
+            f'''
+            WITH RECURSIVE closure(unit) AS (
+                VALUES({_UNIT_ID})
+                UNION
+                SELECT dependency.prerequisite
+                FROM fortran_unit_dependency AS dependency
+                JOIN closure ON dependency.unit = closure.unit
+                WHERE dependency.type = 'link'
             )
-            for unit, prerequisite in rows:
-                if prerequisite in processed:
-                    continue
-                candidates.append(prerequisite)
-
-                unit_filename, _ = unit_cache.details(unit)
-                try:
-                    prerequiste_filename, _ = unit_cache.details(prerequisite)
-                except DatabaseException:
-                    raise DatabaseException(
-                        f"Program unit '{unit}' requires '{prerequisite}' "
-                        "but it was not found in the database"
-                    )
-                yield (
-                    unit,
-                    Path(unit_filename),
-                    prerequisite,
-                    Path(prerequiste_filename),
+            SELECT DISTINCT unit_name.name, unit_file.name,
+                            prerequisite_name.name, prerequisite_file.name
+            FROM fortran_unit_dependency AS dependency
+            JOIN closure ON dependency.unit = closure.unit
+            JOIN fortran_unit_name AS unit_name
+                ON unit_name.id = dependency.unit
+            JOIN fortran_unit_name AS prerequisite_name
+                ON prerequisite_name.id = dependency.prerequisite
+            LEFT JOIN fortran_program_unit AS unit
+                ON unit.unit = dependency.unit
+            LEFT JOIN fortran_file AS unit_file
+                ON unit_file.id = unit.file
+            LEFT JOIN fortran_program_unit AS prerequisite
+                ON prerequisite.unit = dependency.prerequisite
+            LEFT JOIN fortran_file AS prerequisite_file
+                ON prerequisite_file.id = prerequisite.file
+            WHERE dependency.type = 'link'
+            AND prerequisite_name.name != ?
+            ORDER BY unit_name.name, prerequisite_name.name
+            ''',
+            (program_unit, program_unit),
+        )
+        for unit, unit_filename, prerequisite, prerequisite_filename in rows:
+            if unit_filename is None:
+                raise DatabaseException(f"Unable to find unit '{unit}'")
+            if prerequisite_filename is None:
+                raise DatabaseException(
+                    f"Program unit '{unit}' requires '{prerequisite}' "
+                    "but it was not found in the database"
                 )
+            yield (
+                unit,
+                Path(unit_filename),
+                prerequisite,
+                Path(prerequisite_filename),
+            )
 
     def get_compile_dependencies(
         self, root: Optional[str] = None
@@ -506,6 +1303,7 @@ class FortranDependencies(object):
         @return: unit name, unit filename, unit type,
                  prerequisite name, prerequisite filename, prerequisite type
         """
+        self.flush()
         if root is None:
             units = self.get_programs()
         else:
@@ -533,12 +1331,16 @@ class FortranDependencies(object):
             units.extend(submodule_cache.submodules(unit))
 
             dep_rows = self._database.query(
-                "SELECT unit, prerequisite, type "
-                "FROM fortran_unit_dependency "
-                f"WHERE (type = 'compile' AND unit = '{unit}')"
+                "SELECT prerequisite.name AS prerequisite "
+                "FROM fortran_unit_dependency AS dependency "
+                "JOIN fortran_unit_name AS prerequisite "
+                "ON prerequisite.id = dependency.prerequisite "
+                f"WHERE dependency.unit = {_UNIT_ID} "
+                "AND dependency.type = 'compile'",
+                (unit,),
             )
             for dep_row in dep_rows:
-                unit_file, unit_type = unit_cache.details(dep_row["unit"])
+                unit_file, unit_type = unit_cache.details(unit)
 
                 try:
                     prerequisite_file, prerequisite_type = unit_cache.details(
@@ -547,7 +1349,7 @@ class FortranDependencies(object):
                 except DatabaseException:
                     raise DatabaseException(
                         "Unable to find prerequisite "
-                        f"'{dep_row['prerequisite']}' of '{dep_row['unit']}'"
+                        f"'{dep_row['prerequisite']}' of '{unit}'"
                     )
 
                 units.append(dep_row["prerequisite"])
@@ -568,10 +1370,12 @@ class SubmoduleCache:
     def __init__(self, database: SQLiteDatabase):
         self.__cache: Dict[str, List[str]] = defaultdict(list)
         sub_rows = database.query(
-            "SELECT u.prerequisite AS module, u.unit AS submodule "
-            "FROM fortran_unit_dependency AS u, fortran_program_unit AS s "
-            "WHERE u.unit=s.unit "
-            "AND u.type='compile' "
+            "SELECT module.name AS module, submodule.name AS submodule "
+            "FROM fortran_unit_dependency AS u "
+            "JOIN fortran_program_unit AS s ON s.unit = u.unit "
+            "JOIN fortran_unit_name AS module ON module.id = u.prerequisite "
+            "JOIN fortran_unit_name AS submodule ON submodule.id = u.unit "
+            "WHERE u.type='compile' "
             "AND s.type='submodule'"
         )
         for sub_row in sub_rows:
@@ -592,10 +1396,9 @@ class UnitCache:
     def details(self, unit: str):
         if unit not in self.__cache:
             unit_rows = self.__database.query(
-                "SELECT file, type FROM fortran_program_unit "
-                f"WHERE unit='{unit}'"
+                _PROGRAM_UNITS + " WHERE name.name=?", (unit,)
             )
             if not unit_rows:
                 raise DatabaseException(f"Unable to find unit '{unit}'")
-            self.__cache[unit] = unit_rows[0]
+            self.__cache[unit] = (unit_rows[0]["file"], unit_rows[0]["type"])
         return self.__cache[unit]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Identify the inputs which determine the result of analysing a source file.
+
+If none of them have changed since the file was last analysed then there is
+no need to analyse it again. File modification times are not trustworthy for
+this as copying a tree resets them.
+"""
+
+import hashlib
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+_INCLUDE_PATTERN = re.compile(
+    r'^[ \t]*#[ \t]*include[ \t]*["<]([^">]+)[">]', flags=re.MULTILINE
+)
+
+
+@dataclass(frozen=True)
+class SourceFingerprint:
+    """
+    Everything which may affect the analysis of a source file.
+
+    Inputs map the name of each file read alongside the source, such as
+    inclusions, to the hash of its content.
+    """
+
+    content_hash: str
+    macros: str
+    include_paths: str
+    inputs: Dict[str, str] = field(default_factory=dict)
+
+
+def hash_file(filename: Path) -> str:
+    """
+    Gets a digest of a file's content.
+
+    @param filename: File to hash.
+    @return: Hexadecimal digest or an empty string if the file is missing.
+    """
+    try:
+        return hashlib.sha256(filename.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+def canonical_macros(macros: Dict[str, Optional[str]]) -> str:
+    """
+    Renders preprocessor macros in a form independent of definition order.
+    """
+    return "\n".join(
+        name if value is None else f"{name}={value}"
+        for name, value in sorted(macros.items())
+    )
+
+
+def canonical_include_paths(include_paths: Iterable[Path]) -> str:
+    """
+    Renders include paths. Their order matters so it is preserved.
+    """
+    return "\n".join(str(path) for path in include_paths)
+
+
+def find_inclusions(
+    source_filename: Path, include_paths: List[Path]
+) -> List[Path]:
+    """
+    Finds the files brought in by "#include" directives.
+
+    Inclusions are followed recursively. Those which cannot be found, for
+    instance system headers, or which are named by a macro are not returned.
+
+    @param source_filename: File to start from.
+    @param include_paths: Directories searched after that of the including
+                          file.
+    @return: Included files in the order first encountered.
+    """
+    found: List[Path] = []
+    candidates = [source_filename]
+    while candidates:
+        including = candidates.pop(0)
+        try:
+            text = including.read_text(errors="replace")
+        except FileNotFoundError:
+            continue
+        for match in _INCLUDE_PATTERN.finditer(text):
+            for directory in [including.parent, *include_paths]:
+                included = directory / match.group(1)
+                if included.is_file():
+                    if included not in found:
+                        found.append(included)
+                        candidates.append(included)
+                    break
+    return found
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Compute transitive closures over a whole dependency graph at once.
+
+Programs in an application, and unit test executables in particular, share
+most of their prerequisites. Rather than walking the graph afresh for each
+program it is loaded once, condensed into strongly connected components and
+the closure of each component is worked out exactly once.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class DependencyGraph:
+    """
+    Directed graph of units with memoised reachability.
+
+    Closures are held as integer bit sets, one bit per unit, so that merging
+    the closures of shared subgraphs is a single bitwise "or".
+    """
+
+    def __init__(self, edges: Iterable[Tuple[str, str]]):
+        """
+        @param edges: Unit and prerequisite pairs. Duplicates are harmless.
+        """
+        self.__index: Dict[str, int] = {}
+        self.__units: List[str] = []
+        self.__successors: List[Set[int]] = []
+        for unit, prerequisite in edges:
+            self.__successors[self.__intern(unit)].add(
+                self.__intern(prerequisite)
+            )
+
+        self.__component: List[int] = []
+        self.__closure: List[int] = []
+        self.__condense()
+
+    def __intern(self, unit: str) -> int:
+        index = self.__index.get(unit)
+        if index is None:
+            index = len(self.__units)
+            self.__index[unit] = index
+            self.__units.append(unit)
+            self.__successors.append(set())
+        return index
+
+    def __condense(self) -> None:
+        """
+        Finds strongly connected components using Tarjan's algorithm and
+        computes the closure of each as it is completed.
+
+        Tarjan completes components in reverse topological order so the
+        closure of every successor component is known by the time it is
+        needed. The search is iterative as module chains in a large
+        application can be deeper than Python's recursion limit.
+        """
+        count = len(self.__units)
+        order = [-1] * count
+        low_link = [0] * count
+        on_stack = [False] * count
+        stack: List[int] = []
+        self.__component = [-1] * count
+        next_order = 0
+
+        for start in range(count):
+            if order[start] != -1:
+                continue
+            work = [(start, iter(self.__successors[start]))]
+            order[start] = low_link[start] = next_order
+            next_order += 1
+            stack.append(start)
+            on_stack[start] = True
+            while work:
+                node, successors = work[-1]
+                for successor in successors:
+                    if order[successor] == -1:
+                        order[successor] = low_link[successor] = next_order
+                        next_order += 1
+                        stack.append(successor)
+                        on_stack[successor] = True
+                        work.append(
+                            (successor, iter(self.__successors[successor]))
+                        )
+                        break
+                    if on_stack[successor]:
+                        low_link[node] = min(low_link[node], order[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low_link[parent] = min(low_link[parent],
+                                               low_link[node])
+                    if low_link[node] == order[node]:
+                        self.__complete_component(node, stack, on_stack)
+
+    def __complete_component(
+        self, root: int, stack: List[int], on_stack: List[bool]
+    ) -> None:
+        component = len(self.__closure)
+        members: List[int] = []
+        while True:
+            member = stack.pop()
+            on_stack[member] = False
+            self.__component[member] = component
+            members.append(member)
+            if member == root:
+                break
+
+        closure = 0
+        for member in members:
+            closure |= 1 << member
+        for member in members:
+            for successor in self.__successors[member]:
+                successor_component = self.__component[successor]
+                if successor_component != component:
+                    closure |= self.__closure[successor_component]
+        self.__closure.append(closure)
+
+    def __contains__(self, unit: str) -> bool:
+        return unit in self.__index
+
+    def prerequisites(self, unit: str) -> List[str]:
+        """
+        Gets the immediate prerequisites of a unit.
+
+        @param unit: Unit of interest.
+        @return: Prerequisite names, sorted.
+        """
+        if unit not in self.__index:
+            return []
+        return sorted(
+            self.__units[index]
+            for index in self.__successors[self.__index[unit]]
+        )
+
+    def closure(self, unit: str) -> Set[str]:
+        """
+        Gets every unit reachable from a unit, not including itself.
+
+        @param unit: Unit of interest.
+        @return: Unit names.
+        """
+        if unit not in self.__index:
+            return set()
+        index = self.__index[unit]
+        mask = self.__closure[self.__component[index]] & ~(1 << index)
+        result: Set[str] = set()
+        while mask:
+            lowest = mask & -mask
+            result.add(self.__units[lowest.bit_length() - 1])
+            mask ^= lowest
+        return result
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Gather timings and counts from the dependency tools.
+
+Each phase of work, such as preprocessing a file or querying the database,
+records how long it took, optionally naming what it worked on. Counters note
+how often things happen. Everything is gathered in memory by the process and
+may be written out as JSON when the tool finishes, giving a summary of each
+phase with a histogram of durations and the slowest subjects.
+
+Worker processes gather their own metrics which are merged back into those
+of the process which started them.
+"""
+
+import json
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from time import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds, in seconds, of the histogram buckets. Anything longer falls
+# in a final, unbounded, bucket.
+#
+HISTOGRAM_BOUNDS = (0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+# Number of slowest subjects reported for each phase.
+#
+DEFAULT_SLOWEST = 10
+
+
+class Metrics:
+    """
+    Timings and counts gathered by a process.
+    """
+
+    def __init__(self) -> None:
+        self.__durations: Dict[str, List[float]] = defaultdict(list)
+        self.__subjects: Dict[str, List[Tuple[float, str]]] = defaultdict(
+            list
+        )
+        self.__counters: Dict[str, int] = defaultdict(int)
+
+    def clear(self) -> None:
+        """
+        Forgets everything gathered so far.
+        """
+        self.__durations.clear()
+        self.__subjects.clear()
+        self.__counters.clear()
+
+    def record(
+        self, phase: str, seconds: float, subject: Optional[object] = None
+    ) -> None:
+        """
+        Notes how long a phase of work took.
+
+        @param phase: Name of the phase.
+        @param seconds: Time taken.
+        @param subject: What was worked on, such as a source file.
+        """
+        self.__durations[phase].append(seconds)
+        if subject is not None:
+            self.__subjects[phase].append((seconds, str(subject)))
+
+    @contextmanager
+    def timer(
+        self, phase: str, subject: Optional[object] = None
+    ) -> Iterator[None]:
+        """
+        Records how long the enclosed block takes, even if it fails.
+
+        @param phase: Name of the phase.
+        @param subject: What was worked on, such as a source file.
+        """
+        start_time = time()
+        try:
+            yield
+        finally:
+            self.record(phase, time() - start_time, subject)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """
+        Adds to a counter.
+
+        @param counter: Name of the counter.
+        @param amount: Added to the count.
+        """
+        self.__counters[counter] += amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Gets everything gathered as plain data, suitable for sending between
+        processes.
+        """
+        return {
+            "durations": dict(self.__durations),
+            "subjects": dict(self.__subjects),
+            "counters": dict(self.__counters),
+        }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Adds metrics gathered elsewhere to these.
+
+        @param snapshot: As returned by snapshot().
+        """
+        for phase, durations in snapshot["durations"].items():
+            self.__durations[phase].extend(durations)
+        for phase, subjects in snapshot["subjects"].items():
+            self.__subjects[phase].extend(
+                (seconds, subject) for seconds, subject in subjects
+            )
+        for counter, amount in snapshot["counters"].items():
+            self.__counters[counter] += amount
+
+    def report(self, slowest: int = DEFAULT_SLOWEST) -> Dict[str, Any]:
+        """
+        Summarises everything gathered.
+
+        @param slowest: Number of slowest subjects to list for each phase.
+        @return: Summary suitable for writing as JSON.
+        """
+        phases: Dict[str, Any] = {}
+        for phase, durations in sorted(self.__durations.items()):
+            histogram = {f"{bound:g}": 0 for bound in HISTOGRAM_BOUNDS}
+            histogram["inf"] = 0
+            for seconds in durations:
+                for bound in HISTOGRAM_BOUNDS:
+                    if seconds <= bound:
+                        histogram[f"{bound:g}"] += 1
+                        break
+                else:
+                    histogram["inf"] += 1
+            summary: Dict[str, Any] = {
+                "count": len(durations),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations),
+                "histogram": histogram,
+            }
+            if phase in self.__subjects:
+                summary["slowest"] = [
+                    {"subject": subject, "seconds": seconds}
+                    for seconds, subject in sorted(
+                        self.__subjects[phase], key=lambda each: -each[0]
+                    )[:slowest]
+                ]
+            phases[phase] = summary
+        return {
+            "phases": phases,
+            "counters": dict(sorted(self.__counters.items())),
+        }
+
+    def write(self, filename: Path, slowest: int = DEFAULT_SLOWEST) -> None:
+        """
+        Writes a summary of everything gathered as JSON.
+
+        @param filename: File to write.
+        @param slowest: Number of slowest subjects to list for each phase.
+        """
+        with filename.open("wt") as handle:
+            json.dump(self.report(slowest), handle, indent=2)
+            handle.write("\n")
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """
+    Gets the metrics gathered by this process.
+    """
+    return _metrics
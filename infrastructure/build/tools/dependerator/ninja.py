@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Describe a Fortran build as a Ninja build file.
+
+The file holds everything needed to compile and link the programs in the
+dependency database. Compiler, flags and libraries are supplied as Ninja
+variables, see BUILD_VARIABLES, so the file is independent of any particular
+tool chain.
+"""
+
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from dependerator.process import FortranProcessor
+
+# Variables used by the generated rules, with what each should hold.
+#
+BUILD_VARIABLES = (
+    ("fc", "Fortran compiler"),
+    ("fflags", "Fortran compiler flags"),
+    ("module_args", "Arguments telling the compiler where modules go"),
+    ("include_args", "Include path arguments"),
+    ("macro_args", "Preprocessor macro arguments, used for .F90 files"),
+    ("linker", "Program linker"),
+    ("ldflags", "Linker flags"),
+    ("libraries", "Library arguments, placed after the objects"),
+)
+
+_RULES = """\
+rule fortran_compile
+  command = $fc $fflags $module_args $include_args -c -o $out $in
+  description = Compile $in
+  restat = 1
+
+rule fortran_preprocess_compile
+  command = $fc $fflags $module_args $include_args $macro_args -c -o $out $in
+  description = Pre-process and compile $in
+  restat = 1
+
+rule fortran_link
+  command = $linker $ldflags -o $out $in $libraries
+  description = Linking $out
+"""
+
+
+def escape_value(value: str) -> str:
+    """
+    Escapes text for use as a Ninja variable value.
+
+    @param value: Raw text.
+    @return: Text with Ninja's special character escaped.
+    """
+    return value.replace("$", "$$")
+
+
+def escape_path(path: Path) -> str:
+    """
+    Escapes a filename for use in a Ninja build statement.
+
+    @param path: Filename.
+    @return: Filename with Ninja's special characters escaped.
+    """
+    return (
+        str(path).replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+    )
+
+
+def _paths(paths: Iterable[Path]) -> str:
+    return " ".join(escape_path(path) for path in paths)
+
+
+def ninja_build(
+    processor: FortranProcessor,
+    binary_directory: Path,
+    object_modules: bool = False,
+    variables: Iterable[Tuple[str, str]] = (),
+) -> str:
+    """
+    Generates a Ninja build file.
+
+    Compiling a source file produces its object file and, as implicit
+    outputs, the module files of any modules it holds. Compilers generally
+    leave a module file alone if it has not changed so rules are marked to
+    have their outputs' timestamps checked again. Files which use an
+    unchanged module are then not compiled again.
+
+    Every program is linked from its object and those of all the units it
+    needs. Programs are the default targets.
+
+    @param processor: Source of dependency information.
+    @param binary_directory: Programs are put here.
+    @param object_modules: Whether the compiler stores module information in
+                           object files.
+    @param variables: Name and value pairs to define at the top of the file.
+    @return: Build file content.
+    """
+    lines: List[str] = [
+        "# Generated from the dependency database",
+        "ninja_required_version = 1.7",
+        "",
+    ]
+    for name, value in variables:
+        lines.append(f"{name} = {escape_value(value)}")
+    lines.append("")
+    lines.append(_RULES)
+
+    for source, object_file, modules, prerequisites in (
+        processor.determine_compile_edges(object_modules)
+    ):
+        rule = (
+            "fortran_preprocess_compile"
+            if source.suffix == ".F90"
+            else "fortran_compile"
+        )
+        statement = f"build {escape_path(object_file)}"
+        if modules:
+            statement += f" | {_paths(modules)}"
+        statement += f": {rule} {escape_path(source)}"
+        if prerequisites:
+            statement += f" | {_paths(prerequisites)}"
+        lines.append(statement)
+    lines.append("")
+
+    programs: List[Path] = []
+    for program, root_object, objects in (
+        processor.determine_link_dependencies()
+    ):
+        executable = binary_directory / program.name
+        programs.append(executable)
+        link_objects = [root_object]
+        link_objects.extend(
+            path for path in objects if path != root_object
+        )
+        lines.append(
+            f"build {escape_path(executable)}: fortran_link "
+            + _paths(link_objects)
+        )
+    lines.append("")
+
+    if programs:
+        lines.append(f"default {_paths(programs)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Work out how much of a build may run in parallel.
+
+A file cannot be compiled until the modules it uses have been, so long
+chains of modules limit how many compilers may usefully run at once however
+many processors there are. The longest such chain, weighted by how long each
+file takes to compile, is the critical path. No build can be quicker than it.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from dependerator.graph import DependencyGraph
+
+# Matches the lines the build system has "/usr/bin/time" write after each
+# compile, as understood by "bin/process_compiler_metrics".
+#
+_COMPILED_PATTERN = re.compile(
+    r"^Compiled (?P<file>.+?): Wallclock=(?P<time>[0-9:.]+), "
+    r"Highwater=(?P<memory>[0-9]+)"
+)
+
+
+def parse_wallclock(text: str) -> float:
+    """
+    Converts "[hours:]minutes:seconds" to seconds.
+
+    @param text: Elapsed time as written by "/usr/bin/time".
+    @return: Seconds.
+    """
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_compile_times(lines: Iterable[str]) -> Dict[Path, float]:
+    """
+    Harvests the time taken to compile each file from a build log.
+
+    Lines which do not match, including those mangled by parallel compiles
+    writing over each other, are ignored. Should a file appear more than once
+    the last time is used.
+
+    @param lines: Build log.
+    @return: Source filename mapped to seconds.
+    """
+    times: Dict[Path, float] = {}
+    for line in lines:
+        match = _COMPILED_PATTERN.match(line)
+        if match is None:
+            continue
+        try:
+            seconds = parse_wallclock(match.group("time"))
+        except ValueError:
+            continue
+        times[Path(os.path.normpath(match.group("file")))] = seconds
+    return times
+
+
+@dataclass
+class CriticalStep:
+    """
+    A file on the critical path.
+
+    Finish is when, at the earliest, its compilation can be finished.
+    Dependants counts the files which cannot be compiled until it is.
+    """
+
+    source: Path
+    weight: float
+    finish: float
+    dependants: int
+
+
+@dataclass
+class ParallelismReport:
+    """
+    Shape of the compile dependency graph.
+
+    Levels hold the number of files at each depth. Files at depth zero
+    need nothing else to be compiled first, those at depth one need only
+    files at depth zero and so on.
+
+    Work is the total weight of every file while span is the weight of the
+    critical path. Their ratio is the most parallelism that could ever be
+    achieved.
+    """
+
+    weighting: str
+    files: int
+    levels: List[int]
+    work: float
+    span: float
+    critical_path: List[CriticalStep] = field(default_factory=list)
+    unweighted: int = 0
+
+    @property
+    def parallelism(self) -> float:
+        return self.work / self.span if self.span else 0.0
+
+    def to_dict(self) -> Dict:
+        """
+        Gets the report in a form suitable for serialising.
+        """
+        return {
+            "weighting": self.weighting,
+            "files": self.files,
+            "depth": len(self.levels),
+            "levels": self.levels,
+            "work": self.work,
+            "span": self.span,
+            "parallelism": self.parallelism,
+            "unweighted": self.unweighted,
+            "critical_path": [
+                {
+                    "file": str(step.source),
+                    "weight": step.weight,
+                    "finish": step.finish,
+                    "dependants": step.dependants,
+                }
+                for step in self.critical_path
+            ],
+        }
+
+    def split_candidates(self, count: int) -> List[CriticalStep]:
+        """
+        Suggests files to split in order to shorten the critical path.
+
+        Heavy files on the path with many dependants are the most promising
+        since moving part of them out of the way lets the most work start
+        sooner.
+
+        @param count: Most candidates to return.
+        @return: Candidates, most promising first.
+        """
+        return sorted(
+            self.critical_path,
+            key=lambda step: (-step.weight * (step.dependants + 1),
+                              str(step.source)),
+        )[:count]
+
+    def format(self, candidates: int = 10) -> str:
+        """
+        Describes the report in human readable form.
+
+        @param candidates: Number of split candidates to list.
+        @return: Text of the report.
+        """
+        unit = "s" if self.weighting == "seconds" else ""
+        lines = [
+            f"Files compiled: {self.files}",
+            f"Depth: {len(self.levels)} levels",
+            "Width by level: "
+            + " ".join(
+                f"{level}:{width}" for level, width in enumerate(self.levels)
+            ),
+            f"Total work: {self.work:.2f}{unit}",
+            f"Critical path: {self.span:.2f}{unit} "
+            f"through {len(self.critical_path)} files",
+            f"Average parallelism: {self.parallelism:.2f}",
+        ]
+        if self.unweighted:
+            lines.append(
+                f"Files without a compile time, given the average: "
+                f"{self.unweighted}"
+            )
+        lines.append("")
+        lines.append("Critical path:")
+        for step in self.critical_path:
+            lines.append(
+                f"  {step.finish:10.2f}{unit} {step.weight:8.2f}{unit} "
+                f"{step.dependants:6d} dependants  {step.source}"
+            )
+        lines.append("")
+        lines.append("Candidates for splitting:")
+        for step in self.split_candidates(candidates):
+            lines.append(
+                f"  {step.weight:8.2f}{unit} {step.dependants:6d} dependants"
+                f"  {step.source}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+def analyse_parallelism(
+    edges: Iterable[Tuple[Path, Path, List[Path], List[Path]]],
+    times: Optional[Dict[Path, float]] = None,
+) -> ParallelismReport:
+    """
+    Examines the compile dependency graph.
+
+    Without compile times every file is given a weight of one so the
+    critical path is the longest chain of files. With them, files missing
+    a time are given the average of those which have one.
+
+    Dependencies which would complete a cycle are ignored, as make does.
+
+    @param edges: Source file, object file, module files and prerequisite
+                  files, as from FortranProcessor.determine_compile_edges.
+    @param times: Source filename mapped to seconds taken to compile.
+    @return: The report.
+    """
+    edges = list(edges)
+    producers: Dict[Path, Path] = {}
+    for source, object_file, modules, _ in edges:
+        producers[object_file] = source
+        for module in modules:
+            producers[module] = source
+
+    sources = [source for source, _, _, _ in edges]
+    prerequisites: Dict[Path, List[Path]] = {}
+    for source, _, _, needs in edges:
+        prerequisites[source] = sorted(
+            {producers[need] for need in needs if need in producers}
+            - {source},
+            key=str,
+        )
+
+    weights: Dict[Path, float] = {}
+    unweighted = 0
+    if times:
+        known = {Path(os.path.normpath(name)): time
+                 for name, time in times.items()}
+        matched = [known[source] for source in sources if source in known]
+        average = sum(matched) / len(matched) if matched else 1.0
+        for source in sources:
+            if source in known:
+                weights[source] = known[source]
+            else:
+                weights[source] = average
+                unweighted += 1
+    else:
+        weights = {source: 1.0 for source in sources}
+
+    depth, finish, critical = _schedule(sources, prerequisites, weights)
+
+    levels = [0] * (max(depth.values()) + 1 if depth else 0)
+    for level in depth.values():
+        levels[level] += 1
+
+    dependants = DependencyGraph(
+        (str(prerequisite), str(source))
+        for source in sources
+        for prerequisite in prerequisites[source]
+    )
+    path: List[CriticalStep] = []
+    step = max(sources, key=lambda source: (finish[source], str(source)),
+               default=None)
+    while step is not None:
+        path.append(
+            CriticalStep(
+                step, weights[step], finish[step],
+                len(dependants.closure(str(step))),
+            )
+        )
+        step = critical[step]
+    path.reverse()
+
+    return ParallelismReport(
+        weighting="seconds" if times else "files",
+        files=len(sources),
+        levels=levels,
+        work=sum(weights.values()),
+        span=max(finish.values(), default=0.0),
+        critical_path=path,
+        unweighted=unweighted,
+    )
+
+
+def _schedule(
+    sources: List[Path],
+    prerequisites: Dict[Path, List[Path]],
+    weights: Dict[Path, float],
+) -> Tuple[Dict[Path, int], Dict[Path, float], Dict[Path, Optional[Path]]]:
+    """
+    Finds the depth and earliest finish of every file along with the
+    prerequisite which determines it.
+
+    The search is iterative as chains may be long. An edge to a file still
+    being searched would complete a cycle and is skipped.
+    """
+    depth: Dict[Path, int] = {}
+    finish: Dict[Path, float] = {}
+    critical: Dict[Path, Optional[Path]] = {}
+    active: Set[Path] = set()
+
+    for start in sources:
+        if start in finish:
+            continue
+        work = [(start, iter(prerequisites[start]))]
+        active.add(start)
+        while work:
+            node, remaining = work[-1]
+            for prerequisite in remaining:
+                if prerequisite not in finish and prerequisite not in active:
+                    active.add(prerequisite)
+                    work.append(
+                        (prerequisite, iter(prerequisites[prerequisite]))
+                    )
+                    break
+            else:
+                work.pop()
+                active.discard(node)
+                done = [
+                    prerequisite
+                    for prerequisite in prerequisites[node]
+                    if prerequisite in finish
+                ]
+                depth[node] = max(
+                    (depth[prerequisite] + 1 for prerequisite in done),
+                    default=0,
+                )
+                slowest = max(
+                    done,
+                    key=lambda prerequisite: (finish[prerequisite],
+                                              str(prerequisite)),
+                    default=None,
+                )
+                critical[node] = slowest
+                finish[node] = weights[node] + (
+                    finish[slowest] if slowest is not None else 0.0
+                )
+    return depth, finish, critical
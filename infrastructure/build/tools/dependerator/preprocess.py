@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Run the Fortran preprocessor, optionally reusing earlier output.
+
+Preprocessor output is entirely determined by the command used, the source
+file and the files it includes. Output is cached on disk keyed on a hash of
+all of these so that a second request for the same thing needs no new
+process. Only the content of files is used, not where they are, so working
+copies of the same source share output. The cache is bounded in size, the
+least recently used entries being evicted first.
+
+For dependency analysis a subset of preprocessing may instead be performed
+in-process, falling back to the real preprocessor where that subset is
+exceeded.
+"""
+
+import logging
+import re
+import subprocess
+from pathlib import Path
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dependerator.cache import DirectoryCache
+from dependerator.fingerprint import find_inclusions, hash_file
+from dependerator.metrics import get_metrics
+
+
+class PreprocessorCache(DirectoryCache):
+    """
+    Directory of preprocessor output.
+    """
+
+    entry_suffix = ".fpp"
+
+    @classmethod
+    def key(
+        cls, flags: List[str], source_filename: Path, inputs: Dict[str, str]
+    ) -> str:
+        """
+        Computes the key under which output is stored.
+
+        @param flags: Preprocessor command without the source or include
+                      directories. What the latter contribute is captured
+                      by the inclusions.
+        @param source_filename: File being preprocessed.
+        @param inputs: Map of included filename to content hash. Files are
+                       identified by name alone.
+        @return: Hexadecimal digest.
+        """
+        return cls.hash_description(
+            {
+                "flags": flags,
+                "source": hash_file(source_filename),
+                "inputs": sorted(
+                    (Path(name).name, digest)
+                    for name, digest in inputs.items()
+                ),
+            }
+        )
+
+
+def split_include_paths(command: List[str]) -> Tuple[List[str], List[Path]]:
+    """
+    Separates include directories from the rest of a command.
+
+    @param command: Preprocessor command.
+    @return: Remaining arguments, in order, and the include directories.
+    """
+    rest: List[str] = []
+    include_paths: List[Path] = []
+    arguments = iter(command)
+    for argument in arguments:
+        if argument == "-I":
+            include_paths.append(Path(next(arguments, "")))
+        elif argument.startswith("-I"):
+            include_paths.append(Path(argument[2:]))
+        else:
+            rest.append(argument)
+    return rest, include_paths
+
+
+class Preprocessor:
+    """
+    Runs a Fortran preprocessor over source files.
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        include_paths: Optional[List[Path]] = None,
+        macros: Optional[Dict[str, Optional[str]]] = None,
+        cache: Optional[PreprocessorCache] = None,
+    ):
+        """
+        @param command: Preprocessor and any arguments it always needs. It
+                        is run as given, any "-I" arguments it has are
+                        also searched for inclusions.
+        @param include_paths: Further directories to search for inclusions.
+        @param macros: Macro name is the key. Value may be None for empty
+                       macros.
+        @param cache: Where to reuse output from, if anywhere.
+        """
+        self.__cache = cache
+
+        self.__command = list(command)
+        for path in include_paths or []:
+            self.__command.append("-I" + str(path))
+        for name, macro in (macros or {}).items():
+            if macro:
+                self.__command.append(f"-D{name}={macro}")
+            else:
+                self.__command.append("-D" + name)
+        self.__flags, self.__include_paths = split_include_paths(
+            self.__command
+        )
+
+    def preprocess(
+        self, source_filename: Path, inputs: Optional[List[Path]] = None
+    ) -> str:
+        """
+        Preprocesses a source file.
+
+        @param source_filename: File to preprocess.
+        @param inputs: Files the source includes, if already known.
+        @return: Preprocessed source.
+        """
+        logger = logging.getLogger(__name__)
+
+        command = self.__command + [str(source_filename)]
+        logger.debug(command)
+
+        key = None
+        if self.__cache is not None:
+            if inputs is None:
+                inputs = find_inclusions(source_filename, self.__include_paths)
+            key = self.__cache.key(
+                self.__flags,
+                source_filename,
+                {str(path): hash_file(path) for path in inputs},
+            )
+            cached = self.__cache.fetch(key)
+            if cached is not None:
+                logger.debug(f"Reusing preprocessed {source_filename}")
+                get_metrics().count("preprocess cache hits")
+                return cached
+
+        start_time = time()
+        preprocessor = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        processed_source, errors = preprocessor.communicate()
+
+        elapsed = time() - start_time
+        get_metrics().record("preprocess", elapsed, source_filename)
+        logger.debug("Time to preprocess Fortran source: " + str(elapsed))
+        if preprocessor.returncode:
+            logger.error(errors)
+            raise subprocess.CalledProcessError(
+                preprocessor.returncode, " ".join(command)
+            )
+
+        if self.__cache is not None and key is not None:
+            self.__cache.store(key, processed_source)
+        return processed_source
+
+
+class UnsupportedConstruct(Exception):
+    """
+    Raised when the built-in preprocessor meets something it cannot handle.
+    """
+
+
+# Tokens of a conditional directive's expression.
+#
+_EXPRESSION_TOKEN = re.compile(
+    r"\s*(?:(0[xX][0-9a-fA-F]+|\d+)[uUlL]*"
+    r"|([A-Za-z_]\w*)"
+    r"|(&&|\|\||==|!=|<=|>=|<<|>>|[-+*/%<>!~^&|()]))"
+)
+
+# Binary operators by precedence, loosest binding first.
+#
+_BINARY_OPERATORS: List[Dict[str, Callable[[int, int], int]]] = [
+    {"||": lambda a, b: int(bool(a) or bool(b))},
+    {"&&": lambda a, b: int(bool(a) and bool(b))},
+    {"|": lambda a, b: a | b},
+    {"^": lambda a, b: a ^ b},
+    {"&": lambda a, b: a & b},
+    {"==": lambda a, b: int(a == b), "!=": lambda a, b: int(a != b)},
+    {
+        "<": lambda a, b: int(a < b),
+        ">": lambda a, b: int(a > b),
+        "<=": lambda a, b: int(a <= b),
+        ">=": lambda a, b: int(a >= b),
+    },
+    {"<<": lambda a, b: a << b, ">>": lambda a, b: a >> b},
+    {"+": lambda a, b: a + b, "-": lambda a, b: a - b},
+    {
+        "*": lambda a, b: a * b,
+        "/": lambda a, b: int(a / b),
+        "%": lambda a, b: a - b * int(a / b),
+    },
+]
+
+_DIRECTIVE = re.compile(r"^\s*#\s*(\w*)(.*)$")
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+_INCLUSION = re.compile(r'^\s*(?:"([^"]+)"|<([^>]+)>)\s*$')
+_MACRO_DEFINITION = re.compile(r"^\s*([A-Za-z_]\w*)(\()?\s*(.*)$")
+
+# Deepest nesting of inclusions and macro expansions followed.
+#
+_MAXIMUM_DEPTH = 64
+
+
+def _is_reserved(name: str) -> bool:
+    """
+    Reserved names are likely predefined by the real preprocessor or
+    compiler so their state cannot be known here.
+    """
+    return name.startswith("__") or (
+        len(name) > 1 and name[0] == "_" and name[1].isupper()
+    )
+
+
+def _parse_integer(token: str) -> int:
+    """
+    Converts a C integer literal, stripped of suffixes, to a value.
+    """
+    if token.startswith(("0x", "0X")):
+        return int(token, 16)
+    if len(token) > 1 and token.startswith("0"):
+        return int(token, 8)
+    return int(token)
+
+
+class _Conditional:
+    """
+    State of one level of "#if" nesting.
+    """
+
+    def __init__(self, enclosing_active: bool, condition: bool):
+        self.enclosing_active = enclosing_active
+        self.taken = condition
+        self.active = enclosing_active and condition
+        self.seen_else = False
+
+
+class BuiltinPreprocessor:
+    """
+    Preprocesses source in-process, handling only what dependency analysis
+    needs.
+
+    That is inclusion, object-like macros and conditional compilation. On
+    meeting anything else, such as function-like macros or names the
+    compiler might predefine, the whole file is handed to a fallback
+    preprocessor instead.
+    """
+
+    def __init__(
+        self,
+        include_paths: Optional[List[Path]] = None,
+        macros: Optional[Dict[str, Optional[str]]] = None,
+        fallback: Optional[Preprocessor] = None,
+    ):
+        """
+        @param include_paths: Directories to search for inclusions.
+        @param macros: Macro name is the key. Value may be None for empty
+                       macros, these are defined as "1" as the real
+                       preprocessor does.
+        @param fallback: Used for files this one cannot handle. If not
+                         given UnsupportedConstruct is raised instead.
+        """
+        self.__include_paths = include_paths or []
+        self.__initial_macros = {
+            name: "1" if value is None else value
+            for name, value in (macros or {}).items()
+        }
+        self.__fallback = fallback
+
+    def preprocess(
+        self, source_filename: Path, inputs: Optional[List[Path]] = None
+    ) -> str:
+        """
+        Preprocesses a source file.
+
+        @param source_filename: File to preprocess.
+        @param inputs: Files the source includes, if already known. Only
+                       used by the fallback.
+        @return: Preprocessed source.
+        """
+        logger = logging.getLogger(__name__)
+        start_time = time()
+        try:
+            lines: List[str] = []
+            macros = dict(self.__initial_macros)
+            self.__process(source_filename, macros, lines, 0)
+        except UnsupportedConstruct as ex:
+            if self.__fallback is None:
+                raise
+            logger.info(f"  Falling back to preprocessor: {ex}")
+            get_metrics().count("preprocessor fallbacks")
+            return self.__fallback.preprocess(source_filename, inputs)
+        elapsed = time() - start_time
+        get_metrics().record("preprocess", elapsed, source_filename)
+        logger.debug(
+            "Time to preprocess Fortran source in-process: " + str(elapsed)
+        )
+        return "\n".join(lines) + "\n"
+
+    def __process(
+        self,
+        filename: Path,
+        macros: Dict[str, str],
+        output: List[str],
+        depth: int,
+    ) -> None:
+        """
+        Appends the preprocessed content of a file to the output.
+        """
+        if depth > _MAXIMUM_DEPTH:
+            raise UnsupportedConstruct(f"Inclusions too deep at {filename}")
+        try:
+            text = filename.read_text()
+        except (FileNotFoundError, UnicodeDecodeError) as ex:
+            raise UnsupportedConstruct(f"Unable to read {filename}: {ex}")
+
+        conditionals: List[_Conditional] = []
+        physical_lines = iter(text.splitlines())
+        for line in physical_lines:
+            directive = _DIRECTIVE.match(line)
+            if directive is None:
+                if not conditionals or conditionals[-1].active:
+                    output.append(self.__expand_line(line, macros))
+                continue
+
+            while line.endswith("\\"):
+                line = line[:-1] + next(physical_lines, "")
+                directive = _DIRECTIVE.match(line)
+                assert directive is not None
+            name = directive.group(1)
+            argument = self.__strip_comments(directive.group(2))
+            active = not conditionals or conditionals[-1].active
+
+            if name in ("if", "ifdef", "ifndef"):
+                condition = False
+                if active:
+                    if name == "if":
+                        condition = self.__evaluate(argument, macros) != 0
+                    else:
+                        condition = self.__is_defined(argument.strip(), macros)
+                        if name == "ifndef":
+                            condition = not condition
+                conditionals.append(_Conditional(active, condition))
+            elif name == "elif":
+                if not conditionals or conditionals[-1].seen_else:
+                    raise UnsupportedConstruct(f"Misplaced #elif {filename}")
+                state = conditionals[-1]
+                if state.taken or not state.enclosing_active:
+                    state.active = False
+                else:
+                    state.active = self.__evaluate(argument, macros) != 0
+                    state.taken = state.active
+            elif name == "else":
+                if not conditionals or conditionals[-1].seen_else:
+                    raise UnsupportedConstruct(f"Misplaced #else {filename}")
+                state = conditionals[-1]
+                state.seen_else = True
+                state.active = state.enclosing_active and not state.taken
+                state.taken = True
+            elif name == "endif":
+                if not conditionals:
+                    raise UnsupportedConstruct(f"Misplaced #endif {filename}")
+                conditionals.pop()
+            elif not active:
+                continue
+            elif name == "define":
+                self.__define(argument, macros)
+            elif name == "undef":
+                macros.pop(argument.strip(), None)
+            elif name == "include":
+                included = self.__find_inclusion(filename, argument, macros)
+                output.append(f'# 1 "{included}"')
+                self.__process(included, macros, output, depth + 1)
+            elif name == "":
+                continue  # The null directive does nothing
+            else:
+                raise UnsupportedConstruct(f"Directive #{name} in {filename}")
+
+        if conditionals:
+            raise UnsupportedConstruct(f"Unterminated #if in {filename}")
+
+    @staticmethod
+    def __strip_comments(text: str) -> str:
+        """
+        Removes C style comments from directives.
+        """
+        while "/*" in text:
+            start = text.index("/*")
+            end = text.find("*/", start + 2)
+            if end < 0:
+                raise UnsupportedConstruct("Multi-line comment in directive")
+            text = text[:start] + " " + text[end + 2:]
+        return text
+
+    @staticmethod
+    def __is_defined(name: str, macros: Dict[str, str]) -> bool:
+        if not _IDENTIFIER.fullmatch(name):
+            raise UnsupportedConstruct(f"Unable to test definition of {name}")
+        if name not in macros and _is_reserved(name):
+            raise UnsupportedConstruct(f"Reserved name {name} tested")
+        return name in macros
+
+    @staticmethod
+    def __define(argument: str, macros: Dict[str, str]) -> None:
+        match = _MACRO_DEFINITION.match(argument)
+        if match is None:
+            raise UnsupportedConstruct(f"Malformed definition {argument}")
+        if match.group(2):
+            raise UnsupportedConstruct(
+                f"Function-like macro {match.group(1)} defined"
+            )
+        macros[match.group(1)] = match.group(3).strip()
+
+    def __find_inclusion(
+        self, including: Path, argument: str, macros: Dict[str, str]
+    ) -> Path:
+        """
+        Finds an included file in the same way as the real preprocessor.
+        """
+        argument = argument.strip()
+        if argument in macros:
+            argument = macros[argument]
+        match = _INCLUSION.match(argument)
+        if match is None:
+            raise UnsupportedConstruct(f"Unable to include {argument}")
+        if match.group(1):
+            directories = [including.parent, *self.__include_paths]
+            name = match.group(1)
+        else:
+            directories = list(self.__include_paths)
+            name = match.group(2)
+        for directory in directories:
+            candidate = directory / name
+            if candidate.is_file():
+                return candidate
+        raise UnsupportedConstruct(f"Inclusion {name} not found")
+
+    @staticmethod
+    def __expand_line(line: str, macros: Dict[str, str]) -> str:
+        """
+        Replaces object-like macros in a line of code.
+        """
+        if not macros:
+            return line
+        for _ in range(_MAXIMUM_DEPTH):
+            changed = False
+
+            def replace(match: re.Match) -> str:
+                nonlocal changed
+                name = match.group(0)
+                if name in macros:
+                    changed = True
+                    return macros[name]
+                return name
+
+            line = _IDENTIFIER.sub(replace, line)
+            if not changed:
+                return line
+        raise UnsupportedConstruct("Recursive macro expansion")
+
+    def __evaluate(self, expression: str, macros: Dict[str, str]) -> int:
+        """
+        Evaluates the expression of a conditional directive.
+        """
+        tokens = self.__expand_expression(
+            self.__tokenise(expression), macros, 0
+        )
+        position = 0
+
+        def peek() -> Optional[str]:
+            return tokens[position] if position < len(tokens) else None
+
+        def take() -> str:
+            nonlocal position
+            if position >= len(tokens):
+                raise UnsupportedConstruct(f"Truncated #if {expression}")
+            position += 1
+            return tokens[position - 1]
+
+        def unary() -> int:
+            token = take()
+            if token == "(":
+                value = binary(0)
+                if take() != ")":
+                    raise UnsupportedConstruct(f"Unbalanced #if {expression}")
+                return value
+            if token == "!":
+                return int(not unary())
+            if token == "~":
+                return ~unary()
+            if token == "-":
+                return -unary()
+            if token == "+":
+                return unary()
+            if token[0].isdigit():
+                return _parse_integer(token)
+            raise UnsupportedConstruct(f"Unexpected {token} in #if")
+
+        def binary(level: int) -> int:
+            if level == len(_BINARY_OPERATORS):
+                return unary()
+            value = binary(level + 1)
+            while peek() in _BINARY_OPERATORS[level]:
+                operator = _BINARY_OPERATORS[level][take()]
+                right = binary(level + 1)
+                try:
+                    value = operator(value, right)
+                except ZeroDivisionError:
+                    raise UnsupportedConstruct("Division by zero in #if")
+            return value
+
+        result = binary(0)
+        if position != len(tokens):
+            raise UnsupportedConstruct(f"Unable to evaluate #if {expression}")
+        return result
+
+    @staticmethod
+    def __tokenise(expression: str) -> List[str]:
+        tokens: List[str] = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = _EXPRESSION_TOKEN.match(expression, position)
+            if match is None:
+                raise UnsupportedConstruct(
+                    f"Unable to evaluate #if {expression}"
+                )
+            tokens.append(match.group(1) or match.group(2) or match.group(3))
+            position = match.end()
+        return tokens
+
+    def __expand_expression(
+        self, tokens: List[str], macros: Dict[str, str], depth: int
+    ) -> List[str]:
+        """
+        Resolves "defined" operators and macros to leave only numbers and
+        operators.
+        """
+        if depth > _MAXIMUM_DEPTH:
+            raise UnsupportedConstruct("Recursive macro expansion")
+        result: List[str] = []
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            index += 1
+            if token == "defined":
+                if tokens[index:index + 1] == ["("]:
+                    if tokens[index + 2:index + 3] != [")"]:
+                        raise UnsupportedConstruct("Malformed defined()")
+                    name = tokens[index + 1]
+                    index += 3
+                elif index < len(tokens):
+                    name = tokens[index]
+                    index += 1
+                else:
+                    raise UnsupportedConstruct("Malformed defined")
+                result.append("1" if self.__is_defined(name, macros) else "0")
+            elif _IDENTIFIER.fullmatch(token):
+                if tokens[index:index + 1] == ["("]:
+                    raise UnsupportedConstruct(f"Macro call {token} in #if")
+                if token in macros:
+                    value = self.__tokenise(macros[token])
+                    if not value:
+                        raise UnsupportedConstruct(f"Empty macro {token}")
+                    result.extend(
+                        self.__expand_expression(value, macros, depth + 1)
+                    )
+                elif _is_reserved(token):
+                    raise UnsupportedConstruct(f"Reserved name {token} used")
+                else:
+                    result.append("0")  # Undefined names are zero
+            else:
+                result.append(token)
+        return result
@@ -7,10 +7,32 @@
 # Process previously analysed dependency database. For fun and profit!
 
 import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import Generator, List, Optional, Set, Tuple
+from typing import Dict, Generator, Iterable, List, Optional, Set, Tuple
 
-from dependerator.database import FileDependencies, FortranDependencies
+from dependerator.database import (
+    DatabaseException,
+    FileDependencies,
+    FortranDependencies,
+)
+from dependerator.graph import DependencyGraph
+from dependerator.metrics import get_metrics
+
+
+###############################################################################
+# What becomes out of date when some program units change.
+#
+@dataclass
+class Impact:
+    units: List[str] = field(default_factory=list)
+    objects: List[Path] = field(default_factory=list)
+    modules: List[Path] = field(default_factory=list)
+    programs: List[str] = field(default_factory=list)
+    suites: List[str] = field(default_factory=list)
+    tests: List[str] = field(default_factory=list)
 
 
 ###############################################################################
@@ -33,112 +55,371 @@ class FortranProcessor:
     ###########################################################################
     # Examine the program unit dependecies and work out the file dependencies.
     #
-    # :param file_store: FileDependencies object to accept computed
+    # Rules are worked out in memory and returned grouped by file, ready to be
+    # written out. They are ordered by file and then by the unit they derive
+    # from.
+    #
+    # A file store may be given to hold a copy of the rules. Only the rules
+    # of units which have changed since it was last updated, or which depend
+    # on units that have, are derived again. The rest are taken from the
+    # store. Everything is derived again if the settings differ from last
+    # time.
+    #
+    # :param file_store: Optional FileDependencies object to cache computed
     #                    dependencies.
     # :param object_modules: Whether the compiler stores module information in
     #                        object files.
+    # :return: List of (filename, [prerequisite filenames]) tuples.
 
     def determine_compile_file_dependencies(
-        self, file_store: FileDependencies, object_modules=False
-    ):
-        logging.getLogger(__name__).info(
-            "Removing old file compile dependencies"
-        )
+        self,
+        file_store: Optional[FileDependencies] = None,
+        object_modules=False,
+    ) -> List[Tuple[Path, List[Path]]]:
+        if not object_modules and self.__module_directory is None:
+            raise Exception(
+                "Cannot determine compile dependencies when "
+                "no module directory is specified and modules "
+                "are not in object files."
+            )
 
-        file_store.remove_all_file_dependencies()
+        details = self.__database.get_unit_details()
+        prerequisites: Dict[str, List[str]] = defaultdict(list)
+        submodules: Dict[str, List[str]] = defaultdict(list)
+        edges = self.__database.get_all_compile_dependencies()
+        for unit, prerequisite in edges:
+            prerequisites[unit].append(prerequisite)
+            if unit in details and details[unit][1] == "submodule":
+                submodules[prerequisite].append(unit)
 
-        logging.getLogger(__name__).info(
-            "Determining file compile dependencies..."
+        reachable = self.__compiled_units(details, prerequisites, submodules)
+
+        context = (
+            f"object_modules={object_modules} "
+            f"objects={self.__object_directory} "
+            f"modules={self.__module_directory}"
         )
+        if file_store is None:
+            affected = set(details)
+        else:
+            affected = self.__stale_units(
+                file_store, context, details, prerequisites, reachable
+            )
 
-        # we have 2 types of dependency:
-        #
-        # 1) module file dependencies: a module's .mod file depends on it's
-        # source files .o file (ommitted of course if module information is
-        # stored in object files)
-        #
-        if not object_modules:
-            if self.__module_directory is None:
-                raise Exception(
-                    "Cannot determine compile dependencies when "
-                    "no module directory is specified and modules "
-                    "are not in object files."
+        logging.getLogger(__name__).info(
+            f"Determining file compile dependencies for {len(affected)} "
+            f"of {len(details)} program units..."
+        )
+        rules: Dict[str, List[Tuple[Path, Path]]] = {}
+        with get_metrics().timer("rules"):
+            for unit in sorted(affected):
+                rules[unit] = self.__unit_rules(
+                    unit,
+                    details,
+                    prerequisites[unit] if unit in reachable else [],
+                    object_modules,
                 )
 
-            for module, file_path in self.__database.get_modules():
-                module_leafname = module + ".mod"
-                module_path = (
-                    self.__module_directory
-                    / file_path.parent
-                    / module_leafname
-                )
+        if file_store is not None:
+            for unit, unit_rules in rules.items():
+                for target, prerequisite_file in unit_rules:
+                    file_store.add_file_dependency(
+                        target, prerequisite_file, unit
+                    )
+            file_store.flush()
+            file_store.set_context(context)
+            self.__database.clear_changed_units()
+            return list(file_store.get_dependencies())
 
-                source_object_path = (
-                    self.__object_directory / file_path.with_suffix(".o")
-                )
+        grouped: Dict[Path, List[Path]] = defaultdict(list)
+        for unit_rules in rules.values():
+            for target, prerequisite_file in unit_rules:
+                grouped[target].append(prerequisite_file)
+        return sorted(grouped.items(), key=lambda rule: str(rule[0]))
 
-                file_store.add_file_dependency(module_path, source_object_path)
+    ###########################################################################
+    # Work out which units' rules held by a file store are out of date and
+    # discard them.
+    #
+    def __stale_units(
+        self,
+        file_store: FileDependencies,
+        context: str,
+        details: Dict[str, Tuple[Path, str]],
+        prerequisites: Dict[str, List[str]],
+        reachable: Set[str],
+    ) -> Set[str]:
+        if file_store.get_context() != context:
+            logging.getLogger(__name__).info(
+                "Removing old file compile dependencies"
+            )
+            file_store.remove_all_file_dependencies()
+            return set(details)
 
-        # 2) object file dependencies: %.o files depend on .mod files for
-        # modules used within %.[fF]90 (or on object files if module
-        # information stored in object files)
+        previous = file_store.get_unit_targets()
+        changed = self.__database.get_changed_units()
+        dependers = {
+            unit
+            for unit, unit_prerequisites in prerequisites.items()
+            if not changed.isdisjoint(unit_prerequisites)
+        }
+        # Units which have come into or gone out of the build through a
+        # change elsewhere must also be reconsidered. Only those with
+        # prerequisites contribute anything.
         #
-        for (
-            unit,
-            unit_path,
-            unit_type,
-            prereq,
-            prereq_path,
-            prereq_type,
-        ) in self.__database.get_compile_dependencies():
-            unit_object_path = self.__object_directory / unit_path.with_suffix(
-                ".o"
-            )
+        compiled_before = {
+            unit
+            for unit, targets in previous.items()
+            if unit in details
+            and self.__object_path(details[unit][0]) in targets
+        }
+        moved = {
+            unit
+            for unit in reachable ^ compiled_before
+            if prerequisites.get(unit)
+        }
+        stale = changed | dependers | moved
+
+        file_store.remove_units(
+            [unit for unit in sorted(stale) if unit in previous]
+        )
+        return {unit for unit in stale if unit in details}
+
+    ###########################################################################
+    # Find the units which are compiled, those which may be reached from a
+    # program.
+    #
+    def __compiled_units(
+        self,
+        details: Dict[str, Tuple[Path, str]],
+        prerequisites: Dict[str, List[str]],
+        submodules: Dict[str, List[str]],
+    ) -> Set[str]:
+        units = self.__database.get_programs()
+        reachable: Set[str] = set()
+        while units:
+            unit = units.pop()
+            if unit in reachable:
+                continue
+            reachable.add(unit)
+
+            units.extend(submodules.get(unit, []))
+            for prerequisite in prerequisites.get(unit, []):
+                if prerequisite not in details:
+                    raise DatabaseException(
+                        f"Unable to find prerequisite '{prerequisite}' "
+                        f"of '{unit}'"
+                    )
+                units.append(prerequisite)
+        return reachable
 
-            prereq_object_path = (
-                self.__object_directory / prereq_path.with_suffix(".o")
+    def __object_path(self, source_path: Path) -> Path:
+        return self.__object_directory / source_path.with_suffix(".o")
+
+    def __module_path(self, module: str, source_path: Path) -> Path:
+        assert self.__module_directory is not None
+        return self.__module_directory / source_path.parent / (module + ".mod")
+
+    ###########################################################################
+    # Work out the file dependencies arising from a single program unit.
+    #
+    # We have 2 types of dependency:
+    #
+    # 1) module file dependencies: a module's .mod file depends on it's
+    # source files .o file (ommitted of course if module information is
+    # stored in object files)
+    #
+    # 2) object file dependencies: %.o files depend on .mod files for
+    # modules used within %.[fF]90 (or on object files if module
+    # information stored in object files)
+    #
+    def __unit_rules(
+        self,
+        unit: str,
+        details: Dict[str, Tuple[Path, str]],
+        prerequisites: List[str],
+        object_modules: bool,
+    ) -> List[Tuple[Path, Path]]:
+        unit_path, unit_type = details[unit]
+        unit_object_path = self.__object_path(unit_path)
+        rules: List[Tuple[Path, Path]] = []
+
+        if not object_modules and unit_type in ("module", "submodule"):
+            rules.append(
+                (self.__module_path(unit, unit_path), unit_object_path)
             )
 
+        for prereq in prerequisites:
+            prereq_path, prereq_type = details[prereq]
+            prereq_object_path = self.__object_path(prereq_path)
+
             if prereq_type == "module":
                 message = f"{unit} depends on module {prereq}"
                 logging.getLogger(__name__).info(message)
 
                 if object_modules:
-                    file_store.add_file_dependency(
-                        unit_object_path, prereq_object_path
-                    )
+                    rules.append((unit_object_path, prereq_object_path))
                 else:  # not object_modules
-                    if self.__module_directory is None:
-                        raise Exception(
-                            "Cannot determine compile dependencies when no "
-                            "module directory is specified and modules are "
-                            "not in object files."
+                    rules.append(
+                        (
+                            unit_object_path,
+                            self.__module_path(prereq, prereq_path),
                         )
-
-                    prereq_leaf = prereq + ".mod"
-                    prereq_module_path = (
-                        self.__module_directory
-                        / prereq_path.parent
-                        / prereq_leaf
-                    )
-
-                    file_store.add_file_dependency(
-                        unit_object_path, prereq_module_path
                     )
 
             if prereq_type == "procedure":
                 message = f"{unit} depends on procedure {prereq}"
                 logging.getLogger(__name__).info(message)
 
-                file_store.add_file_dependency(
-                    unit_object_path, prereq_object_path
+                rules.append((unit_object_path, prereq_object_path))
+
+        return rules
+
+    ###########################################################################
+    # Work out what compiling each source file needs and what it produces.
+    #
+    # This is the same information as the file dependencies but arranged by
+    # source file, as build tools which know about multiple outputs want it.
+    # Module files are named as the compiler writes them, in the module
+    # directory. Only modules are given as outputs since submodules produce
+    # nothing which other files use.
+    #
+    # :param object_modules: Whether the compiler stores module information in
+    #                        object files.
+    # :param compiled_only: Leave out files holding nothing a program needs.
+    # :return: List of (source file, object file, [module files],
+    #          [prerequisite files]) tuples ordered by source file.
+    #
+    def determine_compile_edges(
+        self, object_modules=False, compiled_only=False
+    ) -> List[Tuple[Path, Path, List[Path], List[Path]]]:
+        if not object_modules and self.__module_directory is None:
+            raise Exception(
+                "Cannot determine compile edges when "
+                "no module directory is specified and modules "
+                "are not in object files."
+            )
+
+        details = self.__database.get_unit_details()
+        prerequisites: Dict[str, List[str]] = defaultdict(list)
+        submodules: Dict[str, List[str]] = defaultdict(list)
+        edges = self.__database.get_all_compile_dependencies()
+        for unit, prerequisite in edges:
+            prerequisites[unit].append(prerequisite)
+            if unit in details and details[unit][1] == "submodule":
+                submodules[prerequisite].append(unit)
+
+        reachable = self.__compiled_units(details, prerequisites, submodules)
+
+        files: Dict[Path, Tuple[Path, List[Path], List[Path]]] = {}
+        for unit in sorted(details):
+            source_path, unit_type = details[unit]
+            object_path, modules, needs = files.setdefault(
+                source_path, (self.__object_path(source_path), [], [])
+            )
+            if not object_modules and unit_type == "module":
+                modules.append(self.__module_file(unit))
+            if unit not in reachable:
+                continue
+
+            for prereq in prerequisites[unit]:
+                prereq_path, prereq_type = details[prereq]
+                if prereq_type == "module" and not object_modules:
+                    needs.append(self.__module_file(prereq))
+                elif prereq_type in ("module", "procedure"):
+                    needs.append(self.__object_path(prereq_path))
+
+        # A file may use a module it holds itself. Make quietly drops the
+        # resulting circular dependency, other tools do not.
+        #
+        result: List[Tuple[Path, Path, List[Path], List[Path]]] = []
+        compiled_files = {details[unit][0] for unit in reachable}
+        for source_path in sorted(files, key=str):
+            if compiled_only and source_path not in compiled_files:
+                continue
+            object_path, modules, needs = files[source_path]
+            produced = set(modules) | {object_path}
+            result.append(
+                (
+                    source_path,
+                    object_path,
+                    sorted(modules),
+                    sorted({need for need in needs if need not in produced}),
                 )
+            )
+        return result
+
+    def __module_file(self, module: str) -> Path:
+        assert self.__module_directory is not None
+        return self.__module_directory / (module + ".mod")
+
+    ###########################################################################
+    # Work out what is out of date when some program units change.
+    #
+    # A changed unit's file is compiled again, which rewrites the module
+    # files of every module it holds. Anything using those is compiled again
+    # and so on. Programs are linked again if they need any object which was
+    # compiled.
+    #
+    # Tests are found in two steps. Out of date units whose name matches the
+    # pattern are test suites, pFUnit's for instance. The programs linking
+    # them are the test drivers which must be run again.
+    #
+    # :param units: Names of the changed units.
+    # :param test_pattern: Units whose name matches this pattern are tests.
+    # :return: Impact object listing everything out of date.
+    #
+    def determine_impact(
+        self, units: Iterable[str], test_pattern: str = "*_test"
+    ) -> Impact:
+        details = self.__database.get_unit_details()
+        file_units: Dict[Path, List[str]] = defaultdict(list)
+        for unit, (source_path, _) in details.items():
+            file_units[source_path].append(unit)
+
+        stale: Set[str] = set()
+        pending = set(units)
+        while pending:
+            stale |= self.__database.get_dependants(pending, "compile")
+            pending = {
+                sibling
+                for unit in stale
+                if unit in details
+                for sibling in file_units[details[unit][0]]
+            } - stale
+        relinked = self.__database.get_dependants(stale, "link")
+        programs = set(self.__database.get_programs())
+
+        impact = Impact()
+        impact.units = sorted(stale)
+        impact.objects = sorted(
+            {self.__object_path(details[unit][0])
+             for unit in stale if unit in details},
+            key=str,
+        )
+        if self.__module_directory is not None:
+            impact.modules = sorted(
+                (
+                    self.__module_file(unit)
+                    for unit in stale
+                    if unit in details and details[unit][1] == "module"
+                ),
+                key=str,
+            )
+        impact.programs = sorted(programs & (stale | relinked))
+        impact.suites = sorted(
+            unit for unit in stale if fnmatchcase(unit, test_pattern)
+        )
+        if impact.suites:
+            drivers = self.__database.get_dependants(impact.suites, "link")
+            impact.tests = sorted(programs & (drivers | set(impact.suites)))
+        return impact
 
     ###########################################################################
     # Determine all program units needed to build each program.
     #
-    # TODO: Once we have a more recent version of SQLite we could consider
-    # doing this at the database level.
+    # The link graph is loaded once and closures are shared between roots so
+    # many programs cost little more than one.
     #
     def determine_link_dependencies(
         self, root_unit: Optional[str] = None
@@ -148,28 +429,39 @@ class FortranProcessor:
         else:
             roots = self.__database.get_programs()
 
+        graph = DependencyGraph(self.__database.get_all_link_dependencies())
+        unit_files = dict(self.__database.get_program_units())
+
         for root in roots:
             logging.getLogger(__name__).info("Root {0}".format(root))
 
-            root_object_file: Optional[Path] = None
+            if not graph.prerequisites(root):
+                raise Exception(f"Root object '{root}' not found")
+            if root not in unit_files:
+                raise DatabaseException(f"Unable to find unit '{root}'")
+            root_object_file = self.__object_directory / unit_files[
+                root
+            ].with_suffix(".o")
+
             objects: Set[Path] = set()
-            for (
-                unit,
-                unit_file,
-                prereq,
-                prereq_file,
-            ) in self.__database.get_link_dependencies(root):
-                if unit == root:
-                    root_object_file = (
-                        self.__object_directory / unit_file.with_suffix(".o")
+            with get_metrics().timer("closure", root):
+                closure = graph.closure(root)
+            for unit in sorted(closure):
+                if unit not in unit_files:
+                    depender = next(
+                        candidate
+                        for candidate in sorted(closure | {root})
+                        if unit in graph.prerequisites(candidate)
+                    )
+                    raise DatabaseException(
+                        f"Program unit '{depender}' requires '{unit}' "
+                        "but it was not found in the database"
                     )
                 objects.add(
-                    self.__object_directory / prereq_file.with_suffix(".o")
+                    self.__object_directory
+                    / unit_files[unit].with_suffix(".o")
                 )
 
-            if root_object_file is None:
-                raise Exception(f"Root object '{root}' not found")
-
             yield (
                 self.__object_directory / root,
                 root_object_file,
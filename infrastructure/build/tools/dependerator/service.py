@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Run the dependency tools inside a long lived process.
+
+Every time the build system runs a tool it pays to start an interpreter,
+import the tool, open the database and read it from disc. A service may
+instead be started for a working directory. It listens on a UNIX socket and
+the tools, when they find it running, hand their arguments to it rather than
+doing the work themselves. The service runs the tool with those arguments
+in its own process, where everything is already loaded, and sends back what
+it printed along with its exit status.
+
+Database connections, and SQLite's cache of their pages, are kept open
+between requests. Requests are dealt with one at a time.
+
+Only the user who started a service may use it. Its socket is kept in a
+directory private to that user and each end of a connection checks the
+other belongs to the same user before trusting it.
+
+The service also watches the source files in its directory, noting those
+modified since it last analysed them.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import runpy
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from time import time
+from typing import Any, Dict, List, Optional, Set
+
+from dependerator import database
+from dependerator.batch import SOURCE_SUFFIXES
+from dependerator.metrics import get_metrics
+
+# Tools which may be run by the service. They are found alongside the
+# dependerator package.
+#
+TOOLS = ("DependencyAnalyser", "DependencyRules", "ProgramObjects")
+TOOL_DIRECTORY = Path(__file__).resolve().parent.parent
+
+# Setting this in the environment stops tools using a service.
+#
+DISABLE_VARIABLE = "DEPENDERATOR_NO_SERVICE"
+
+# Environment variables the tools, or the preprocessor they run, depend on.
+# Only these are passed to the service.
+#
+FORWARDED_VARIABLES = ("FPP", "PATH")
+
+_in_service = False
+
+
+def socket_path(directory: Path) -> Path:
+    """
+    Gets the socket a service for a working directory listens on.
+
+    Sockets are kept in a private directory rather than the working
+    directory as their names are limited in length. This is within the
+    user's runtime directory, if they have one, otherwise a temporary one.
+
+    @param directory: Working directory.
+    @return: Socket filename.
+    """
+    key = hashlib.sha256(str(directory.resolve()).encode()).hexdigest()
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        parent = Path(runtime) / "dependerator"
+    else:
+        parent = Path(tempfile.gettempdir()) / f"dependerator-{os.getuid()}"
+    return parent / f"{key[:20]}.sock"
+
+
+def _check_private(directory: Path) -> None:
+    """
+    Ensures a directory may be trusted to hold sockets.
+
+    It must be a real directory, not a link to one, owned by the current
+    user and accessible to no one else.
+
+    @param directory: Directory to check.
+    @raise PermissionError: If it may not be trusted.
+    """
+    status = directory.lstat()
+    if not stat.S_ISDIR(status.st_mode):
+        raise PermissionError(f"{directory} is not a directory")
+    if status.st_uid != os.getuid():
+        raise PermissionError(f"{directory} is owned by another user")
+    if stat.S_IMODE(status.st_mode) != 0o700:
+        raise PermissionError(
+            f"{directory} has mode {stat.S_IMODE(status.st_mode):o} not 700"
+        )
+
+
+def _peer_uid(connection: socket.socket) -> Optional[int]:
+    """
+    Gets the user at the other end of a connection.
+
+    @param connection: Connected UNIX socket.
+    @return: User ID or None if the platform does not say.
+    """
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:
+        return None
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, option, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+def _send(connection: socket.socket, message: Dict[str, Any]) -> None:
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _receive(connection: socket.socket) -> Optional[Dict[str, Any]]:
+    buffer = bytearray()
+    while not buffer.endswith(b"\n"):
+        chunk = connection.recv(65536)
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return json.loads(buffer)
+
+
+def _connect(directory: Path) -> Optional[socket.socket]:
+    """
+    Connects to the service for a directory.
+
+    Anything which prevents a trustworthy connection is taken to mean there
+    is no service.
+
+    @param directory: Working directory.
+    @return: Connection or None if there is no usable service.
+    """
+    logger = logging.getLogger(__name__)
+    path = socket_path(directory)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        _check_private(path.parent)
+        connection.connect(str(path))
+        uid = _peer_uid(connection)
+        if uid != os.getuid():
+            raise PermissionError(f"{path} is served by user {uid}")
+    except (FileNotFoundError, ConnectionRefusedError) as ex:
+        logger.debug(f"No dependency service: {ex}")
+        connection.close()
+        return None
+    except OSError as ex:
+        logger.warning(f"Not using dependency service: {ex}")
+        connection.close()
+        return None
+    return connection
+
+
+def delegate(tool: str) -> None:
+    """
+    Hands the current invocation of a tool to a service, if one is running.
+
+    Returns if there is no service so that the tool may carry on and do the
+    work itself. Otherwise the service's output is reproduced and the
+    process exits with its status.
+
+    @param tool: Name of the tool.
+    """
+    if _in_service or os.environ.get(DISABLE_VARIABLE):
+        return
+    directory = Path.cwd()
+    connection = _connect(directory)
+    if connection is None:
+        return
+    with connection:
+        _send(
+            connection,
+            {
+                "command": "run",
+                "tool": tool,
+                "arguments": sys.argv[1:],
+                "directory": str(directory),
+                "environment": {
+                    name: os.environ[name]
+                    for name in FORWARDED_VARIABLES
+                    if name in os.environ
+                },
+            },
+        )
+        response = _receive(connection)
+    if response is None:
+        sys.exit(f"{tool}: dependency service went away")
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    sys.exit(response["status"])
+
+
+def request(directory: Path, command: str) -> Optional[Dict[str, Any]]:
+    """
+    Sends a command other than running a tool to a service.
+
+    @param directory: Working directory of the service.
+    @param command: "status" or "stop".
+    @return: The response or None if no service is running.
+    """
+    connection = _connect(directory)
+    if connection is None:
+        return None
+    with connection:
+        _send(connection, {"command": command})
+        return _receive(connection)
+
+
+class SourceWatcher:
+    """
+    Notes source files modified since they were last analysed.
+
+    The tree is polled, rather than relying on a platform specific
+    notification mechanism.
+    """
+
+    def __init__(self, directory: Path, interval: float):
+        """
+        @param directory: Tree to watch.
+        @param interval: Seconds between looks.
+        """
+        self.__directory = directory
+        self.__interval = interval
+        self.__lock = threading.Lock()
+        self.__times: Dict[Path, float] = self.__scan()
+        self.__modified: Set[Path] = set()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stop.set()
+
+    def __scan(self) -> Dict[Path, float]:
+        times: Dict[Path, float] = {}
+        for root, directories, files in os.walk(self.__directory):
+            directories[:] = [
+                name for name in directories if not name.startswith(".")
+            ]
+            for name in files:
+                if os.path.splitext(name)[1] in SOURCE_SUFFIXES:
+                    path = Path(root, name)
+                    try:
+                        times[path] = path.stat().st_mtime
+                    except FileNotFoundError:
+                        pass
+        return times
+
+    def __run(self) -> None:
+        while not self.__stop.wait(self.__interval):
+            times = self.__scan()
+            with self.__lock:
+                for path, modified in times.items():
+                    if self.__times.get(path) != modified:
+                        self.__modified.add(path)
+                self.__modified &= set(times)
+                self.__times = times
+
+    def modified(self) -> List[Path]:
+        """
+        @return: Source files modified since last analysed, sorted.
+        """
+        with self.__lock:
+            return sorted(self.__modified)
+
+    def analysed(self) -> None:
+        """
+        Notes that analysis has been brought up to date.
+        """
+        with self.__lock:
+            self.__times = self.__scan()
+            self.__modified.clear()
+
+
+class DependencyService:
+    """
+    Listens for and carries out requests for a working directory.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        idle_timeout: Optional[float] = None,
+        watch_interval: float = 2.0,
+    ):
+        """
+        @param directory: Working directory served.
+        @param idle_timeout: Stop after this many seconds without a request.
+        @param watch_interval: Seconds between looks at the source.
+        """
+        self.__directory = directory.resolve()
+        self.__idle_timeout = idle_timeout
+        self.__watcher = SourceWatcher(self.__directory, watch_interval)
+        self.__started = time()
+        self.__requests = 0
+
+    def serve(self) -> None:
+        """
+        Handles requests until told to stop or left idle.
+        """
+        global _in_service
+        _in_service = True
+        database.retain_connections()
+
+        path = socket_path(self.__directory)
+        try:
+            path.parent.mkdir(mode=0o700, exist_ok=True)
+            _check_private(path.parent)
+        except OSError as ex:
+            raise RuntimeError(f"Unable to serve from {path.parent}: {ex}")
+        if _connect(self.__directory) is not None:
+            raise RuntimeError(
+                f"A service is already running for {self.__directory}"
+            )
+        if path.exists():
+            path.unlink()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(path))
+        listener.listen(16)
+        listener.settimeout(self.__idle_timeout)
+        self.__watcher.start()
+        logging.getLogger(__name__).info(
+            f"Serving {self.__directory} on {path}"
+        )
+        try:
+            while True:
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    logging.getLogger(__name__).info("Stopping when idle")
+                    break
+                with connection:
+                    connection.settimeout(None)
+                    if _peer_uid(connection) not in (None, os.getuid()):
+                        logging.getLogger(__name__).warning(
+                            "Ignoring request from another user"
+                        )
+                        continue
+                    if not self.__handle(connection):
+                        break
+        finally:
+            self.__watcher.stop()
+            listener.close()
+            path.unlink()
+
+    def __handle(self, connection: socket.socket) -> bool:
+        message = _receive(connection)
+        if message is None:
+            return True
+        self.__requests += 1
+        command = message.get("command")
+        if command == "stop":
+            _send(connection, {"stopping": True})
+            return False
+        if command == "status":
+            _send(
+                connection,
+                {
+                    "directory": str(self.__directory),
+                    "process": os.getpid(),
+                    "uptime": time() - self.__started,
+                    "requests": self.__requests,
+                    "modified": [
+                        str(path) for path in self.__watcher.modified()
+                    ],
+                },
+            )
+            return True
+        if command == "run" and message.get("tool") in TOOLS:
+            _send(connection, self.__run(message))
+            if message["tool"] == "DependencyAnalyser":
+                self.__watcher.analysed()
+            return True
+        _send(connection, {"stdout": "",
+                           "stderr": f"Unrecognised request: {message}\n",
+                           "status": 1})
+        return True
+
+    def __run(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Runs a tool as though from the command line, capturing its output.
+
+        The analyser is kept to a single process. Forking this one, which
+        has other threads, risks children inheriting locks they hold.
+        """
+        script = TOOL_DIRECTORY / message["tool"]
+        arguments = list(message["arguments"])
+        if message["tool"] == "DependencyAnalyser":
+            arguments.extend(["-jobs", "1"])
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        logger = logging.getLogger("dependerator")
+        saved_handlers = list(logger.handlers)
+        saved_level = logger.level
+        saved_argv = sys.argv
+        saved_environment = dict(os.environ)
+        saved_directory = os.getcwd()
+        status = 0
+        try:
+            os.chdir(message["directory"])
+            for name in FORWARDED_VARIABLES:
+                os.environ.pop(name, None)
+                if name in message["environment"]:
+                    os.environ[name] = message["environment"][name]
+            sys.argv = [str(script)] + arguments
+            get_metrics().clear()
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    runpy.run_path(str(script), run_name="__main__")
+                except SystemExit as ex:
+                    status = _exit_status(ex.code, stderr)
+                except Exception:  # pylint: disable=broad-except
+                    traceback.print_exc()
+                    status = 1
+        finally:
+            sys.argv = saved_argv
+            os.environ.clear()
+            os.environ.update(saved_environment)
+            os.chdir(saved_directory)
+            logger.handlers = saved_handlers
+            logger.setLevel(saved_level)
+        return {
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+            "status": status,
+        }
+
+
+def _exit_status(code: Any, stderr: io.StringIO) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=stderr)
+    return 1
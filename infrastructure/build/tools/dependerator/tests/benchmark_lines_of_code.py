@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Compares the speed of the line joiner with the reference state machine on
+the largest source files in the tree.
+
+Run from the tools directory with:
+
+    python -m dependerator.tests.benchmark_lines_of_code [-files N]
+"""
+from argparse import ArgumentParser
+from timeit import timeit
+
+from dependerator.analyser import lines_of_code
+from dependerator.tests.test_lines_of_code import (
+    reference_lines_of_code,
+    tree_sources,
+)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-files", type=int, default=10,
+                        help="Number of the largest files to use.")
+    parser.add_argument("-repeat", type=int, default=5,
+                        help="Times to process each file.")
+    arguments = parser.parse_args()
+
+    sources = sorted(
+        tree_sources(), key=lambda path: path.stat().st_size, reverse=True
+    )[:arguments.files]
+
+    print(f"{'File':50} {'Lines':>7} {'Old/ms':>8} {'New/ms':>8} "
+          f"{'Speed-up':>8}")
+    old_total = 0.0
+    new_total = 0.0
+    for source in sources:
+        text = source.read_text(errors="replace")
+        old = timeit(lambda: list(reference_lines_of_code(text)),
+                     number=arguments.repeat) / arguments.repeat
+        new = timeit(lambda: list(lines_of_code(text)),
+                     number=arguments.repeat) / arguments.repeat
+        old_total += old
+        new_total += new
+        print(f"{source.name[-50:]:50} {text.count(chr(10)):7} "
+              f"{old * 1000:8.2f} {new * 1000:8.2f} {old / new:8.1f}")
+    print(f"{'Total':50} {'':7} {old_total * 1000:8.2f} "
+          f"{new_total * 1000:8.2f} {old_total / new_total:8.1f}")
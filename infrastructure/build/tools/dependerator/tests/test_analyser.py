@@ -807,3 +807,41 @@ class TestFortranAnalyser:
                 Path("special_thread_sauce_mod.f90"),
             )
         ]
+
+    def test_statement_keywords(self, database, tmp_path: Path):
+        """
+        Statements are recognised whatever their case and prefixes, and
+        dependencies are found after executable statements.
+        """
+        test_filename = tmp_path / "keywords.f90"
+        test_filename.write_text(
+            dedent(
+                """
+                Pure Function first(x)
+                  USE first_mod
+                  first = x
+                END FUNCTION first
+
+                integer(i_def) function second()
+                  use second_mod
+                  procedure(thing), pointer, external :: third
+                  second = 1
+                  call fourth() ! DEPENDS ON: fourth
+                  endpoint = 2
+                end function second
+                """
+            )
+        )
+        uut = FortranAnalyser([], database)
+        uut.analyse(test_filename)
+
+        assert sorted(database.get_program_units()) == [
+            ("first", test_filename),
+            ("second", test_filename),
+        ]
+        assert database.get_compile_prerequisites("first") == ["first_mod"]
+        assert database.get_compile_prerequisites("second") == [
+            "second_mod",
+            "third",
+            "fourth",
+        ]
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import os
+from pathlib import Path
+from textwrap import dedent
+
+import pytest
+
+from dependerator.analyser import FortranAnalyser
+from dependerator.batch import (
+    BatchAnalyser,
+    find_sources,
+    is_stale,
+    stamp_filename,
+)
+from dependerator.database import FortranDependencies, SQLiteDatabase
+from dependerator.metrics import get_metrics
+
+
+class TestBatchAnalyser:
+    @pytest.fixture
+    def backend(self, tmp_path_factory):
+        filename = tmp_path_factory.mktemp("db-", True) / "test.db"
+        return SQLiteDatabase(filename)
+
+    @pytest.fixture
+    def source_tree(self, tmp_path: Path) -> Path:
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "first_mod.f90").write_text(
+            dedent("""
+            module first_mod
+            end module first_mod
+            """)
+        )
+        (tmp_path / "second_mod.f90").write_text(
+            dedent("""
+            module second_mod
+              use first_mod
+            end module second_mod
+            """)
+        )
+        (tmp_path / "notes.txt").write_text("Not Fortran")
+        return tmp_path
+
+    def test_find_sources(self, source_tree: Path):
+        """
+        Directories are searched, files are passed through.
+        """
+        extra = source_tree / "notes.txt"
+        assert find_sources([source_tree, extra, extra]) == [
+            source_tree / "second_mod.f90",
+            source_tree / "sub" / "first_mod.f90",
+            extra,
+        ]
+
+    def test_analyse(self, backend, source_tree: Path):
+        """
+        All files are analysed and stamp files are left alone.
+        """
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(FortranAnalyser([], database), backend)
+
+        sources = find_sources([source_tree])
+        assert uut.analyse(sources) == sources
+
+        assert sorted(database.get_program_units()) == [
+            ("first_mod", source_tree / "sub" / "first_mod.f90"),
+            ("second_mod", source_tree / "second_mod.f90"),
+        ]
+        assert database.get_compile_prerequisites("second_mod") == [
+            "first_mod"
+        ]
+        for source in sources:
+            assert not stamp_filename(source).exists()
+
+    def test_parallel(self, backend, source_tree: Path, tmp_path_factory):
+        """
+        Scanning in several processes gives the same result as one.
+        """
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(FortranAnalyser([], database), backend,
+                            processes=2)
+
+        sources = find_sources([source_tree])
+        assert uut.analyse(sources) == sources
+
+        serial_filename = tmp_path_factory.mktemp("db-", True) / "serial.db"
+        serial_backend = SQLiteDatabase(serial_filename)
+        serial_database = FortranDependencies(serial_backend)
+        serial = BatchAnalyser(FortranAnalyser([], serial_database),
+                               serial_backend)
+        serial.analyse(sources)
+
+        assert sorted(database.get_program_units()) == sorted(
+            serial_database.get_program_units()
+        )
+        assert sorted(database.get_compile_dependencies()) == sorted(
+            serial_database.get_compile_dependencies()
+        )
+
+    def test_metrics(self, backend, source_tree: Path):
+        """
+        Metrics gathered by workers are merged with the batch's own.
+        """
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(FortranAnalyser([], database), backend,
+                            processes=2)
+        metrics = get_metrics()
+        metrics.clear()
+
+        sources = find_sources([source_tree])
+        uut.analyse(sources)
+
+        report = metrics.report()
+        assert report["counters"] == {"files analysed": 2,
+                                      "files unchanged": 0}
+        assert report["phases"]["scan"]["count"] == 2
+        assert sorted(
+            each["subject"] for each in report["phases"]["scan"]["slowest"]
+        ) == sorted(str(source) for source in sources)
+        assert report["phases"]["insert"]["count"] == 1
+        metrics.clear()
+
+    def test_parallel_failure(self, backend, source_tree: Path):
+        """
+        Errors in worker processes reach the caller and nothing is committed.
+        """
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(FortranAnalyser([], database), backend,
+                            processes=2)
+
+        broken = source_tree / "broken.f90"
+        broken.write_text("end module nothing\n")
+        with pytest.raises(Exception, match="Mismatched begin/end"):
+            uut.analyse([source_tree / "second_mod.f90", broken])
+
+        assert database.get_program_units() == []
+
+    def test_stamp(self, backend, source_tree: Path):
+        """
+        Only stale files are analysed and their stamps are touched.
+        """
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(FortranAnalyser([], database), backend, True)
+
+        sources = find_sources([source_tree])
+        assert uut.analyse(sources) == sources
+        for source in sources:
+            assert stamp_filename(source).exists()
+
+        assert uut.analyse(sources) == []
+
+        changed = source_tree / "second_mod.f90"
+        earlier = changed.stat().st_mtime - 10
+        os.utime(stamp_filename(changed), (earlier, earlier))
+        assert is_stale(changed)
+        assert uut.analyse(sources) == []
+        assert not is_stale(changed)
+
+        changed.write_text(
+            dedent("""
+            module second_mod
+              use first_mod
+              use third_mod
+            end module second_mod
+            """)
+        )
+        later = stamp_filename(changed).stat().st_mtime + 10
+        os.utime(changed, (later, later))
+        assert uut.analyse(sources) == [changed]
+        assert database.get_compile_prerequisites("second_mod") == [
+            "first_mod",
+            "third_mod",
+        ]
+
+    def test_unchanged(self, backend, source_tree: Path):
+        """
+        Files are only analysed again if their content changes or analysis
+        is forced.
+        """
+        database = FortranDependencies(backend)
+        analyser = FortranAnalyser([], database)
+        uut = BatchAnalyser(analyser, backend)
+
+        sources = find_sources([source_tree])
+        assert uut.analyse(sources) == sources
+        assert uut.analyse(sources) == []
+
+        forced = BatchAnalyser(analyser, backend, force=True)
+        assert forced.analyse(sources) == sources
+
+        changed = source_tree / "sub" / "first_mod.f90"
+        changed.write_text(changed.read_text() + "! Comment\n")
+        assert uut.analyse(sources) == [changed]
+
+    def test_inclusion_changed(self, backend, tmp_path: Path, monkeypatch):
+        """
+        Changing an included file or the macros causes analysis.
+        """
+        monkeypatch.setenv("FPP", "cpp -traditional-cpp -P")
+        include_dir = tmp_path / "include"
+        include_dir.mkdir()
+        inclusion = include_dir / "uses.h"
+        inclusion.write_text("use first_mod\n")
+        source = tmp_path / "second_mod.F90"
+        source.write_text(
+            dedent("""
+            module second_mod
+            #include "uses.h"
+            end module second_mod
+            """)
+        )
+
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(
+            FortranAnalyser([], database, {}, [include_dir]), backend
+        )
+        assert uut.analyse([source]) == [source]
+        assert uut.analyse([source]) == []
+
+        inclusion.write_text("use third_mod\n")
+        assert uut.analyse([source]) == [source]
+        assert database.get_compile_prerequisites("second_mod") == [
+            "third_mod"
+        ]
+
+        macros = BatchAnalyser(
+            FortranAnalyser([], database, {"FOO": None}, [include_dir]),
+            backend,
+        )
+        assert macros.analyse([source]) == [source]
+
+    def test_failure_rolls_back(self, backend, source_tree: Path):
+        """
+        A failure part way through a batch commits nothing.
+        """
+        database = FortranDependencies(backend)
+        uut = BatchAnalyser(FortranAnalyser([], database), backend, True)
+
+        broken = source_tree / "broken.f90"
+        broken.write_text("end module nothing\n")
+        sources = [source_tree / "second_mod.f90", broken]
+        with pytest.raises(Exception):
+            uut.analyse(sources)
+
+        assert database.get_program_units() == []
+        for source in sources:
+            assert not stamp_filename(source).exists()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import os
+import subprocess
+from pathlib import Path
+from textwrap import dedent
+
+from dependerator.analyser import FortranScanner
+from dependerator.cache import AnalysisCache, DirectoryCache
+from dependerator.fingerprint import SourceFingerprint
+
+
+class TestDirectoryCache:
+    def test_permissions(self, tmp_path: Path):
+        """
+        Entries may be read by other users sharing the cache.
+        """
+        cache = DirectoryCache(tmp_path)
+        mask = os.umask(0o022)
+        try:
+            cache.store("key", "content")
+        finally:
+            os.umask(mask)
+        assert cache.fetch("key") == "content"
+        [entry] = tmp_path.iterdir()
+        assert entry.stat().st_mode & 0o777 == 0o644
+
+
+class TestAnalysisCache:
+    def test_key(self):
+        """
+        Only content, not location, identifies an analysis.
+        """
+        fingerprint = SourceFingerprint("1", "X=1", "here", {"here/a.h": "2"})
+        key = AnalysisCache.key(fingerprint, {"ignore": []})
+
+        moved = SourceFingerprint("1", "X=1", "there", {"there/a.h": "2"})
+        assert AnalysisCache.key(moved, {"ignore": []}) == key
+
+        for other in [
+            SourceFingerprint("3", "X=1", "here", {"here/a.h": "2"}),
+            SourceFingerprint("1", "X=2", "here", {"here/a.h": "2"}),
+            SourceFingerprint("1", "X=1", "here", {"here/a.h": "3"}),
+        ]:
+            assert AnalysisCache.key(other, {"ignore": []}) != key
+        assert AnalysisCache.key(fingerprint, {"ignore": ["mpi"]}) != key
+
+        # Which inclusion has which content matters.
+        #
+        swapped = [
+            SourceFingerprint(
+                "1", "X=1", "here", {"here/a.h": "2", "here/b.h": "3"}
+            ),
+            SourceFingerprint(
+                "1", "X=1", "here", {"here/a.h": "3", "here/b.h": "2"}
+            ),
+        ]
+        assert AnalysisCache.key(swapped[0], {}) \
+            != AnalysisCache.key(swapped[1], {})
+
+    def test_shared(self, tmp_path: Path, monkeypatch):
+        """
+        Applications analysing copies of the same source share results.
+        """
+        calls = []
+        original = subprocess.Popen
+
+        def counting_popen(command, *args, **kwargs):
+            calls.append(command)
+            return original(command, *args, **kwargs)
+
+        monkeypatch.setattr(subprocess, "Popen", counting_popen)
+        monkeypatch.setenv("FPP", "cpp -traditional-cpp -P")
+
+        cache = AnalysisCache(tmp_path / "cache")
+        analyses = []
+        for application in ["first", "second"]:
+            working = tmp_path / application
+            (working / "include").mkdir(parents=True)
+            (working / "include" / "kind.h").write_text("use kind_mod\n")
+            source = working / "thing_mod.F90"
+            source.write_text(
+                dedent(
+                    """
+                    module thing_mod
+                    #include "kind.h"
+                    #ifdef WITH_OTHER
+                      use other_mod
+                    #endif
+                    end module thing_mod
+                    """
+                )
+            )
+            scanner = FortranScanner(
+                [], {"WITH_OTHER": None}, [working / "include"],
+                analysis_cache=cache,
+            )
+            analyses.append(scanner.scan(source))
+
+        assert len(calls) == 1
+        first, second = analyses
+        assert second.source_filename == tmp_path / "second" / "thing_mod.F90"
+        assert second.units == first.units == [("thing_mod", "module")]
+        assert second.compile_dependencies == first.compile_dependencies
+        assert sorted(second.compile_dependencies) == [
+            ("thing_mod", "kind_mod"),
+            ("thing_mod", "other_mod"),
+        ]
+        assert second.link_dependencies == first.link_dependencies
+        assert second.fingerprint is not None
+        assert str(tmp_path / "second") in second.fingerprint.include_paths
+
+        # A different inclusion is analysed afresh.
+        #
+        (tmp_path / "second" / "include" / "kind.h").write_text("\n")
+        scanner.scan(tmp_path / "second" / "thing_mod.F90")
+        assert len(calls) == 2
@@ -5,11 +5,15 @@
 # should have received as part of this distribution.
 ##############################################################################
 
+import sqlite3
+from multiprocessing import Pool
 from pathlib import Path
+from typing import Tuple
 
 from pytest import fixture, raises
 
 from dependerator.database import (
+    SCHEMA_VERSION,
     DatabaseException,
     FileDependencies,
     FortranDependencies,
@@ -17,6 +21,32 @@ from dependerator.database import (
 )
 
 
+def hammer(arguments: Tuple[Path, int]) -> int:
+    """
+    Repeatedly writes and reads a shared database from one process.
+    """
+    filename, worker = arguments
+    database = SQLiteDatabase(filename)
+    uut = FortranDependencies(database)
+    files = FileDependencies(database)
+    for index in range(25):
+        source = Path(f"worker{worker}/unit{index}.f90")
+        with database.transaction():
+            uut.remove_file(source)
+            uut.add_module(f"unit_{worker}_{index}", source)
+            uut.add_compile_dependency(
+                f"unit_{worker}_{index}", f"unit_{worker}_{index - 1}"
+            )
+            uut.add_link_dependency(
+                f"unit_{worker}_{index}", f"unit_{worker}_{index - 1}"
+            )
+            uut.flush()
+        files.add_file_dependency(source, source.with_suffix(".o"))
+        files.flush()
+        assert f"unit_{worker}_{index}" in dict(uut.get_modules())
+    return len(uut.get_modules())
+
+
 class TestDatabase:
     def test_all(self, tmp_path: Path):
         """
@@ -68,6 +98,18 @@ class TestFileDependency:
         result = uut.get_dependencies()
         assert [] == list(result)
 
+    def test_quoted_names(self, tmp_path: Path):
+        """
+        Ensure filenames containing quotes are stored intact.
+        """
+        uut = FileDependencies(SQLiteDatabase(tmp_path / "file.db"))
+        uut.add_file_dependency("it's.f90", 'say "bar"')
+        assert [(Path("it's.f90"), [Path('say "bar"')])] == list(
+            uut.get_dependencies()
+        )
+        uut.remove_file("it's.f90")
+        assert [] == list(uut.get_dependencies())
+
 
 class TestFortranDependency:
     @fixture
@@ -171,6 +213,49 @@ class TestFortranDependency:
             ("wilma", Path("wilma.f90")),
         ] == list(modules)
 
+    def test_get_dependants(self, example_db: FortranDependencies):
+        """
+        Ensure dependencies may be followed backwards.
+        """
+        assert example_db.get_dependants(["qux"], "compile") == {
+            "qux",
+            "bar",
+            "foo",
+        }
+        assert example_db.get_dependants(["wilma", "baz"], "compile") == {
+            "wilma",
+            "baz",
+            "noonoo",
+            "fred",
+            "foo",
+        }
+        assert example_db.get_dependants(["foo"], "link") == {
+            "foo",
+            "bar",
+            "baz",
+            "noonoo",
+            "qux",
+            "wilma",
+        }
+        assert example_db.get_dependants([], "compile") == set()
+        assert example_db.get_dependants(["missing"], "compile") == set()
+
+        # More names than are bound to one query.
+        #
+        many = [f"missing{index}" for index in range(1200)] + ["qux"]
+        assert example_db.get_dependants(many, "compile") == {
+            "qux",
+            "bar",
+            "foo",
+        }
+
+    def test_get_file_units(self, example_db: FortranDependencies):
+        """
+        Ensure the units held in a file are found.
+        """
+        assert example_db.get_file_units(Path("foo.f90")) == ["foo", "noonoo"]
+        assert example_db.get_file_units(Path("missing.f90")) == []
+
     def test_get_all_compile_dependencies(
         self, example_db: FortranDependencies
     ):
@@ -327,6 +412,80 @@ class TestFortranDependency:
             err.value
         )
 
+    def test_link_dependencies_missing_prerequisite(self, tmp_path: Path):
+        """
+        Checks that a link prerequisite absent from the database is reported
+        rather than silently dropped from the closure.
+        """
+        database = FortranDependencies(SQLiteDatabase(tmp_path / "fortran.db"))
+
+        database.add_program("prog", Path("prog.f90"))
+        database.add_module("parent", Path("parent.f90"))
+
+        database.add_link_dependency("prog", "parent")
+        database.add_link_dependency("parent", "child")
+
+        with raises(DatabaseException) as err:
+            list(database.get_link_dependencies("prog"))
+        assert (
+            "Program unit 'parent' requires 'child' "
+            "but it was not found in the database"
+        ) in str(err.value)
+
+    def test_link_dependencies_cycle(self, tmp_path: Path):
+        """
+        Ensures mutually dependent units terminate the closure and that the
+        root is never its own prerequisite.
+        """
+        database = FortranDependencies(SQLiteDatabase(tmp_path / "fortran.db"))
+
+        database.add_program("prog", Path("prog.f90"))
+        database.add_module("alpha", Path("alpha.f90"))
+        database.add_module("beta", Path("beta.f90"))
+
+        database.add_link_dependency("prog", "alpha")
+        database.add_link_dependency("prog", "alpha")
+        database.add_link_dependency("alpha", "beta")
+        database.add_link_dependency("beta", "alpha")
+        database.add_link_dependency("beta", "prog")
+
+        assert list(database.get_link_dependencies("prog")) == [
+            ("alpha", Path("alpha.f90"), "beta", Path("beta.f90")),
+            ("beta", Path("beta.f90"), "alpha", Path("alpha.f90")),
+            ("prog", Path("prog.f90"), "alpha", Path("alpha.f90")),
+        ]
+
+    def test_quoted_names(self, tmp_path: Path):
+        """
+        Ensure names which would break a formatted query are handled.
+        """
+        database = FortranDependencies(SQLiteDatabase(tmp_path / "fortran.db"))
+        database.add_program("prog", Path("it's/prog.f90"))
+        database.add_module("mod", Path('"quoted".f90'))
+        database.add_link_dependency("prog", "mod")
+        database.add_compile_dependency("prog", "mod")
+
+        assert list(database.get_link_dependencies("prog")) == [
+            ("prog", Path("it's/prog.f90"), "mod", Path('"quoted".f90'))
+        ]
+        database.remove_file(Path("it's/prog.f90"))
+        assert database.get_programs() == []
+        assert database.get_compile_prerequisites("prog") == []
+
+    def test_buffered_dependencies(self, tmp_path: Path):
+        """
+        Ensure dependencies held back for batching are seen by queries and
+        dropped along with their file.
+        """
+        database = FortranDependencies(SQLiteDatabase(tmp_path / "fortran.db"))
+        database.add_module("alpha", Path("alpha.f90"))
+        database.add_compile_dependency("alpha", "beta")
+        assert database.get_compile_prerequisites("alpha") == ["beta"]
+
+        database.add_compile_dependency("alpha", "gamma")
+        database.remove_file(Path("alpha.f90"))
+        assert database.get_compile_prerequisites("alpha") == []
+
     @staticmethod
     def test_duplicate_module(example_db: FortranDependencies):
         """
@@ -337,3 +496,160 @@ class TestFortranDependency:
             example_db.add_module("qux", Path("cheese/qux.f90"))
         assert "qux" == caught.value.module
         assert Path("cheese/qux.f90") == caught.value.filename
+
+
+class TestSchema:
+    def test_migrate_legacy(self, tmp_path: Path):
+        """
+        Ensure a database using the original, name keyed, schema is brought
+        up to date without losing anything.
+        """
+        filename = tmp_path / "legacy.db"
+        connection = sqlite3.connect(str(filename))
+        connection.executescript(
+            """
+            CREATE TABLE fortran_unit_type ( type TEXT PRIMARY KEY );
+            CREATE TABLE fortran_dependency_type ( type TEXT PRIMARY KEY );
+            CREATE TABLE fortran_program_unit (
+                unit TEXT PRIMARY KEY, file TEXT NOT NULL, type TEXT
+            );
+            CREATE TABLE fortran_unit_dependency (
+                unit TEXT NOT NULL, prerequisite TEXT NOT NULL, type TEXT
+            );
+            INSERT INTO fortran_program_unit VALUES
+                ('prog', 'prog.f90', 'program'),
+                ('first', 'first.f90', 'module'),
+                ('second', 'second.f90', 'module');
+            INSERT INTO fortran_unit_dependency VALUES
+                ('prog', 'second', 'compile'),
+                ('prog', 'first', 'compile'),
+                ('prog', 'first', 'link'),
+                ('first', 'second', 'link'),
+                ('second', 'external', 'compile');
+            """
+        )
+        connection.commit()
+        connection.close()
+
+        uut = FortranDependencies(SQLiteDatabase(filename))
+        assert uut.get_programs() == ["prog"]
+        assert sorted(uut.get_modules()) == [
+            ("first", Path("first.f90")),
+            ("second", Path("second.f90")),
+        ]
+        assert uut.get_compile_prerequisites("prog") == ["second", "first"]
+        assert uut.get_compile_prerequisites("second") == ["external"]
+        assert list(uut.get_link_dependencies("prog")) == [
+            ("first", Path("first.f90"), "second", Path("second.f90")),
+            ("prog", Path("prog.f90"), "first", Path("first.f90")),
+        ]
+        assert uut.get_file_fingerprint(Path("prog.f90")) is None
+
+        connection = sqlite3.connect(str(filename))
+        assert connection.execute("PRAGMA user_version").fetchone() == (
+            SCHEMA_VERSION,
+        )
+        tables = {
+            row[0]
+            for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+        }
+        assert not {name for name in tables if name.startswith("_legacy")}
+        connection.close()
+
+        # Opening again must not migrate a second time.
+        #
+        uut = FortranDependencies(SQLiteDatabase(filename))
+        assert uut.get_programs() == ["prog"]
+
+    def test_newer_schema(self, tmp_path: Path):
+        """
+        Ensure a database from a later version of the tools is refused
+        rather than misread.
+        """
+        filename = tmp_path / "future.db"
+        connection = sqlite3.connect(str(filename))
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+        connection.close()
+
+        with raises(DatabaseException) as caught:
+            FortranDependencies(SQLiteDatabase(filename))
+        assert "newer than this tool understands" in str(caught.value)
+
+    def test_indexed_lookups(self, tmp_path: Path):
+        """
+        Ensure removing a file and finding a unit are index seeks.
+        """
+        database = SQLiteDatabase(tmp_path / "fortran.db")
+        FortranDependencies(database)
+
+        plan = database.query(
+            """
+            EXPLAIN QUERY PLAN DELETE FROM fortran_unit_dependency
+            WHERE unit IN (
+                SELECT unit FROM fortran_program_unit WHERE file=1
+            )
+            """
+        )
+        assert all("SCAN" not in row["detail"] for row in plan)
+
+        plan = database.query(
+            "EXPLAIN QUERY PLAN SELECT prerequisite "
+            "FROM fortran_unit_dependency WHERE unit=1 AND type='compile'"
+        )
+        assert all("SCAN" not in row["detail"] for row in plan)
+
+        plan = database.query(
+            "EXPLAIN QUERY PLAN SELECT unit "
+            "FROM fortran_unit_dependency "
+            "WHERE prerequisite=1 AND type='compile'"
+        )
+        assert all("SCAN" not in row["detail"] for row in plan)
+
+
+class TestConcurrency:
+    def test_write_ahead_log(self, tmp_path: Path):
+        """
+        Ensure the database is put in a mode which lets readers carry on
+        while another process writes.
+        """
+        database = SQLiteDatabase(tmp_path / "shared.db")
+        assert database.query("PRAGMA journal_mode")[0][0] == "wal"
+
+    def test_hammer(self, tmp_path: Path):
+        """
+        Ensure many processes may create, write and read one database at
+        the same time without error or loss.
+        """
+        filename = tmp_path / "shared.db"
+        workers = 8
+        with Pool(workers) as pool:
+            counts = pool.map(
+                hammer, [(filename, worker) for worker in range(workers)]
+            )
+        assert all(count >= 25 for count in counts)
+
+        uut = FortranDependencies(SQLiteDatabase(filename))
+        assert len(uut.get_modules()) == workers * 25
+        assert uut.get_compile_prerequisites("unit_3_7") == ["unit_3_6"]
+        files = FileDependencies(SQLiteDatabase(filename))
+        assert len(list(files.get_dependencies())) == workers * 25
+
+    def test_rollback(self, tmp_path: Path):
+        """
+        Ensure a failed transaction leaves nothing behind and the lock is
+        released for others.
+        """
+        filename = tmp_path / "shared.db"
+        database = SQLiteDatabase(filename)
+        uut = FortranDependencies(database)
+        with raises(DatabaseException):
+            with database.transaction():
+                uut.add_module("alpha", Path("alpha.f90"))
+                uut.add_module("alpha", Path("beta.f90"))
+        assert uut.get_modules() == []
+
+        other = FortranDependencies(SQLiteDatabase(filename, timeout=1.0))
+        other.add_module("gamma", Path("gamma.f90"))
+        assert uut.get_modules() == [("gamma", Path("gamma.f90"))]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+from pathlib import Path
+from textwrap import dedent
+
+from dependerator.fingerprint import (
+    canonical_macros,
+    find_inclusions,
+    hash_file,
+)
+
+
+class TestFingerprint:
+    def test_hash_file(self, tmp_path: Path):
+        """
+        Content determines the hash, missing files have none.
+        """
+        first = tmp_path / "first.txt"
+        first.write_text("content")
+        second = tmp_path / "second.txt"
+        second.write_text("content")
+        assert hash_file(first) == hash_file(second)
+
+        second.write_text("changed")
+        assert hash_file(first) != hash_file(second)
+
+        assert hash_file(tmp_path / "missing.txt") == ""
+
+    def test_canonical_macros(self):
+        """
+        Definition order does not matter.
+        """
+        assert canonical_macros({"B": "1", "A": None}) == canonical_macros(
+            {"A": None, "B": "1"}
+        )
+        assert canonical_macros({"A": None}) != canonical_macros({"A": "1"})
+
+    def test_find_inclusions(self, tmp_path: Path):
+        """
+        Inclusions are followed recursively through the search path.
+        """
+        include_dir = tmp_path / "include"
+        include_dir.mkdir()
+        (include_dir / "outer.h").write_text('#include "inner.h"\n')
+        (include_dir / "inner.h").write_text("! Nothing\n")
+        (tmp_path / "local.h").write_text('# include "outer.h"\n')
+        source = tmp_path / "source.F90"
+        source.write_text(
+            dedent("""
+            #include "local.h"
+            #include <system.h>
+            #include "outer.h"
+            #include MACRO_NAME
+            """)
+        )
+
+        assert find_inclusions(source, [include_dir]) == [
+            tmp_path / "local.h",
+            include_dir / "outer.h",
+            include_dir / "inner.h",
+        ]
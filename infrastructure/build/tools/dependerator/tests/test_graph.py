@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import random
+import sys
+from typing import Dict, List, Set, Tuple
+
+from dependerator.graph import DependencyGraph
+
+
+def reference_closure(edges: List[Tuple[str, str]], unit: str) -> Set[str]:
+    """
+    Straightforward walk to check the condensed closures against.
+    """
+    successors: Dict[str, Set[str]] = {}
+    for depender, prerequisite in edges:
+        successors.setdefault(depender, set()).add(prerequisite)
+    seen: Set[str] = set()
+    pending = list(successors.get(unit, ()))
+    while pending:
+        candidate = pending.pop()
+        if candidate in seen:
+            continue
+        seen.add(candidate)
+        pending.extend(successors.get(candidate, ()))
+    seen.discard(unit)
+    return seen
+
+
+class TestDependencyGraph:
+    def test_shared(self):
+        """
+        Programs sharing a subgraph each see all of it.
+        """
+        uut = DependencyGraph(
+            [
+                ("alpha", "common"),
+                ("beta", "common"),
+                ("beta", "extra"),
+                ("common", "leaf"),
+            ]
+        )
+        assert uut.closure("alpha") == {"common", "leaf"}
+        assert uut.closure("beta") == {"common", "extra", "leaf"}
+        assert uut.closure("leaf") == set()
+        assert uut.closure("unknown") == set()
+        assert uut.prerequisites("beta") == ["common", "extra"]
+        assert uut.prerequisites("unknown") == []
+        assert "leaf" in uut
+        assert "unknown" not in uut
+
+    def test_cycle(self):
+        """
+        Members of a cycle reach each other but never themselves.
+        """
+        uut = DependencyGraph(
+            [
+                ("prog", "alpha"),
+                ("alpha", "beta"),
+                ("beta", "alpha"),
+                ("beta", "prog"),
+                ("beta", "leaf"),
+            ]
+        )
+        assert uut.closure("prog") == {"alpha", "beta", "leaf"}
+        assert uut.closure("alpha") == {"beta", "prog", "leaf"}
+        assert uut.closure("beta") == {"alpha", "prog", "leaf"}
+
+    def test_deep(self):
+        """
+        Chains deeper than the recursion limit are handled.
+        """
+        depth = sys.getrecursionlimit() * 2
+        uut = DependencyGraph(
+            [(f"unit{index}", f"unit{index + 1}") for index in range(depth)]
+        )
+        assert len(uut.closure("unit0")) == depth
+        assert uut.closure(f"unit{depth - 1}") == {f"unit{depth}"}
+
+    def test_random(self):
+        """
+        Closures agree with a naive walk over arbitrary graphs.
+        """
+        generator = random.Random(42)
+        for _ in range(20):
+            units = [f"unit{index}" for index in range(40)]
+            edges = [
+                (generator.choice(units), generator.choice(units))
+                for _ in range(60)
+            ]
+            uut = DependencyGraph(edges)
+            for unit in units:
+                assert uut.closure(unit) == reference_closure(edges, unit)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Checks the line joiner against the character-by-character state machine it
+replaced, which is kept here as a reference.
+"""
+import random
+from pathlib import Path
+from typing import Generator, List, Tuple
+
+import pytest
+
+from dependerator.analyser import lines_of_code
+
+# Root of the source tree this tool is part of.
+#
+TREE_ROOT = Path(__file__).parents[5]
+
+
+def tree_sources() -> List[Path]:
+    """
+    Gets every Fortran source file in the tree.
+    """
+    return sorted(
+        path
+        for pattern in ("*.f90", "*.F90", "*.X90", "*.x90")
+        for path in TREE_ROOT.rglob(pattern)
+    )
+
+
+def reference_lines_of_code(
+    source: str,
+) -> Generator[Tuple[str, str, int], None, None]:
+    """
+    Reads lines from the file, concatenate at continuation markers and
+    split comments off.
+
+    TODO: This is complex. That complexity comes from the need
+          to preserve comments. This is needed to support "depends on"
+          comments. Ergo, once "depends on" is gone we can ignore
+          comments and this becomes a lot simpler.
+
+    @param source: Fortran source code.
+    @return:
+    """
+    line_number = 0
+    code = ""
+    comment = ""
+    continuing = False
+    for line in source.splitlines():  # Loop over every line in the
+        # source
+        line_number += 1
+        state = "indent"  # Each line starts in the "indent" state
+        index = -1
+        code_start = 0
+        code_end = len(line)
+        comment_start = len(line)
+        continuation = False
+        for character in line:  # Scan every character in a line
+            index += 1
+            if state == "indent":
+                ##############################################
+                if character == "&":  # Start of continuation line
+                    if not continuing:
+                        message = (
+                            "Found continuation marker at "
+                            "start of line when there was none "
+                            "ending previous line"
+                        )
+                        raise Exception(message)
+                elif character == "!":  # Line contains only a comment
+                    comment_start = index
+                    state = "comment"
+                elif character != " ":  # Start of code located
+                    code_start = index
+                    state = "code"
+            elif state == "code":
+                ##############################################
+                if character == '"':  # String opened with double quote
+                    state = "double"
+                elif character == "'":  # String opened with single
+                    # quote
+                    state = "single"
+                elif character == "&":  # Line continues on next line
+                    code_end = index
+                    continuing = True
+                    continuation = True
+                    state = "continue"
+                elif character == "!":  # The remainder of the line
+                    # is a comment
+                    comment_start = index
+                    state = "comment"
+            elif state == "double":
+                ############################################
+                if character == '"':  # Quoted string has ended
+                    state = "code"
+                elif character == "&":  # Line continues on next line
+                    code_end = index
+                    continuing = True
+                    continuation = True
+                    state = "continue"
+            elif state == "single":
+                ############################################
+                if character == "'":  # Quoted string has ended
+                    state = "code"
+                elif character == "&":  # Line continues on next line
+                    code_end = index
+                    continuing = True
+                    continuation = True
+                    state = "continue"
+            elif state == "continue":
+                ##########################################
+                if character == "!":  # There is a comment after the
+                    # continuation
+                    state = "comment"
+            elif state == "comment":
+                ###########################################
+                if index - 1 < code_end:  # If we have not already
+                    # ended the code
+                    code_end = index - 1  # Mark it as ended.
+                break
+
+        code += " " + line[code_start:code_end]
+        comment += " " + line[comment_start:]
+
+        if line[code_start:code_end].strip() and not continuation:
+            yield (code, comment, line_number)
+            code = ""
+            comment = ""
+            continuing = False
+
+
+def outcome(function, source: str):
+    """
+    Gets the lines produced from source or the error raised.
+    """
+    try:
+        return list(function(source))
+    except Exception as ex:  # pylint: disable=broad-except
+        return str(ex)
+
+
+class TestLinesOfCode:
+    @pytest.mark.parametrize(
+        "source",
+        [
+            "",
+            "   \n\n  ",
+            "program foo\n  use bar\nend program foo",
+            "call thing(a, &\n           b)",
+            "call thing(a, &\n     &     b) ! Trailing comment",
+            "call thing(a, & ! Comment after marker\n b)",
+            "call log(\"Stop! \" // 'now!', &\n&LEVEL)",
+            "print *, \"Unterminated & \n   continued\"",
+            "print *, 'Unterminated\n",
+            "print *, 'Unterminated & ! Not a comment\n end'",
+            "!\n  !\nx = 1 !\n",
+            "  ! Comment\n  ! DEPENDS ON: thing\n  call thing()",
+            "x = 1 &\n   &\n   & + 2",
+            "x = 1 &\n   & ! Comment\n   + 2",
+            "\tuse tabbed_mod",
+            "!$ use omp_lib",
+            "a = '&'\nb = \"'\" ! quote",
+            "  'Leading quote! is not a string', &\n  x)",
+            "\"\n'\n&\n",
+        ],
+    )
+    def test_cases(self, source: str):
+        """
+        Awkward constructs give the same result as the reference.
+        """
+        assert outcome(lines_of_code, source) == outcome(
+            reference_lines_of_code, source
+        )
+
+    def test_bad_continuation(self):
+        """
+        A continuation with nothing to continue is an error.
+        """
+        with pytest.raises(Exception, match="continuation marker"):
+            list(lines_of_code("x = 1\n  & + 2"))
+
+    def test_random(self):
+        """
+        Random arrangements of significant characters give the same result
+        as the reference.
+        """
+        generator = random.Random(42)
+        for _ in range(2000):
+            source = "".join(
+                generator.choice("ab \"'&!\n\t")
+                for _ in range(generator.randint(0, 40))
+            )
+            assert outcome(lines_of_code, source) == outcome(
+                reference_lines_of_code, source
+            ), repr(source)
+
+    def test_tree(self):
+        """
+        Every source file in the tree gives the same result as the
+        reference.
+        """
+        sources = tree_sources()
+        assert sources
+        for source in sources:
+            text = source.read_text(errors="replace")
+            assert outcome(lines_of_code, text) == outcome(
+                reference_lines_of_code, text
+            ), source
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import json
+from pathlib import Path
+
+import pytest
+
+from dependerator.metrics import Metrics
+
+
+class TestMetrics:
+    def test_report(self):
+        """
+        Durations are summarised with a histogram and the slowest subjects.
+        """
+        uut = Metrics()
+        uut.record("scan", 0.5, Path("slow.f90"))
+        uut.record("scan", 0.005, Path("fast.f90"))
+        uut.record("scan", 20.0, Path("glacial.f90"))
+        uut.record("query", 0.00005)
+        uut.count("files analysed", 3)
+        uut.count("files analysed")
+
+        report = uut.report(slowest=2)
+        assert report["counters"] == {"files analysed": 4}
+        assert report["phases"]["query"] == {
+            "count": 1,
+            "total": 0.00005,
+            "mean": 0.00005,
+            "max": 0.00005,
+            "histogram": {"0.0001": 1, "0.001": 0, "0.01": 0, "0.1": 0,
+                          "1": 0, "10": 0, "inf": 0},
+        }
+        scan = report["phases"]["scan"]
+        assert scan["count"] == 3
+        assert scan["max"] == 20.0
+        assert scan["histogram"] == {"0.0001": 0, "0.001": 0, "0.01": 1,
+                                     "0.1": 0, "1": 1, "10": 0, "inf": 1}
+        assert scan["slowest"] == [
+            {"subject": "glacial.f90", "seconds": 20.0},
+            {"subject": "slow.f90", "seconds": 0.5},
+        ]
+
+    def test_timer(self):
+        """
+        Blocks are timed even if they fail.
+        """
+        uut = Metrics()
+        with uut.timer("work", "first"):
+            pass
+        with pytest.raises(ValueError):
+            with uut.timer("work", "second"):
+                raise ValueError("Failed")
+
+        report = uut.report()
+        assert report["phases"]["work"]["count"] == 2
+        assert sorted(
+            each["subject"] for each in report["phases"]["work"]["slowest"]
+        ) == ["first", "second"]
+
+    def test_merge(self, tmp_path: Path):
+        """
+        Metrics from elsewhere are added to those held.
+        """
+        uut = Metrics()
+        uut.record("scan", 1.0, "here.f90")
+        uut.count("files analysed")
+
+        other = Metrics()
+        other.record("scan", 2.0, "there.f90")
+        other.record("preprocess", 1.5)
+        other.count("files analysed")
+        uut.merge(json.loads(json.dumps(other.snapshot())))
+
+        uut.write(tmp_path / "metrics.json")
+        report = json.loads((tmp_path / "metrics.json").read_text())
+        assert report["counters"] == {"files analysed": 2}
+        assert report["phases"]["scan"]["total"] == 3.0
+        assert report["phases"]["scan"]["slowest"][0]["subject"] == \
+            "there.f90"
+        assert report["phases"]["preprocess"]["count"] == 1
+
+        uut.clear()
+        assert uut.report() == {"phases": {}, "counters": {}}
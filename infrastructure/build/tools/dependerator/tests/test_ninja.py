@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+from pathlib import Path
+
+import pytest
+
+from dependerator.database import FortranDependencies, SQLiteDatabase
+from dependerator.ninja import escape_path, ninja_build
+from dependerator.process import FortranProcessor
+
+
+class TestNinjaBuild:
+    @pytest.fixture
+    def processor(self, tmp_path: Path) -> FortranProcessor:
+        """
+        Creates a processor over an example dependencies database.
+        """
+        fortran_db = FortranDependencies(
+            SQLiteDatabase(tmp_path / "fortran.db")
+        )
+        fortran_db.add_program("foo", Path("foo.f90"))
+        fortran_db.add_module("bar", Path("bits/bar.F90"))
+        fortran_db.add_module("baz", Path("bits/baz.f90"))
+        fortran_db.add_procedure("qux", Path("bits/baz.f90"))
+
+        fortran_db.add_compile_dependency("foo", "bar")
+        fortran_db.add_compile_dependency("bar", "baz")
+        fortran_db.add_compile_dependency("qux", "baz")
+
+        fortran_db.add_link_dependency("foo", "bar")
+        fortran_db.add_link_dependency("bar", "baz")
+        return FortranProcessor(fortran_db, Path("."), Path("mod"))
+
+    def test_build(self, processor: FortranProcessor):
+        """
+        Ensures compile and link statements are generated.
+        """
+        content = ninja_build(
+            processor, Path("bin"), variables=[("fc", "gfortran -D$X")]
+        )
+        lines = content.splitlines()
+
+        assert "fc = gfortran -D$$X" in lines
+        assert (
+            "build bits/bar.o | mod/bar.mod: fortran_preprocess_compile "
+            "bits/bar.F90 | mod/baz.mod"
+        ) in lines
+        assert (
+            "build bits/baz.o | mod/baz.mod: fortran_compile bits/baz.f90"
+        ) in lines
+        assert (
+            "build foo.o: fortran_compile foo.f90 | mod/bar.mod"
+        ) in lines
+        assert (
+            "build bin/foo: fortran_link foo.o bits/bar.o bits/baz.o"
+        ) in lines
+        assert lines[-1] == "default bin/foo"
+
+    def test_escape_path(self):
+        """
+        Ensures characters special to Ninja are escaped in filenames.
+        """
+        assert escape_path(Path("a b/c:d$e.f90")) == "a$ b/c$:d$$e.f90"
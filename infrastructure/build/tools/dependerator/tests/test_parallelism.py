@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+from pathlib import Path
+
+import pytest
+
+from dependerator.parallelism import (
+    analyse_parallelism,
+    parse_compile_times,
+    parse_wallclock,
+)
+
+# A program using two independent chains of modules, one longer than the
+# other.
+#
+_EDGES = [
+    (Path("a_mod.f90"), Path("a_mod.o"), [Path("a_mod.mod")], []),
+    (Path("b_mod.f90"), Path("b_mod.o"), [Path("b_mod.mod")],
+     [Path("a_mod.mod")]),
+    (Path("c_mod.f90"), Path("c_mod.o"), [Path("c_mod.mod")],
+     [Path("b_mod.mod")]),
+    (Path("d_mod.f90"), Path("d_mod.o"), [Path("d_mod.mod")], []),
+    (Path("prog.f90"), Path("prog.o"), [],
+     [Path("c_mod.mod"), Path("d_mod.mod")]),
+]
+
+
+class TestParseCompileTimes:
+    def test_wallclock(self):
+        assert parse_wallclock("0:01.50") == pytest.approx(1.5)
+        assert parse_wallclock("2:03.25") == pytest.approx(123.25)
+        assert parse_wallclock("1:00:00") == pytest.approx(3600.0)
+
+    def test_log(self):
+        """
+        Ensures compile times are harvested and other lines ignored.
+        """
+        log = [
+            "12:00:00 Compile ./a_mod.f90",
+            "Compiled ./a_mod.f90: Wallclock=0:02.00, Highwater=1024KiB",
+            "12:00:02 Compiled a_mod.f90",
+            "Compiled b_mod.f90: WallcloCompiled c_mod.f90: Wallclock=",
+            "Compiled d_mod.f90: Wallclock=1:00.50, Highwater=2048KiB",
+        ]
+        assert parse_compile_times(log) == {
+            Path("a_mod.f90"): pytest.approx(2.0),
+            Path("d_mod.f90"): pytest.approx(60.5),
+        }
+
+
+class TestAnalyseParallelism:
+    def test_unweighted(self):
+        """
+        Ensures depth, width and the longest chain are found.
+        """
+        report = analyse_parallelism(_EDGES)
+
+        assert report.files == 5
+        assert report.levels == [2, 1, 1, 1]
+        assert report.work == 5.0
+        assert report.span == 4.0
+        assert report.parallelism == pytest.approx(1.25)
+        assert [step.source for step in report.critical_path] == [
+            Path("a_mod.f90"),
+            Path("b_mod.f90"),
+            Path("c_mod.f90"),
+            Path("prog.f90"),
+        ]
+        assert [step.dependants for step in report.critical_path] == [
+            3, 2, 1, 0
+        ]
+        assert report.split_candidates(1)[0].source == Path("a_mod.f90")
+
+    def test_weighted(self):
+        """
+        Ensures compile times can move the critical path.
+        """
+        times = {
+            Path("a_mod.f90"): 1.0,
+            Path("b_mod.f90"): 1.0,
+            Path("c_mod.f90"): 1.0,
+            Path("d_mod.f90"): 10.0,
+        }
+        report = analyse_parallelism(_EDGES, times)
+
+        assert report.weighting == "seconds"
+        assert report.unweighted == 1
+        assert report.work == pytest.approx(16.25)
+        assert report.span == pytest.approx(13.25)
+        assert [step.source for step in report.critical_path] == [
+            Path("d_mod.f90"),
+            Path("prog.f90"),
+        ]
+        result = report.to_dict()
+        assert result["depth"] == 4
+        assert result["critical_path"][0]["file"] == "d_mod.f90"
+        assert "Candidates for splitting:" in report.format()
+
+    def test_cycle(self):
+        """
+        Ensures files which depend on each other do not stop the analysis.
+        """
+        edges = [
+            (Path("a.f90"), Path("a.o"), [], [Path("b.o")]),
+            (Path("b.f90"), Path("b.o"), [], [Path("a.o")]),
+        ]
+        report = analyse_parallelism(edges)
+        assert report.files == 2
+        assert report.span == 2.0
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import os
+import subprocess
+from pathlib import Path
+from textwrap import dedent
+
+import pytest
+
+from dependerator.analyser import FortranScanner
+from dependerator.preprocess import (
+    BuiltinPreprocessor,
+    Preprocessor,
+    PreprocessorCache,
+    UnsupportedConstruct,
+)
+
+# Root of the source tree this tool is part of.
+#
+_TREE_ROOT = Path(__file__).parents[5]
+
+
+class TestPreprocessorCache:
+    def test_key(self, tmp_path: Path):
+        """
+        Any change of command, source or inclusion changes the key.
+        """
+        source = tmp_path / "source.F90"
+        source.write_text("content\n")
+
+        key = PreprocessorCache.key(["cpp"], source, {"a.h": "1"})
+        assert key == PreprocessorCache.key(["cpp"], source, {"a.h": "1"})
+        assert key != PreprocessorCache.key(["cpp", "-DX"], source,
+                                            {"a.h": "1"})
+        assert key != PreprocessorCache.key(["cpp"], source, {"a.h": "2"})
+
+        source.write_text("changed\n")
+        assert key != PreprocessorCache.key(["cpp"], source, {"a.h": "1"})
+
+    def test_store_fetch(self, tmp_path: Path):
+        """
+        Stored output may be fetched back.
+        """
+        uut = PreprocessorCache(tmp_path / "cache")
+        assert uut.fetch("beef") is None
+
+        uut.store("beef", "module beef\n")
+        assert uut.fetch("beef") == "module beef\n"
+
+    def test_evict(self, tmp_path: Path):
+        """
+        Least recently used entries are removed first.
+        """
+        uut = PreprocessorCache(tmp_path, size_limit=20)
+        for key in ["new", "old", "middle"]:
+            uut.store(key, "x" * 10)
+        entries = {key: tmp_path / (key + ".fpp")
+                   for key in ["new", "old", "middle"]}
+        for age, key in enumerate(["new", "middle", "old"]):
+            when = 1000 - age * 100
+            os.utime(entries[key], (when, when))
+
+        assert uut.evict() == 1
+        assert uut.fetch("old") is None
+        assert uut.fetch("middle") is not None
+        assert uut.fetch("new") is not None
+
+
+class TestPreprocessor:
+    @pytest.fixture
+    def source(self, tmp_path: Path) -> Path:
+        include_dir = tmp_path / "include"
+        include_dir.mkdir()
+        (include_dir / "value.h").write_text("#define VALUE 1\n")
+        source = tmp_path / "source.F90"
+        source.write_text(
+            dedent("""
+            #include "value.h"
+            integer :: thing = VALUE
+            #ifdef EXTRA
+            integer :: extra
+            #endif
+            """)
+        )
+        return source
+
+    def test_preprocess(self, source: Path):
+        """
+        Include paths and macros reach the preprocessor.
+        """
+        uut = Preprocessor(["cpp", "-P"], [source.parent / "include"],
+                           {"EXTRA": None})
+        text = uut.preprocess(source)
+        assert "integer :: thing = 1" in text
+        assert "integer :: extra" in text
+
+    def test_failure(self, tmp_path: Path):
+        """
+        Preprocessor failure is reported.
+        """
+        uut = Preprocessor(["cpp", "-P"])
+        with pytest.raises(subprocess.CalledProcessError):
+            uut.preprocess(tmp_path / "missing.F90")
+
+    def test_cached(self, source: Path, tmp_path: Path, monkeypatch):
+        """
+        Output is reused until an inclusion changes.
+        """
+        calls = []
+        original = subprocess.Popen
+
+        def counting_popen(command, *args, **kwargs):
+            calls.append(command)
+            return original(command, *args, **kwargs)
+
+        monkeypatch.setattr(subprocess, "Popen", counting_popen)
+
+        cache = PreprocessorCache(tmp_path / "cache")
+        uut = Preprocessor(["cpp", "-P"], [source.parent / "include"],
+                           cache=cache)
+        first = uut.preprocess(source)
+        assert uut.preprocess(source) == first
+        assert len(calls) == 1
+
+        (source.parent / "include" / "value.h").write_text(
+            "#define VALUE 2\n"
+        )
+        assert "integer :: thing = 2" in uut.preprocess(source)
+        assert len(calls) == 2
+
+    def test_cache_shared(self, source: Path, tmp_path: Path, monkeypatch):
+        """
+        A copy of the source elsewhere reuses output, whatever order the
+        arguments come in.
+        """
+        calls = []
+        original = subprocess.Popen
+
+        def counting_popen(command, *args, **kwargs):
+            calls.append(command)
+            return original(command, *args, **kwargs)
+
+        monkeypatch.setattr(subprocess, "Popen", counting_popen)
+
+        copy = tmp_path / "copy"
+        copy.mkdir()
+        (copy / "include").mkdir()
+        for filename in [source, source.parent / "include" / "value.h"]:
+            relative = filename.relative_to(source.parent)
+            (copy / relative).write_text(filename.read_text())
+
+        cache = PreprocessorCache(tmp_path / "cache")
+        first = Preprocessor(
+            ["cpp", "-I", str(source.parent / "include"), "-P"], cache=cache
+        )
+        second = Preprocessor(
+            ["cpp", "-I", str(copy / "include"), "-P"], cache=cache
+        )
+        assert first.preprocess(source) == second.preprocess(
+            copy / source.name
+        )
+        assert calls == [
+            ["cpp", "-I", str(source.parent / "include"), "-P", str(source)]
+        ]
+
+
+class TestBuiltinPreprocessor:
+    def test_conditionals(self, tmp_path: Path):
+        """
+        Nested conditionals, definitions and expressions.
+        """
+        source = tmp_path / "source.F90"
+        source.write_text(
+            dedent("""
+            #define LOCAL 3
+            #ifdef OUTER
+            use outer_mod
+            #  if (PRECISION == 32) && !defined(MISSING)
+            use single_mod
+            #  elif PRECISION == 64 || LOCAL > 4
+            use double_mod
+            #  else
+            use other_mod
+            #  endif
+            #else
+            use not_outer_mod
+            #endif
+            #ifndef LOCAL
+            use never_mod
+            #endif
+            #undef LOCAL
+            #if LOCAL /* Now undefined */
+            use never_mod
+            #endif
+            """)
+        )
+
+        uut = BuiltinPreprocessor(macros={"OUTER": None, "PRECISION": "64"})
+        assert [
+            line for line in uut.preprocess(source).splitlines() if line
+        ] == ["use outer_mod", "use double_mod"]
+
+        uut = BuiltinPreprocessor(macros={"PRECISION": "32"})
+        assert [
+            line for line in uut.preprocess(source).splitlines() if line
+        ] == ["use not_outer_mod"]
+
+    def test_inclusion(self, tmp_path: Path):
+        """
+        Inclusions are found and macros expanded in code.
+        """
+        include_dir = tmp_path / "include"
+        include_dir.mkdir()
+        (include_dir / "names.h").write_text("#define THING_MOD widget_mod\n")
+        source = tmp_path / "source.F90"
+        source.write_text(
+            dedent("""
+            #include "names.h"
+            use THING_MOD
+            """)
+        )
+
+        uut = BuiltinPreprocessor([include_dir])
+        assert "use widget_mod" in uut.preprocess(source).splitlines()
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "#define PASTE(a) a",
+            "#if defined(__GNUC__)",
+            "#if _OPENMP",
+            "#include MISSING",
+            "#include <system.h>",
+            "#pragma once",
+            "#error Broken",
+            "#if 1 ? 2 : 3",
+            "#ifdef UNTERMINATED",
+        ],
+    )
+    def test_unsupported(self, tmp_path: Path, text: str):
+        """
+        Anything outside the supported subset is refused.
+        """
+        source = tmp_path / "source.F90"
+        source.write_text(text + "\n")
+
+        uut = BuiltinPreprocessor()
+        with pytest.raises(UnsupportedConstruct):
+            uut.preprocess(source)
+
+    def test_fallback(self, tmp_path: Path):
+        """
+        Unsupported files are passed to the real preprocessor.
+        """
+        source = tmp_path / "source.F90"
+        source.write_text(
+            dedent("""
+            #define PASTE(a) a ## _mod
+            use PASTE(thing)
+            """)
+        )
+
+        uut = BuiltinPreprocessor(fallback=Preprocessor(["cpp", "-P"]))
+        assert "use thing_mod" in uut.preprocess(source)
+
+    @pytest.mark.parametrize(
+        "macros",
+        [
+            {},
+            {
+                "NO_MPI": None,
+                "LEGACY_MPI": None,
+                "MCT": None,
+                "USE_XIOS": None,
+                "VERNIER": None,
+                "UNIT_TEST": None,
+                "RDEF_PRECISION": "32",
+                "R_SOLVER_PRECISION": "32",
+                "R_TRAN_PRECISION": "128",
+                "R_BL_PRECISION": "32",
+            },
+        ],
+    )
+    def test_tree_matches_cpp(self, monkeypatch, macros):
+        """
+        Dependencies found in every preprocessed file of the tree are the
+        same whichever preprocessor is used.
+        """
+        monkeypatch.setenv("FPP", "cpp -traditional-cpp -P")
+        sources = sorted(
+            path
+            for pattern in ("*.F90", "*.X90")
+            for path in _TREE_ROOT.rglob(pattern)
+            if "system-test" not in path.parts
+        )
+        assert sources
+
+        real = FortranScanner([], macros)
+        builtin = FortranScanner([], macros, builtin_preprocessor=True)
+        for source in sources:
+            expected = real.scan(source)
+            actual = builtin.scan(source)
+            assert actual.units == expected.units, source
+            assert sorted(actual.compile_dependencies) == sorted(
+                expected.compile_dependencies
+            ), source
+            assert sorted(actual.link_dependencies) == sorted(
+                expected.link_dependencies
+            ), source
@@ -5,12 +5,14 @@
 # should have received as part of this distribution.
 ##############################################################################
 
+import logging
 from pathlib import Path
 from typing import Tuple
 
 import pytest
 
 from dependerator.database import (
+    DatabaseException,
     FileDependencies,
     FortranDependencies,
     SQLiteDatabase,
@@ -92,6 +94,214 @@ class TestFortranProcessor:
             (Path("objects/fred.o"), [Path("objects/quux.o")]),
         ]
 
+    @staticmethod
+    def _full(
+        processor: FortranProcessor,
+        file_store: FileDependencies,
+        object_modules: bool = False,
+    ):
+        """
+        Derives file dependencies from scratch for comparison.
+        """
+        file_store.remove_all_file_dependencies()
+        processor.determine_compile_file_dependencies(
+            file_store, object_modules
+        )
+        return list(file_store.get_dependencies())
+
+    def test_incremental_compile_dependencies(self, databases, caplog):
+        """
+        Ensures rederiving only what has changed gives the same result as
+        starting from scratch.
+        """
+        fortran_db, file_store = databases
+        uut = FortranProcessor(fortran_db, Path("objects"), Path("modules"))
+        uut.determine_compile_file_dependencies(file_store)
+
+        caplog.set_level(logging.INFO)
+        uut.determine_compile_file_dependencies(file_store)
+        assert "for 0 of 7 program units" in caplog.text
+
+        # A program starts using a module nothing used before.
+        #
+        fortran_db.remove_file(Path("foo.f90"))
+        fortran_db.add_program("foo", Path("foo.f90"))
+        for prerequisite in ["bar", "quux", "qux"]:
+            fortran_db.add_compile_dependency("foo", prerequisite)
+        uut.determine_compile_file_dependencies(file_store)
+        incremental = list(file_store.get_dependencies())
+        assert (
+            Path("objects/bobs/qux.o"),
+            [Path("modules/bits/baz.mod")],
+        ) in incremental
+        assert incremental == self._full(uut, file_store)
+
+        # A module moves to a different file.
+        #
+        fortran_db.remove_file(Path("bits/baz.f90"))
+        fortran_db.add_module("baz", Path("bits/new_baz.f90"))
+        uut.determine_compile_file_dependencies(file_store)
+        incremental = list(file_store.get_dependencies())
+        assert (
+            Path("objects/bits/bar.o"),
+            [Path("modules/bits/baz.mod")],
+        ) in incremental
+        assert (
+            Path("modules/bits/baz.mod"),
+            [Path("objects/bits/new_baz.o")],
+        ) in incremental
+        assert incremental == self._full(uut, file_store)
+
+        # A program goes away taking its prerequisites out of the build.
+        #
+        fortran_db.remove_file(Path("foo.f90"))
+        uut.determine_compile_file_dependencies(file_store)
+        incremental = list(file_store.get_dependencies())
+        assert Path("objects/bits/bar.o") not in dict(incremental)
+        assert incremental == self._full(uut, file_store)
+
+        # Changing settings starts again.
+        #
+        uut.determine_compile_file_dependencies(
+            file_store, object_modules=True
+        )
+        assert list(file_store.get_dependencies()) == [
+            (Path("objects/fred.o"), [Path("objects/quux.o")])
+        ]
+
+    def test_streamed_compile_dependencies(self, databases):
+        """
+        Ensures rules are returned directly and match any cached copy.
+        """
+        fortran_db, file_store = databases
+        uut = FortranProcessor(fortran_db, Path("objects"), Path("modules"))
+        streamed = uut.determine_compile_file_dependencies()
+        assert list(file_store.get_dependencies()) == []
+        assert fortran_db.get_changed_units()
+
+        cached = uut.determine_compile_file_dependencies(file_store)
+        assert cached == streamed
+        assert list(file_store.get_dependencies()) == streamed
+        assert not fortran_db.get_changed_units()
+
+    def test_compile_edges(self, databases):
+        """
+        Ensures compile dependencies may be arranged by source file.
+        """
+        fortran_db, _ = databases
+        fortran_db.add_module("plugh", Path("quux.f90"))
+        fortran_db.add_compile_dependency("quux", "plugh")
+        uut = FortranProcessor(fortran_db, Path("objects"), Path("modules"))
+
+        assert uut.determine_compile_edges() == [
+            (
+                Path("bits/bar.f90"),
+                Path("objects/bits/bar.o"),
+                [Path("modules/bar.mod")],
+                [Path("modules/baz.mod")],
+            ),
+            (
+                Path("bits/baz.f90"),
+                Path("objects/bits/baz.o"),
+                [Path("modules/baz.mod")],
+                [],
+            ),
+            (
+                Path("bobs/grault.f90"),
+                Path("objects/bobs/grault.o"),
+                [Path("modules/corge.mod")],
+                [],
+            ),
+            (
+                Path("bobs/qux.f90"),
+                Path("objects/bobs/qux.o"),
+                [Path("modules/qux.mod")],
+                [],
+            ),
+            (
+                Path("foo.f90"),
+                Path("objects/foo.o"),
+                [],
+                [Path("modules/bar.mod"), Path("objects/quux.o")],
+            ),
+            (
+                Path("fred.f90"),
+                Path("objects/fred.o"),
+                [],
+                [Path("objects/quux.o")],
+            ),
+            (
+                Path("quux.f90"),
+                Path("objects/quux.o"),
+                [Path("modules/plugh.mod")],
+                [],
+            ),
+        ]
+
+        assert [
+            source for source, _, _, _ in uut.determine_compile_edges(
+                compiled_only=True
+            )
+        ] == [
+            Path("bits/bar.f90"),
+            Path("bits/baz.f90"),
+            Path("foo.f90"),
+            Path("fred.f90"),
+            Path("quux.f90"),
+        ]
+
+        assert uut.determine_compile_edges(object_modules=True)[4] == (
+            Path("foo.f90"),
+            Path("objects/foo.o"),
+            [],
+            [Path("objects/bits/bar.o"), Path("objects/quux.o")],
+        )
+
+    def test_impact(self, databases):
+        """
+        Ensures what goes out of date when a unit changes is found.
+        """
+        fortran_db, _ = databases
+        fortran_db.add_module("bar_test", Path("bits/bar_test.f90"))
+        fortran_db.add_compile_dependency("bar_test", "bar")
+        fortran_db.add_program("unit_tests", Path("unit_tests.f90"))
+        fortran_db.add_link_dependency("unit_tests", "bar_test")
+        fortran_db.add_link_dependency("bar_test", "bar")
+        fortran_db.add_module("plugh", Path("bits/baz.f90"))
+        fortran_db.add_compile_dependency("fred", "plugh")
+        fortran_db.add_link_dependency("fred", "plugh")
+        uut = FortranProcessor(fortran_db, Path("objects"), Path("modules"))
+
+        impact = uut.determine_impact(["baz"])
+        assert impact.units == [
+            "bar", "bar_test", "baz", "corge", "foo", "fred", "plugh", "qux"
+        ]
+        assert impact.objects == [
+            Path("objects/bits/bar.o"),
+            Path("objects/bits/bar_test.o"),
+            Path("objects/bits/baz.o"),
+            Path("objects/bobs/grault.o"),
+            Path("objects/bobs/qux.o"),
+            Path("objects/foo.o"),
+            Path("objects/fred.o"),
+        ]
+        assert Path("modules/plugh.mod") in impact.modules
+        assert impact.programs == ["foo", "fred", "unit_tests"]
+        assert impact.suites == ["bar_test"]
+        assert impact.tests == ["unit_tests"]
+
+        # Files calling a procedure are compiled after it, as make does.
+        #
+        impact = uut.determine_impact(["quux"])
+        assert impact.objects == [
+            Path("objects/foo.o"),
+            Path("objects/fred.o"),
+            Path("objects/quux.o"),
+        ]
+        assert impact.modules == []
+        assert impact.programs == ["foo", "fred"]
+        assert impact.suites == impact.tests == []
+
     def test_link_dependencies_programs(self, databases):
         """
         Ensures a list of all objects per program can be fetched.
@@ -133,3 +343,32 @@ class TestFortranProcessor:
                 ],
             )
         ]
+
+    def test_link_dependencies_shared(self, databases):
+        """
+        Ensures closures for all programs agree with the per-program query.
+        """
+        fortran_db = databases[0]
+        uut = FortranProcessor(fortran_db, Path("obj"), Path("mod"))
+        for program, _, objects in uut.determine_link_dependencies():
+            expected = {
+                Path("obj") / prerequisite_file.with_suffix(".o")
+                for _, _, _, prerequisite_file in (
+                    fortran_db.get_link_dependencies(program.name)
+                )
+            }
+            assert objects == sorted(expected)
+
+    def test_link_dependencies_missing(self, databases):
+        """
+        Ensures a prerequisite absent from the database is reported.
+        """
+        fortran_db = databases[0]
+        fortran_db.add_link_dependency("qux", "garply")
+        uut = FortranProcessor(fortran_db, Path("obj"), Path("mod"))
+        with pytest.raises(DatabaseException) as caught:
+            list(uut.determine_link_dependencies("foo"))
+        assert (
+            "Program unit 'qux' requires 'garply' "
+            "but it was not found in the database"
+        ) in str(caught.value)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import gc
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from time import sleep
+
+import pytest
+
+from dependerator import database, service
+from dependerator.database import FortranDependencies, SQLiteDatabase
+from dependerator.service import (
+    DISABLE_VARIABLE,
+    TOOL_DIRECTORY,
+    DependencyService,
+    request,
+    socket_path,
+)
+
+
+class TestService:
+    @pytest.fixture
+    def running(self, tmp_path: Path, monkeypatch):
+        """
+        Runs a service for a directory holding an example database.
+        """
+        monkeypatch.setattr(database, "_retained", None)
+        monkeypatch.setattr(service, "_in_service", False)
+        monkeypatch.delenv(DISABLE_VARIABLE, raising=False)
+
+        store = FortranDependencies(SQLiteDatabase(tmp_path / "example.db"))
+        store.add_program("foo", Path("foo.f90"))
+        store.add_module("bar", Path("bar.f90"))
+        store.add_link_dependency("foo", "bar")
+        store.flush()
+        # Databases must be closed in the thread which opened them so
+        # finish with any left over before the service's thread starts.
+        #
+        del store
+        gc.collect()
+        (tmp_path / "foo.f90").write_text("program foo\nend program foo\n")
+
+        uut = DependencyService(tmp_path, idle_timeout=30,
+                                watch_interval=0.1)
+        thread = threading.Thread(target=uut.serve)
+        thread.start()
+        for _ in range(100):
+            if socket_path(tmp_path).exists():
+                break
+            sleep(0.05)
+        yield tmp_path
+        request(tmp_path, "stop")
+        thread.join()
+
+    def test_socket_path(self, tmp_path: Path, monkeypatch):
+        """
+        Each directory gets its own socket in a private directory.
+        """
+        monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+        first = socket_path(tmp_path / "first")
+        assert first == socket_path(tmp_path / "first")
+        assert first != socket_path(tmp_path / "second")
+        assert first.parent.name == f"dependerator-{os.getuid()}"
+        assert len(str(first)) < 100
+
+        monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+        assert socket_path(tmp_path / "first").parent \
+            == tmp_path / "run" / "dependerator"
+
+    def test_no_service(self, tmp_path: Path):
+        assert request(tmp_path, "status") is None
+
+    def test_untrusted_directory(self, tmp_path: Path, monkeypatch):
+        """
+        A socket directory others may write to is neither served from nor
+        connected to.
+        """
+        monkeypatch.setattr(database, "_retained", None)
+        monkeypatch.setattr(service, "_in_service", False)
+        monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+        (tmp_path / "dependerator").mkdir(mode=0o755)
+        (tmp_path / "dependerator").chmod(0o755)
+        assert request(tmp_path, "status") is None
+        with pytest.raises(RuntimeError):
+            DependencyService(tmp_path).serve()
+
+    def test_not_a_socket(self, tmp_path: Path, monkeypatch):
+        """
+        Something other than a socket in the way is taken as no service.
+        """
+        monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+        path = socket_path(tmp_path)
+        path.parent.mkdir(mode=0o700)
+        path.write_text("")
+        assert request(tmp_path, "status") is None
+
+    def test_delegate(self, running: Path):
+        """
+        A tool run in the served directory has the service do its work.
+        """
+        before = request(running, "status")
+        assert before is not None
+        assert before["directory"] == str(running.resolve())
+
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = str(TOOL_DIRECTORY)
+        result = subprocess.run(
+            [sys.executable, str(TOOL_DIRECTORY / "ProgramObjects"),
+             "-database", "example.db", "programs.mk"],
+            cwd=running, env=environment, capture_output=True, text=True,
+        )
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert "FOO_OBJS = bar.o" in (running / "programs.mk").read_text()
+
+        after = request(running, "status")
+        assert after is not None
+        assert after["requests"] == before["requests"] + 2
+
+        result = subprocess.run(
+            [sys.executable, str(TOOL_DIRECTORY / "ProgramObjects"),
+             "-database", "missing/example.db", "programs.mk"],
+            cwd=running, env=environment, capture_output=True, text=True,
+        )
+        assert result.returncode != 0
+
+    def test_watch(self, running: Path):
+        """
+        Modified source files are noticed.
+        """
+        source = running / "foo.f90"
+        os.utime(source, (1, 1))
+        for _ in range(100):
+            response = request(running, "status")
+            assert response is not None
+            if response["modified"]:
+                break
+            sleep(0.05)
+        assert response is not None
+        assert response["modified"] == [str(source.resolve())]
@@ -7,8 +7,14 @@
 Command line helper functions.
 """
 
+import os
+import shlex
+from argparse import ArgumentParser
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+from fortran_template.engine import Job
+
 
 def parse_kv(kv_list: List[str]) -> Dict[str, Optional[str]]:
     """
@@ -44,3 +50,52 @@ def set_kv(item: str) -> Tuple[str, Optional[str]]:
     if len(pair) > 1:
         value = "=".join(pair[1:])
     return key, value
+
+
+class _ManifestParser(ArgumentParser):
+    """
+    Reports problems with a manifest line as an exception rather than
+    exiting.
+    """
+
+    def error(self, message: str):
+        raise ValueError(message)
+
+
+def read_manifest(manifest: Path) -> List[Job]:
+    """
+    Read a list of template instantiations.
+
+    Each line describes one instantiation with the same arguments as a
+    single run of the tool: the template, "-o" followed by the output
+    pattern and any number of "-s" substitutions. Environment variables are
+    expanded, blank lines are ignored and "#" starts a comment.
+
+    Args:
+        manifest: File listing instantiations.
+    return:
+        Instantiations in the order listed.
+    """
+    parser = _ManifestParser(add_help=False)
+    parser.add_argument("template", type=Path)
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("-s", "--substitutions", action="append")
+
+    jobs: List[Job] = []
+    with manifest.open("rt", encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            words = shlex.split(os.path.expandvars(line), comments=True)
+            if not words:
+                continue
+            try:
+                arguments = parser.parse_args(words)
+            except ValueError as ex:
+                raise ValueError(f"{manifest}:{number}: {ex}") from ex
+            jobs.append(
+                Job(
+                    arguments.template,
+                    parse_kv(arguments.substitutions),
+                    arguments.output,
+                )
+            )
+    return jobs
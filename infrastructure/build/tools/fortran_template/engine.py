@@ -10,14 +10,168 @@ Keyed values are inserted into the template at specified locations to produce
 something a compiler can understand.
 """
 
+import os
+from dataclasses import dataclass
+from multiprocessing import Pool
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from jinja2 import BaseLoader, Environment, FileSystemLoader
+from jinja2 import (
+    BaseLoader,
+    BytecodeCache,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+)
+
+from shared.output import write_if_changed
+
+
+def bytecode_cache(cache_path: Optional[Path]) -> Optional[BytecodeCache]:
+    """
+    Gets a cache of compiled templates shared with other processes.
+
+    Args:
+        cache_path: Directory holding the cache, created if necessary.
+    return:
+        The cache or None if no directory is given.
+    """
+    if cache_path is None:
+        return None
+    cache_path.mkdir(parents=True, exist_ok=True)
+    return FileSystemBytecodeCache(str(cache_path))
+
+
+@dataclass
+class Job:
+    """
+    One instantiation of a template.
+
+    Attributes:
+        source_path: Path to template source.
+        kv_dict: Substitutions to make.
+        output_file: Pattern for output filename with template.
+    """
+
+    source_path: Path
+    kv_dict: Dict[str, Optional[str]]
+    output_file: str
+
+
+class Renderer:
+    """
+    Instantiates templates, compiling each only once.
+    """
+
+    def __init__(self, cache_path: Optional[Path] = None):
+        """
+        Args:
+            cache_path: Directory in which to keep compiled templates.
+        """
+        self.__bytecode_cache = bytecode_cache(cache_path)
+        self.__environments: Dict[Path, Environment] = {}
+        self.__file_name_environment = Environment(loader=BaseLoader())
+
+    def output_filename(self, job: Job) -> str:
+        """
+        Works out where an instantiation is written.
+
+        Args:
+            job: The instantiation.
+        return:
+            Output filename.
+        """
+        file_name_template = self.__file_name_environment.from_string(
+            job.output_file
+        )
+        return file_name_template.render(job.kv_dict)
+
+    def render(self, job: Job) -> Tuple[str, str]:
+        """
+        Instantiates a template.
+
+        Args:
+            job: What to instantiate.
+        return:
+            Output filename and content.
+        """
+        directory = job.source_path.parent
+        if directory not in self.__environments:
+            self.__environments[directory] = Environment(
+                variable_start_string="{{",
+                variable_end_string="}}",
+                loader=FileSystemLoader(directory),
+                keep_trailing_newline=True,
+                bytecode_cache=self.__bytecode_cache,
+            )
+        template = self.__environments[directory].get_template(
+            job.source_path.name
+        )
+        return self.output_filename(job), template.render(job.kv_dict)
+
+
+# Each worker process holds its own renderer, created once on start-up.
+#
+_worker_renderer: Optional[Renderer] = None
+
+
+def _initialise_worker(cache_path: Optional[Path]) -> None:
+    global _worker_renderer  # pylint: disable=global-statement
+    _worker_renderer = Renderer(cache_path)
+
+
+def _render_in_worker(job: Job) -> Tuple[str, bool]:
+    assert _worker_renderer is not None
+    filename, content = _worker_renderer.render(job)
+    return filename, write_if_changed(Path(filename), content)
+
+
+def batch(
+    jobs: Sequence[Job],
+    cache_path: Optional[Path] = None,
+    processes: int = 1,
+) -> List[str]:
+    """
+    Instantiates many templates in one go.
+
+    Output files are only written if their content changes.
+
+    Args:
+        jobs: Instantiations to perform.
+        cache_path: Directory in which to keep compiled templates.
+        processes: Number of processes to render with. Zero means one per
+            processor.
+    return:
+        Files written.
+    """
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    if processes <= 1:
+        renderer = Renderer(cache_path)
+        results = []
+        for job in jobs:
+            filename, content = renderer.render(job)
+            results.append(
+                (filename, write_if_changed(Path(filename), content))
+            )
+    else:
+        with Pool(
+            processes, initializer=_initialise_worker, initargs=(cache_path,)
+        ) as pool:
+            results = pool.map(_render_in_worker, jobs)
+
+    written = []
+    for filename, changed in results:
+        if changed:
+            print(f"... wrote {filename}")
+            written.append(filename)
+    return written
 
 
 def main(
-    source_path: Path, kv_dict: Dict[str, Optional[str]], output_file: str
+    source_path: Path,
+    kv_dict: Dict[str, Optional[str]],
+    output_file: str,
+    cache_path: Optional[Path] = None,
 ) -> None:
     """
     Main method
@@ -26,19 +180,10 @@ def main(
         source_path: String for path to template source.
         kv_dict: List of dictionaries to match and replace.
         output_file: Pattern for output filename with template.
+        cache_path: Directory in which to keep compiled templates.
     """
-    environment = Environment(
-        variable_start_string="{{",
-        variable_end_string="}}",
-        loader=FileSystemLoader(source_path.parent),
-        keep_trailing_newline=True,
-    )
-    template = environment.get_template(source_path.name)
-    file_name_template = Environment(loader=BaseLoader()).from_string(
-        output_file
-    )
-    filename = file_name_template.render(kv_dict)
-    content = template.render(kv_dict)
+    renderer = Renderer(cache_path)
+    filename, content = renderer.render(Job(source_path, kv_dict, output_file))
 
     with open(filename, mode="tw", encoding="utf-8") as message:
         message.write(content)
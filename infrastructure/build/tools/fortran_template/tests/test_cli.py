@@ -7,7 +7,9 @@
 Tests the CLI helpers.
 """
 
-from pytest import mark
+from pathlib import Path
+
+from pytest import mark, raises
 
 from .. import cli
 
@@ -60,3 +62,34 @@ def test_parse_kv_empty_list():
     """
     result = cli.parse_kv([])
     assert not result
+
+
+def test_read_manifest(tmp_path: Path, monkeypatch):
+    """
+    Ensures each line of a manifest describes one instantiation.
+    """
+    monkeypatch.setenv("SOURCE", "/source")
+    manifest = tmp_path / "templates.manifest"
+    manifest.write_text(
+        "# Comment\n"
+        "\n"
+        "$SOURCE/field.t90 -o field_{{kind}}.f90 -s type=real -s kind=real32\n"
+        "scalar.t90 --output 'scalar {{kind}}.f90'  # Trailing comment\n"
+    )
+    jobs = cli.read_manifest(manifest)
+    assert [(job.source_path, job.kv_dict, job.output_file) for job in jobs] \
+        == [
+            (Path("/source/field.t90"), {"type": "real", "kind": "real32"},
+             "field_{{kind}}.f90"),
+            (Path("scalar.t90"), {}, "scalar {{kind}}.f90"),
+        ]
+
+
+def test_read_manifest_bad(tmp_path: Path):
+    """
+    Ensures a malformed line is reported with its location.
+    """
+    manifest = tmp_path / "templates.manifest"
+    manifest.write_text("field.t90 -o field.f90\nscalar.t90\n")
+    with raises(ValueError, match="templates.manifest:2:"):
+        cli.read_manifest(manifest)
@@ -12,6 +12,8 @@ from pathlib import Path
 from textwrap import dedent
 from typing import Dict, Optional
 
+from pytest import mark
+
 from .. import engine
 
 
@@ -50,3 +52,87 @@ def test_main(tmp_path: Path):
     """)
         == generated_file.read_text()
     )
+
+
+def test_bytecode_cache(tmp_path: Path, monkeypatch):
+    """
+    Compiled templates are reused by later runs until the template changes.
+    """
+    template_file = tmp_path / "some.f90.template"
+    template_file.write_text("{{type}}({{kind}}) :: variable\n")
+    keyed_values: Dict[str, Optional[str]] = {
+        "type": "real",
+        "kind": "real64",
+    }
+    output_pattern = str(tmp_path / "some_{{kind}}.f90")
+    cache_path = tmp_path / "cache"
+    engine.main(template_file, keyed_values, output_pattern, cache_path)
+    assert list(cache_path.iterdir())
+
+    compile_template = engine.Environment.compile
+
+    def no_compile(self, source, name=None, *args, **kwargs):
+        # The output filename pattern is always compiled afresh.
+        if name is not None:
+            raise AssertionError("Template compiled again")
+        return compile_template(self, source, name, *args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(engine.Environment, "compile", no_compile)
+        engine.main(template_file, keyed_values, output_pattern, cache_path)
+    assert (tmp_path / "some_real64.f90").read_text() == (
+        "real(real64) :: variable\n"
+    )
+
+    template_file.write_text("{{type}}({{kind}}), save :: variable\n")
+    engine.main(template_file, keyed_values, output_pattern, cache_path)
+    assert (tmp_path / "some_real64.f90").read_text() == (
+        "real(real64), save :: variable\n"
+    )
+
+
+@mark.parametrize("processes", [0, 1, 2])
+def test_batch(tmp_path: Path, processes: int):
+    """
+    Many instantiations are made in one go, only changes being written.
+    """
+    template_file = tmp_path / "some.f90.template"
+    template_file.write_text("{{type}}({{kind}}) :: variable\n")
+    output_pattern = str(tmp_path / "some_{{kind}}.f90")
+    jobs = [
+        engine.Job(template_file, {"type": "real", "kind": "real32"},
+                   output_pattern),
+        engine.Job(template_file, {"type": "real", "kind": "real64"},
+                   output_pattern),
+        engine.Job(template_file, {"type": "integer", "kind": "int32"},
+                   output_pattern),
+    ]
+    written = engine.batch(jobs, processes=processes)
+    assert written == [
+        str(tmp_path / "some_real32.f90"),
+        str(tmp_path / "some_real64.f90"),
+        str(tmp_path / "some_int32.f90"),
+    ]
+    assert (tmp_path / "some_int32.f90").read_text() == (
+        "integer(int32) :: variable\n"
+    )
+
+    assert engine.batch(jobs, processes=processes) == []
+
+    jobs[1].kv_dict["type"] = "complex"
+    assert engine.batch(jobs, processes=processes) == [
+        str(tmp_path / "some_real64.f90")
+    ]
+    assert (tmp_path / "some_real64.f90").read_text() == (
+        "complex(real64) :: variable\n"
+    )
+
+
+def test_output_filename(tmp_path: Path):
+    """
+    Where an instantiation goes is known without rendering it.
+    """
+    job = engine.Job(tmp_path / "missing.template", {"kind": "real32"},
+                     str(tmp_path / "some_{{kind}}.f90"))
+    assert engine.Renderer().output_filename(job) \
+        == str(tmp_path / "some_real32.f90")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+"""
+Write generated files without disturbing the build unnecessarily.
+
+Make re-reads an included fragment, and a generated source file is compiled
+again along with everything using it, whenever its modification time
+changes. Generated files are therefore only written when their content
+differs and then atomically, so a reader never sees part of one.
+
+It is shared by all the generators: the dependency tools, configurator and
+templaterator.
+"""
+
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+
+def write_if_changed(filename: Path, content: str) -> bool:
+    """
+    Replaces a file's content, if it differs.
+
+    Files are read and written as UTF-8 whatever the locale. One which
+    cannot be read as such is taken to differ.
+
+    @param filename: File to write.
+    @param content: Text the file should hold.
+    @return: True if the file was written.
+    """
+    try:
+        if filename.read_text(encoding="utf-8") == content:
+            return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    with NamedTemporaryFile(
+        "wt",
+        encoding="utf-8",
+        dir=filename.parent,
+        prefix=f".{filename.name}.",
+        suffix=".tmp",
+        delete=False,
+    ) as temporary:
+        temporary.write(content)
+    try:
+        # Temporary files are private, the result should not be.
+        #
+        mask = os.umask(0)
+        os.umask(mask)
+        os.chmod(temporary.name, 0o666 & ~mask)
+        os.replace(temporary.name, filename)
+    except BaseException:
+        os.unlink(temporary.name)
+        raise
+    return True
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+##############################################################################
+# Copyright (c) 2017,  Met Office, on behalf of HMSO and Queen's Printer
+# For further details please refer to the file LICENCE which you
+# should have received as part of this distribution.
+##############################################################################
+import os
+from pathlib import Path
+
+from shared.output import write_if_changed
+
+
+class TestWriteIfChanged:
+    def test_write(self, tmp_path: Path):
+        """
+        New or different content is written, identical content is not.
+        """
+        target = tmp_path / "rules.mk"
+        assert write_if_changed(target, "first\n")
+        assert target.read_text() == "first\n"
+
+        os.utime(target, (0, 0))
+        assert not write_if_changed(target, "first\n")
+        assert target.stat().st_mtime == 0
+
+        assert write_if_changed(target, "second\n")
+        assert target.read_text() == "second\n"
+        assert target.stat().st_mtime != 0
+
+        assert [path.name for path in tmp_path.iterdir()] == ["rules.mk"]
+
+    def test_permissions(self, tmp_path: Path):
+        """
+        The result is not left private as temporary files are.
+        """
+        target = tmp_path / "rules.mk"
+        mask = os.umask(0o022)
+        try:
+            write_if_changed(target, "content\n")
+        finally:
+            os.umask(mask)
+        assert target.stat().st_mode & 0o777 == 0o644
+
+    def test_encoding(self, tmp_path: Path):
+        """
+        Content is UTF-8 and a file which is not is rewritten.
+        """
+        target = tmp_path / "rules.mk"
+        target.write_bytes("caf\u00e9\n".encode("latin-1"))
+        assert write_if_changed(target, "caf\u00e9\n")
+        assert target.read_bytes() == "caf\u00e9\n".encode("utf-8")
+        assert not write_if_changed(target, "caf\u00e9\n")
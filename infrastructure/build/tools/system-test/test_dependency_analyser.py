@@ -11,7 +11,7 @@ from pathlib import Path
 from subprocess import run
 from typing import List
 
-from pytest import fixture
+from pytest import fixture, mark
 
 
 class TestFortranDependencyAnalyser:
@@ -27,21 +27,27 @@ class TestFortranDependencyAnalyser:
         programs_file: Path,
         source_dir: Path,
         source_files: List[Path],
+        batch: bool,
     ):
         """
         Performs the analysis process including generating outputs.
         """
         database = tmp_path / "dependencies.db"
 
-        # Pass each source file to the DependencyAnalyser program.
+        # Pass each source file to the DependencyAnalyser program, either
+        # one at a time or all at once.
         #
-        for fobject in source_files:
+        if batch:
+            source_batches = [source_files]
+        else:
+            source_batches = [[fobject] for fobject in source_files]
+        for source_batch in source_batches:
             command = [
                 "python",
                 str(tool_dir / "DependencyAnalyser"),
                 "-verbose",
                 str(database),
-                str(fobject),
+                *[str(fobject) for fobject in source_batch],
             ]
             process = run(command, cwd=source_dir)
             assert process.returncode == 0
@@ -89,8 +95,14 @@ class TestFortranDependencyAnalyser:
     def tool_dir(self, test_dir: Path):
         return test_dir.parent
 
+    @mark.parametrize("batch", [False, True])
     def test_dependencies(
-        self, source_dir: Path, tool_dir: Path, test_dir: Path, tmp_path: Path
+        self,
+        source_dir: Path,
+        tool_dir: Path,
+        test_dir: Path,
+        tmp_path: Path,
+        batch: bool,
     ):
         """
         Checks the dependency analysis process works.
@@ -120,6 +132,7 @@ class TestFortranDependencyAnalyser:
             programs_file,
             source_dir,
             source_files,
+            batch,
         )
         assert (
             dependencies_file.read_text()
@@ -140,6 +153,7 @@ class TestFortranDependencyAnalyser:
             programs_file,
             source_dir,
             [source_files[0]],
+            batch,
         )
         assert (
             dependencies_file.read_text()
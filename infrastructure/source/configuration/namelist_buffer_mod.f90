@@ -0,0 +1,224 @@
+!-----------------------------------------------------------------------------
+! (C) Crown copyright 2024 Met Office. All rights reserved.
+! The file LICENCE, distributed with this code, contains details of the terms
+! under which the code may be used.
+!-----------------------------------------------------------------------------
+!
+!> @brief   Defines a buffer (namelist_buffer_type) in which the values of
+!>          configuration namelists are packed for broadcast.
+!> @details Rather than broadcasting each namelist, and each kind of value
+!>          within it, separately the root process packs the values of all
+!>          the namelists it reads into a single buffer of bytes. This is
+!>          broadcast in one go after which every process unpacks the values
+!>          in the order they were packed.
+!>
+!>          Values are converted to and from bytes with the "transfer"
+!>          intrinsic using byte_mold, for instance:
+!>
+!>            call buffer%append( transfer( value, byte_mold ) )
+!>            value = transfer( buffer%take( storage_size(value) / 8 ), value )
+!>
+!>          As every process runs the same executable the representation of
+!>          values is the same on all of them.
+!----------------------------------------------------------------------------
+module namelist_buffer_mod
+
+  use constants_mod, only: i_def
+  use lfric_mpi_mod, only: global_mpi
+  use log_mod,       only: log_event, log_scratch_space, LOG_LEVEL_ERROR
+
+  implicit none
+
+  private
+
+  !> Mold with which values are transferred to bytes.
+  character(len=1), public, parameter :: byte_mold(0) = [character(len=1) ::]
+
+  !> Bytes allocated when a buffer is first appended to.
+  integer(i_def), parameter :: initial_capacity = 4096
+
+  !=========================================
+  ! Buffer of packed namelist values
+  !=========================================
+  type, public :: namelist_buffer_type
+
+    private
+
+    !> Packed values, only the first "length" of which are in use.
+    character(len=1), allocatable :: bytes(:)
+
+    !> Number of bytes packed.
+    integer(i_def) :: length = 0
+
+    !> Number of bytes unpacked so far.
+    integer(i_def) :: position = 0
+
+  contains
+
+    procedure, public :: append
+    procedure, public :: take
+    procedure, public :: get_position
+    procedure, public :: set_position
+    procedure, public :: get_length
+    procedure, public :: broadcast
+    procedure, public :: clear
+
+  end type namelist_buffer_type
+
+contains
+
+  !> @brief Adds bytes to the end of the buffer.
+  !>
+  !> @param[in] bytes Packed representation of a value.
+  !>
+  subroutine append( self, bytes )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(inout) :: self
+    character(len=1),            intent(in)    :: bytes(:)
+
+    character(len=1), allocatable :: grown(:)
+    integer(i_def) :: needed
+
+    needed = self%length + size(bytes)
+
+    if (.not. allocated(self%bytes)) then
+      allocate( self%bytes(max(needed, initial_capacity)) )
+    else if (needed > size(self%bytes)) then
+      allocate( grown(max(needed, 2 * size(self%bytes))) )
+      grown(:self%length) = self%bytes(:self%length)
+      call move_alloc( grown, self%bytes )
+    end if
+
+    self%bytes(self%length + 1:needed) = bytes
+    self%length = needed
+
+  end subroutine append
+
+  !> @brief Gets the next bytes from the buffer.
+  !>
+  !> An error is reported if fewer bytes remain than are asked for.
+  !>
+  !> @param[in] count Number of bytes to take.
+  !> @return    bytes The bytes, ready to be transferred back to a value.
+  !>
+  function take( self, count ) result( bytes )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(inout) :: self
+    integer(i_def),              intent(in)    :: count
+
+    character(len=1) :: bytes(count)
+
+    if (self%position + count > self%length) then
+      write( log_scratch_space, '(A, I0, A, I0, A)' )           &
+          'Unable to take ', count, ' bytes from namelist buffer ' // &
+          'with ', self%length - self%position, ' remaining'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+
+    if (count > 0) then
+      bytes = self%bytes(self%position + 1:self%position + count)
+      self%position = self%position + count
+    end if
+
+  end function take
+
+  !> @brief Gets how far through the buffer unpacking has got.
+  !>
+  !> @return Number of bytes taken so far.
+  !>
+  function get_position( self ) result( position )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(in) :: self
+    integer(i_def) :: position
+
+    position = self%position
+
+  end function get_position
+
+  !> @brief Moves to a point in the buffer so that values may be unpacked
+  !>        again.
+  !>
+  !> @param[in] position Number of bytes to skip from the start.
+  !>
+  subroutine set_position( self, position )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(inout) :: self
+    integer(i_def),              intent(in)    :: position
+
+    if (position < 0 .or. position > self%length) then
+      write( log_scratch_space, '(A, I0, A)' ) &
+          'Position ', position, ' is outside namelist buffer'
+      call log_event( log_scratch_space, LOG_LEVEL_ERROR )
+    end if
+
+    self%position = position
+
+  end subroutine set_position
+
+  !> @brief Gets the size of the buffer's content.
+  !>
+  !> @return Number of bytes packed.
+  !>
+  function get_length( self ) result( length )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(in) :: self
+    integer(i_def) :: length
+
+    length = self%length
+
+  end function get_length
+
+  !> @brief Sends the content of the buffer from one process to all others.
+  !>
+  !> The length of the content is sent first so that other processes may
+  !> make room for it. Unpacking starts from the beginning afterwards.
+  !>
+  !> @param[in] root Process holding the packed values.
+  !>
+  subroutine broadcast( self, root )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(inout) :: self
+    integer,                     intent(in)    :: root
+
+    call global_mpi%broadcast( self%length, root )
+
+    if (global_mpi%get_comm_rank() /= root) then
+      if (allocated(self%bytes)) deallocate( self%bytes )
+      allocate( self%bytes(max(self%length, 1)) )
+    end if
+
+    if (self%length > 0) then
+      call global_mpi%broadcast( self%bytes, self%length, root )
+    end if
+
+    self%position = 0
+
+  end subroutine broadcast
+
+  !> @brief Empties the buffer.
+  !>
+  subroutine clear( self )
+
+    implicit none
+
+    class(namelist_buffer_type), intent(inout) :: self
+
+    if (allocated(self%bytes)) deallocate( self%bytes )
+    self%length   = 0
+    self%position = 0
+
+  end subroutine clear
+
+end module namelist_buffer_mod